@@ -0,0 +1,268 @@
+"""
+Admission control for the products API.
+
+Short requests are split into two classes, reads (GET, HEAD, OPTIONS) and
+writes (everything else), and each class has a Gate: at most
+ADMISSION_*_LIMIT requests of the class run at the same time and at most
+ADMISSION_*_QUEUE more wait for a slot, in arrival order. A request that
+finds the queue full, or that waited ADMISSION_QUEUE_TIMEOUT seconds
+without getting a slot, is answered 503 with a Retry-After header instead
+of piling up behind the SQLite locks until the client gives up. The
+queueing time of an admitted request is therefore bounded by
+ADMISSION_QUEUE_TIMEOUT, and its running time by the concurrency limit of
+its class.
+
+Writes get a much lower limit than reads since SQLite serialises them
+anyway; extra concurrent writers only spin in the busy handler.
+
+Uploads to /products/import and downloads of /products/export last as long
+as the client takes to send or read the body, so they would hold read and
+write slots far longer than the requests those are sized for. They pass a
+separate 'bulk' gate instead, so that a few slow transfers cannot starve
+the short requests. On Flask the slot of a streamed response is released
+when the server closes it, once the body has been sent, not when the view
+returns.
+
+/health and /metrics bypass the gates so that probes keep answering under
+overload. GET /metrics reports, per class, the slots in use, the queue
+length, admitted and rejected counts and a histogram of queueing times.
+ADMISSION_ENABLED=0 turns the whole mechanism off.
+"""
+import asyncio
+import bisect
+import collections
+import os
+import threading
+import time
+
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', '1') == '1'
+ADMISSION_READ_LIMIT = int(os.environ.get('ADMISSION_READ_LIMIT', 16))
+ADMISSION_READ_QUEUE = int(os.environ.get('ADMISSION_READ_QUEUE', 32))
+ADMISSION_WRITE_LIMIT = int(os.environ.get('ADMISSION_WRITE_LIMIT', 4))
+ADMISSION_WRITE_QUEUE = int(os.environ.get('ADMISSION_WRITE_QUEUE', 16))
+ADMISSION_BULK_LIMIT = int(os.environ.get('ADMISSION_BULK_LIMIT', 4))
+ADMISSION_BULK_QUEUE = int(os.environ.get('ADMISSION_BULK_QUEUE', 4))
+ADMISSION_QUEUE_TIMEOUT = float(
+    os.environ.get('ADMISSION_QUEUE_TIMEOUT', 0.5))
+# Seconds sent in the Retry-After header of rejected requests
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 1))
+
+READ_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+EXEMPT_PATHS = frozenset({'/health', '/metrics'})
+BULK_PATHS = frozenset({'/products/import', '/products/export'})
+
+# Upper bounds in seconds of the queueing time buckets, the last one is open
+QUEUE_BUCKETS = (0.0001, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+REJECTION = {"error": "Server overloaded, retry later"}
+
+
+class Gate:
+    """
+    Bounded concurrency with a short FIFO queue for one class of requests.
+
+    A released slot is handed directly to the oldest waiter, so a request
+    cannot be overtaken by later arrivals while it waits. Threads use
+    acquire(), coroutines acquire_async(); a gate serves one or the other.
+    """
+    def __init__(self, limit: int, queue_size: int,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiters = collections.deque()
+        self.admitted = 0
+        self.rejected = {'queue_full': 0, 'timeout': 0}
+        self.queue_seconds = 0.0
+        self.queue_max = 0.0
+        self.buckets = [0] * (len(QUEUE_BUCKETS) + 1)
+        self._lock = threading.Lock()
+
+    def _enter(self, waiter_factory):
+        """
+        Take a free slot, or queue a new waiter.
+
+        Returns:
+            True when a slot was taken, False when rejected, otherwise the
+            queued waiter.
+        """
+        with self._lock:
+            if self.active < self.limit:
+                self.active += 1
+                self._record(0.0)
+                return True
+            if len(self.waiters) >= self.queue_size:
+                self.rejected['queue_full'] += 1
+                return False
+            waiter = waiter_factory()
+            self.waiters.append(waiter)
+            return waiter
+
+    def _settle(self, waiter, start: float) -> bool:
+        """
+        Settle a waiter whose wait ended; return whether it got a slot.
+
+        release() pops a waiter when it hands it the slot, so a waiter no
+        longer queued was admitted, even if the slot came after the wait
+        timed out.
+        """
+        with self._lock:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+                self.rejected['timeout'] += 1
+                return False
+            self._record(time.monotonic() - start)
+            return True
+
+    def acquire(self) -> bool:
+        """
+        Wait for a slot in the calling thread.
+
+        Returns:
+            bool: True when admitted, in which case release() must be
+            called, False when the request must be rejected.
+        """
+        start = time.monotonic()
+        waiter = self._enter(threading.Event)
+        if isinstance(waiter, bool):
+            return waiter
+        waiter.wait(self.queue_timeout)
+        return self._settle(waiter, start)
+
+    async def acquire_async(self) -> bool:
+        """
+        Wait for a slot in the running event loop.
+
+        Returns:
+            bool: As acquire().
+        """
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        waiter = self._enter(loop.create_future)
+        if isinstance(waiter, bool):
+            return waiter
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # The client went away while waiting: pass the slot on
+            if self._settle(waiter, start):
+                self.release()
+            raise
+        return self._settle(waiter, start)
+
+    def release(self) -> None:
+        """Free a slot, handing it to the oldest waiter if any."""
+        with self._lock:
+            while self.waiters:
+                waiter = self.waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    return
+                if not waiter.done():
+                    waiter.set_result(True)
+                    return
+            self.active -= 1
+
+    def _record(self, seconds: float) -> None:
+        self.admitted += 1
+        self.queue_seconds += seconds
+        self.queue_max = max(self.queue_max, seconds)
+        self.buckets[bisect.bisect_left(QUEUE_BUCKETS, seconds)] += 1
+
+    def status(self) -> dict:
+        """
+        Report the state of the gate.
+
+        Returns:
+            dict: Limits, current load, counts and queueing time in seconds
+            with its histogram keyed by bucket bound.
+        """
+        with self._lock:
+            bounds = [str(b) for b in QUEUE_BUCKETS] + ['+Inf']
+            return {
+                'limit': self.limit,
+                'queue_size': self.queue_size,
+                'active': self.active,
+                'waiting': len(self.waiters),
+                'admitted': self.admitted,
+                'rejected': dict(self.rejected),
+                'queue_time': {
+                    'mean': (self.queue_seconds / self.admitted
+                             if self.admitted else 0.0),
+                    'max': self.queue_max,
+                    'histogram': dict(zip(bounds, self.buckets)),
+                },
+            }
+
+
+gates = {
+    'read': Gate(ADMISSION_READ_LIMIT, ADMISSION_READ_QUEUE),
+    'write': Gate(ADMISSION_WRITE_LIMIT, ADMISSION_WRITE_QUEUE),
+    'bulk': Gate(ADMISSION_BULK_LIMIT, ADMISSION_BULK_QUEUE),
+}
+
+
+def gate_for(method: str, path: str) -> Gate:
+    """
+    Pick the gate of a request.
+
+    Args:
+        method (str): HTTP method.
+        path (str): Request path.
+
+    Returns:
+        Gate: The gate to pass, or None when the request is not gated.
+    """
+    if not ADMISSION_ENABLED or path in EXEMPT_PATHS:
+        return None
+    if path in BULK_PATHS:
+        return gates['bulk']
+    return gates['read' if method in READ_METHODS else 'write']
+
+
+def metrics() -> dict:
+    return {name: gate.status() for name, gate in gates.items()}
+
+
+def install(app) -> None:
+    """
+    Gate the requests of a Flask application.
+
+    Must run before the other before_request hooks are registered, so that
+    rejected requests skip them, and its after_request hook then runs last.
+    Does nothing unless ADMISSION_ENABLED.
+    """
+    if not ADMISSION_ENABLED:
+        return
+    from flask import g, jsonify, request
+
+    @app.before_request
+    def admit():
+        gate = gate_for(request.method, request.path)
+        if gate is None:
+            return None
+        if not gate.acquire():
+            response = jsonify(REJECTION)
+            response.status_code = 503
+            response.headers['Retry-After'] = str(ADMISSION_RETRY_AFTER)
+            return response
+        g.admission_gate = gate
+        return None
+
+    @app.after_request
+    def release_on_close(response):
+        # Streamed bodies are still being sent after teardown_request
+        if response.is_streamed:
+            gate = g.pop('admission_gate', None)
+            if gate is not None:
+                response.call_on_close(gate.release)
+        return response
+
+    @app.teardown_request
+    def release(error=None):
+        gate = g.pop('admission_gate', None)
+        if gate is not None:
+            gate.release()
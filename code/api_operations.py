@@ -6,7 +6,11 @@ from utilities import (
     log_error_to_file, 
     APIClientError, 
     get_log_filename, 
-    URL)
+    URL,
+    ACCEPT_ENCODING,
+    pyarrow,
+    read_products_export)
+from client_stats import send
 
 import requests
 from requests.exceptions import RequestException
@@ -18,7 +22,8 @@ def create_product(new_product: dict) -> None:
     '''Prompts the user for product info and creates it in the API.'''
     try:
         # Enviar el producto a la API para ser creado
-        response = requests.post(f'{URL}/products', json=new_product)
+        response = send(
+            'create_product', 'post', f'{URL}/products', json=new_product)
         response.raise_for_status()
         print(f"Product '{new_product['name']}' added successfully.")
     except RequestException as e:
@@ -29,7 +34,10 @@ def create_product(new_product: dict) -> None:
 def get_products() -> list:
     '''Fetches all products from the API and prints them.'''
     try:
-        response = requests.get(f'{URL}/products')
+        # Compressed responses are decoded transparently by requests
+        response = send(
+            'get_products', 'get', f'{URL}/products',
+            headers={'Accept-Encoding': ACCEPT_ENCODING})
         response.raise_for_status()
         products = response.json()
         return products
@@ -40,12 +48,69 @@ def get_products() -> list:
             'Check the log file for details.')
         return False
 
+def load_products_frame(export_format: str = None, categories: tuple = ()):
+    '''Downloads the columnar export of all products into a DataFrame.
+
+    Without an explicit format, Arrow is asked for when pyarrow is
+    installed here, falling back to CSV when the server answers 400
+    because it has no pyarrow itself.
+    '''
+    fallback = export_format is None and pyarrow is not None
+    if export_format is None:
+        export_format = 'csv' if pyarrow is None else 'arrow'
+    try:
+        response = send(
+            'load_products_frame', 'get', f'{URL}/products/export',
+            params={'format': export_format})
+        if fallback and response.status_code == 400:
+            export_format = 'csv'
+            response = send(
+                'load_products_frame', 'get', f'{URL}/products/export',
+                params={'format': export_format})
+        response.raise_for_status()
+    except RequestException as e:
+        log_error_to_file(e)
+        print(
+            'Error exporting products from the API.'
+            'Check the log file for details.')
+        return False
+    return read_products_export(response.content, export_format, categories)
+
+def get_products_frame(export_format: str = None, categories: tuple = ()):
+    '''Fetches all products as typed columns indexed by id.
+
+    Unlike get_products(), no list of dicts is built: the export is decoded
+    straight into int64 id, float64 price and string (or categorical) text
+    columns, ready for print_data().
+    '''
+    frame = load_products_frame(export_format, categories)
+    if frame is False:
+        return False
+    frame.set_index('id', inplace=True)
+    return frame
+
+def get_product_stats() -> dict:
+    '''Fetches the precomputed catalog statistics from the API.'''
+    try:
+        response = send(
+            'get_product_stats', 'get', f'{URL}/products/stats')
+        response.raise_for_status()
+        return response.json()
+    except RequestException as e:
+        log_error_to_file(e)
+        print(
+            'Error fetching product statistics from the API.'
+            'Check the log file for details.')
+        return False
+
 def update_product(product_to_update: dict) -> None:
     '''Updates an existing product in the API.'''
     try:
-        response = requests.put(
+        response = send(
+            'update_product', 'put',
             f"{URL}/products/{product_to_update['product_id']}",
-              json=product_to_update)
+            json={field: value for field, value in product_to_update.items()
+                  if field != 'product_id'})
         response.raise_for_status()
         print(f"Product '{product_to_update['name']}' updated successfully.")
     except RequestException as e:
@@ -53,10 +118,36 @@ def update_product(product_to_update: dict) -> None:
         print('Error updating product in the API.'
               'Check the log file for details.')
 
+def patch_product(product_id: int, changes: dict, current: dict = None):
+    '''Sends only the changed fields of a product to the API.
+
+    Fields equal to those of current, when given, are left out, and no
+    request is made when nothing differs. Returns the updated product.
+    '''
+    if current is not None:
+        changes = {field: value for field, value in changes.items()
+                   if current.get(field) != value}
+    if not changes:
+        print(f'Product with ID {product_id} is already up to date.')
+        return current
+    try:
+        response = send(
+            'patch_product', 'patch', f'{URL}/products/{product_id}',
+            json=changes)
+        response.raise_for_status()
+        print(f'Product with ID {product_id} updated successfully.')
+        return response.json()
+    except RequestException as e:
+        log_error_to_file(e)
+        print('Error updating product in the API.'
+              'Check the log file for details.')
+        return False
+
 def delete_product(product_id: int) -> None:
     '''Deletes a product from the API.'''
     try:
-        response = requests.delete(f'{URL}/products/{product_id}')
+        response = send(
+            'delete_product', 'delete', f'{URL}/products/{product_id}')
         response.raise_for_status()
         print(f'Product with ID {product_id} deleted successfully.')
     except RequestException as e:
@@ -1,51 +1,169 @@
 from flask import Flask, request, jsonify
-import sqlite3
 
-app = Flask(__name__)
+import admission
+import batch
+import compression
+import export
+import import_jobs
+import maintenance
+import profiling
+import serialization
+from cache import response_cache
+from singleflight import flights
+from database import (
+    get_store, parse_product_filters, products_key, render_products,
+    validate_changes, validate_product)
 
-def get_db_connection():
-    conn = sqlite3.connect('products.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+app = Flask(__name__)
 
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({"status": "up"}), 200
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    metrics = {
+        "singleflight": flights.metrics(), "admission": admission.metrics()}
+    store = get_store()
+    if hasattr(store, 'memory_usage'):
+        metrics["hot_tier"] = store.memory_usage()
+    return jsonify(metrics)
+
+@app.route('/maintenance', methods=['GET'])
+def get_maintenance_status():
+    return jsonify(maintenance.maintainer.status())
+
 @app.route('/products', methods=['GET'])
 def get_products():
-    conn = get_db_connection()
-    products = conn.execute('SELECT * FROM products').fetchall()
-    conn.close()
-    return jsonify([dict(row) for row in products])
+    try:
+        filters = parse_product_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    encoding = compression.negotiate(request.headers.get('Accept-Encoding'))
+    body, content_encoding = response_cache.fetch(
+        products_key(filters), encoding, lambda: render_products(filters))
+    response = app.response_class(body, mimetype='application/json')
+    if content_encoding != compression.IDENTITY:
+        response.headers['Content-Encoding'] = content_encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.route('/products/<int:id>', methods=['GET'])
+def get_product(id):
+    product = get_store().fetch_product(id)
+    if product is None:
+        return jsonify({"error": "Product not found"}), 404
+    return app.response_class(
+        serialization.dumps(product), mimetype='application/json')
+
+@app.route('/products/stats', methods=['GET'])
+def get_product_stats():
+    product_stats = get_store().read_stats()
+    return app.response_class(
+        serialization.dumps(product_stats), mimetype='application/json')
+
+@app.route('/products/export', methods=['GET'])
+def export_products():
+    export_format = request.args.get('format', 'csv')
+    if export_format not in export.available_formats():
+        return jsonify({
+            "error": f"Unsupported export format: {export_format}",
+            "formats": export.available_formats()}), 400
+    response = app.response_class(
+        export.stream_export(export_format),
+        mimetype=export.MIMETYPES[export_format])
+    response.headers['Content-Disposition'] = (
+        f'attachment; filename=products.{export.EXTENSIONS[export_format]}')
+    return response
+
+@app.route('/products/import', methods=['POST'])
+def import_products():
+    try:
+        import_format = import_jobs.detect_format(
+            request.args.get('format'), request.content_type)
+        spool = import_jobs.open_spool(
+            import_format, request.args.get('upsert') == '1')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except NotImplementedError as e:
+        return jsonify({"error": str(e)}), 501
+    read = lambda: request.stream.read(import_jobs.SPOOL_CHUNK_SIZE)
+    try:
+        for chunk in iter(read, b''):
+            spool.write(chunk)
+    except Exception as e:
+        spool.abort(f'Upload failed: {e}')
+        raise
+    job = spool.finish()
+    response = jsonify(job)
+    response.status_code = 202
+    response.headers['Location'] = f"/jobs/{job['id']}"
+    return response
+
+@app.route('/jobs/<int:id>', methods=['GET'])
+def get_job(id):
+    job = import_jobs.get_job(id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
 
 @app.route('/products', methods=['POST'])
 def create_product():
-    new_product = request.get_json()
-    conn = get_db_connection()
-    conn.execute('INSERT INTO products (name, price, description) VALUES (?, ?, ?)',
-                 (new_product['name'], new_product['price'], new_product['description']))
-    conn.commit()
-    conn.close()
+    try:
+        new_product = validate_product(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    get_store().insert_product(new_product)
+    response_cache.invalidate()
     return jsonify(new_product), 201
 
 @app.route('/products/<int:id>', methods=['PUT'])
 def update_product(id):
-    updated_product = request.get_json()
-    conn = get_db_connection()
-    conn.execute('UPDATE products SET name = ?, price = ?, description = ? WHERE id = ?',
-                 (updated_product['name'], updated_product['price'], updated_product['description'], id))
-    conn.commit()
-    conn.close()
+    try:
+        updated_product = validate_product(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    get_store().update_product(id, updated_product)
+    response_cache.invalidate()
     return jsonify(updated_product)
 
+@app.route('/products/<int:id>', methods=['PATCH'])
+def patch_product(id):
+    try:
+        changes = validate_changes(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    product, changed = get_store().patch_product(id, changes)
+    if product is None:
+        return jsonify({"error": "Product not found"}), 404
+    if changed:
+        response_cache.invalidate()
+    return app.response_class(
+        serialization.dumps(product), mimetype='application/json')
+
 @app.route('/products/<int:id>', methods=['DELETE'])
 def delete_product(id):
-    conn = get_db_connection()
-    conn.execute('DELETE FROM products WHERE id = ?', (id,))
-    conn.commit()
-    conn.close()
+    get_store().delete_product(id)
+    response_cache.invalidate()
     return '', 204
 
+@app.route('/batch', methods=['POST'])
+def run_batch():
+    try:
+        operations, atomic = batch.parse_batch(request.get_json(silent=True))
+        result = batch.run_batch(get_store(), operations, atomic)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except NotImplementedError as e:
+        return jsonify({"error": str(e)}), 501
+    return app.response_class(
+        serialization.dumps(result), mimetype='application/json',
+        status=200 if result['committed'] else 409)
+
+admission.install(app)
+profiling.install(app)
+import_jobs.install(app)
+maintenance.install(app)
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,453 @@
+"""
+Asyncio-native variant of the products API defined in app.py.
+
+It serves the same URL space as the Flask application but runs under any
+ASGI server, for example: uvicorn asgi_app:app
+
+SQLite calls are blocking, so they are handed to a bounded thread pool and
+the event loop only parses requests and writes responses. Idle keep-alive
+connections therefore cost a coroutine instead of a whole WSGI thread.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
+
+import admission
+import batch
+import compression
+import database
+import export
+import import_jobs
+import maintenance
+import serialization
+from cache import response_cache
+from singleflight import flights
+
+# Number of threads allowed to talk to SQLite at the same time
+DB_WORKERS = int(os.environ.get('DB_WORKERS', 8))
+
+executor = ThreadPoolExecutor(
+    max_workers=DB_WORKERS, thread_name_prefix='sqlite')
+
+
+class HTTPError(Exception):
+    """
+    Error that is turned into a JSON error response.
+    """
+    def __init__(self, status: int, message: str, headers: list = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or []
+
+
+def json_body(data, status: int = 200) -> tuple:
+    """
+    Build a JSON response.
+
+    Args:
+        data: JSON serializable object.
+        status (int): HTTP status code.
+
+    Returns:
+        tuple: Status code, header list and encoded body.
+    """
+    headers = [(b'content-type', b'application/json')]
+    return status, headers, serialization.dumps(data)
+
+
+def header(scope, name: bytes) -> str:
+    """
+    Read a request header.
+
+    Args:
+        scope (dict): ASGI connection scope.
+        name (bytes): Lower-case header name.
+
+    Returns:
+        str: The header value, or an empty string when absent.
+    """
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return ''
+
+
+def query_param(scope, name: str, default: str = None) -> str:
+    """
+    Read a query string parameter.
+
+    Args:
+        scope (dict): ASGI connection scope.
+        name (str): Parameter name.
+        default (str): Value returned when the parameter is absent.
+
+    Returns:
+        str: The first value of the parameter.
+    """
+    return query_params(scope).get(name, default)
+
+
+def query_params(scope) -> dict:
+    """Return the first value of every query string parameter."""
+    values = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    return {name: value[0] for name, value in values.items()}
+
+
+async def run_db(method: str, *args):
+    """
+    Call a product store method in the SQLite thread pool.
+
+    Args:
+        method (str): Name of the database.get_store() method.
+        *args: Positional arguments passed to the method.
+
+    Returns:
+        The value returned by the method.
+    """
+    loop = asyncio.get_running_loop()
+    method = getattr(database.get_store(), method)
+    return await loop.run_in_executor(executor, method, *args)
+
+
+async def read_json(receive):
+    """
+    Read the whole request body and decode it as JSON.
+
+    Args:
+        receive (callable): ASGI receive channel.
+
+    Returns:
+        The decoded JSON document.
+
+    Raises:
+        HTTPError: If the body is not valid JSON.
+    """
+    chunks = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        more_body = message.get('more_body', False)
+    try:
+        return json.loads(b''.join(chunks))
+    except ValueError:
+        raise HTTPError(400, 'Failed to decode JSON object')
+
+
+async def health_check(scope, receive):
+    return json_body({"status": "up"})
+
+
+async def get_metrics(scope, receive):
+    metrics = {
+        "singleflight": flights.metrics(), "admission": admission.metrics()}
+    store = database.get_store()
+    if hasattr(store, 'memory_usage'):
+        metrics["hot_tier"] = await run_db('memory_usage')
+    return json_body(metrics)
+
+
+async def get_maintenance_status(scope, receive):
+    loop = asyncio.get_running_loop()
+    status = await loop.run_in_executor(
+        executor, maintenance.maintainer.status)
+    return json_body(status)
+
+
+async def get_products(scope, receive):
+    try:
+        filters = database.parse_product_filters(query_params(scope))
+    except ValueError as e:
+        raise HTTPError(400, str(e))
+    key = database.products_key(filters)
+    encoding = compression.negotiate(header(scope, b'accept-encoding'))
+    cached = response_cache.get(key, encoding)
+    if cached is None:
+        loop = asyncio.get_running_loop()
+        cached = await flights.do_async(
+            (response_cache.generation, key, encoding),
+            lambda: loop.run_in_executor(
+                executor, response_cache.fetch, key, encoding,
+                lambda: database.render_products(filters), False))
+    body, content_encoding = cached
+    headers = [(b'content-type', b'application/json'),
+               (b'vary', b'Accept-Encoding')]
+    if content_encoding != compression.IDENTITY:
+        headers.append((b'content-encoding', content_encoding.encode()))
+    return 200, headers, body
+
+
+async def get_product(scope, receive, id):
+    product = await run_db('fetch_product', id)
+    if product is None:
+        raise HTTPError(404, 'Product not found')
+    return json_body(product)
+
+
+async def get_product_stats(scope, receive):
+    product_stats = await run_db('read_stats')
+    return json_body(product_stats)
+
+
+async def export_products(scope, receive):
+    export_format = query_param(scope, 'format', 'csv')
+    if export_format not in export.available_formats():
+        return json_body({
+            "error": f"Unsupported export format: {export_format}",
+            "formats": export.available_formats()}, 400)
+    extension = export.EXTENSIONS[export_format]
+    headers = [
+        (b'content-type', export.MIMETYPES[export_format].encode()),
+        (b'content-disposition',
+         f'attachment; filename=products.{extension}'.encode())]
+    return 200, headers, export.stream_export(export_format)
+
+
+async def import_products(scope, receive):
+    loop = asyncio.get_running_loop()
+    params = query_params(scope)
+    try:
+        import_format = import_jobs.detect_format(
+            params.get('format'), header(scope, b'content-type'))
+        spool = await loop.run_in_executor(
+            executor, import_jobs.open_spool, import_format,
+            params.get('upsert') == '1')
+    except ValueError as e:
+        raise HTTPError(400, str(e))
+    except NotImplementedError as e:
+        raise HTTPError(501, str(e))
+    try:
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                raise ConnectionError('client disconnected')
+            chunk = message.get('body', b'')
+            if chunk:
+                await loop.run_in_executor(executor, spool.write, chunk)
+            more_body = message.get('more_body', False)
+    except BaseException as e:
+        await loop.run_in_executor(
+            executor, spool.abort, f'Upload failed: {e!r}')
+        raise
+    job = await loop.run_in_executor(executor, spool.finish)
+    status, headers, body = json_body(job, 202)
+    location = f"/jobs/{job['id']}".encode()
+    return status, headers + [(b'location', location)], body
+
+
+async def get_job(scope, receive, id):
+    loop = asyncio.get_running_loop()
+    job = await loop.run_in_executor(executor, import_jobs.get_job, id)
+    if job is None:
+        raise HTTPError(404, 'Job not found')
+    return json_body(job)
+
+
+async def create_product(scope, receive):
+    try:
+        new_product = database.validate_product(await read_json(receive))
+    except ValueError as e:
+        raise HTTPError(400, str(e))
+    await run_db('insert_product', new_product)
+    response_cache.invalidate()
+    return json_body(new_product, 201)
+
+
+async def update_product(scope, receive, id):
+    try:
+        updated_product = database.validate_product(
+            await read_json(receive))
+    except ValueError as e:
+        raise HTTPError(400, str(e))
+    await run_db('update_product', id, updated_product)
+    response_cache.invalidate()
+    return json_body(updated_product)
+
+
+async def patch_product(scope, receive, id):
+    try:
+        changes = database.validate_changes(await read_json(receive))
+    except ValueError as e:
+        raise HTTPError(400, str(e))
+    product, changed = await run_db('patch_product', id, changes)
+    if product is None:
+        raise HTTPError(404, 'Product not found')
+    if changed:
+        response_cache.invalidate()
+    return json_body(product)
+
+
+async def delete_product(scope, receive, id):
+    await run_db('delete_product', id)
+    response_cache.invalidate()
+    return 204, [], b''
+
+
+async def run_batch(scope, receive):
+    try:
+        operations, atomic = batch.parse_batch(await read_json(receive))
+    except ValueError as e:
+        raise HTTPError(400, str(e))
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(
+            executor, batch.run_batch, database.get_store(), operations,
+            atomic)
+    except NotImplementedError as e:
+        raise HTTPError(501, str(e))
+    return json_body(result, 200 if result['committed'] else 409)
+
+
+# (path pattern, {method: handler}); captured groups are passed as ints
+ROUTES = [
+    (re.compile(r'^/health$'), {'GET': health_check}),
+    (re.compile(r'^/metrics$'), {'GET': get_metrics}),
+    (re.compile(r'^/maintenance$'), {'GET': get_maintenance_status}),
+    (re.compile(r'^/products$'),
+     {'GET': get_products, 'POST': create_product}),
+    (re.compile(r'^/products/stats$'), {'GET': get_product_stats}),
+    (re.compile(r'^/products/export$'), {'GET': export_products}),
+    (re.compile(r'^/products/import$'), {'POST': import_products}),
+    (re.compile(r'^/jobs/(\d+)$'), {'GET': get_job}),
+    (re.compile(r'^/batch$'), {'POST': run_batch}),
+    (re.compile(r'^/products/(\d+)$'),
+     {'GET': get_product, 'PUT': update_product, 'PATCH': patch_product,
+      'DELETE': delete_product}),
+]
+
+
+def resolve(method: str, path: str):
+    """
+    Find the handler for a request.
+
+    Args:
+        method (str): HTTP method.
+        path (str): Request path.
+
+    Returns:
+        tuple: The handler and the integer path arguments.
+
+    Raises:
+        HTTPError: 404 for unknown paths, 405 for unsupported methods.
+    """
+    for pattern, handlers in ROUTES:
+        match = pattern.match(path)
+        if not match:
+            continue
+        if method not in handlers:
+            allow = ', '.join(sorted(handlers)).encode()
+            raise HTTPError(405, 'Method not allowed', [(b'allow', allow)])
+        return handlers[method], [int(group) for group in match.groups()]
+    raise HTTPError(404, 'Not found')
+
+
+async def lifespan(receive, send):
+    """
+    Handle the ASGI lifespan protocol: start the import worker and the
+    maintenance thread when enabled, and stop maintenance and the pool on
+    exit.
+    """
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if maintenance.MAINTENANCE_ENABLED:
+                maintenance.maintainer.start()
+            import_jobs.worker.start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            maintenance.maintainer.stop()
+            executor.shutdown(wait=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def send_stream(send, chunks) -> None:
+    """
+    Send a response body produced by a blocking iterator.
+
+    Args:
+        send (callable): ASGI send channel.
+        chunks (iterator): Iterator of bytes, advanced in the thread pool.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            chunk = await loop.run_in_executor(executor, next, chunks, None)
+            if chunk is None:
+                break
+            await send({
+                'type': 'http.response.body', 'body': chunk,
+                'more_body': True})
+    finally:
+        await loop.run_in_executor(executor, chunks.close)
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def app(scope, receive, send):
+    """ASGI entry point."""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    gate = admission.gate_for(scope['method'], scope['path'])
+    if gate is not None and not await gate.acquire_async():
+        status, headers, body = json_body(admission.REJECTION, 503)
+        headers = headers + [
+            (b'retry-after', str(admission.ADMISSION_RETRY_AFTER).encode()),
+            (b'content-length', str(len(body)).encode())]
+        await send({
+            'type': 'http.response.start', 'status': status,
+            'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+        return
+    try:
+        if not maintenance.MAINTENANCE_ENABLED:
+            await handle(scope, receive, send)
+            return
+        maintenance.maintainer.request_started()
+        try:
+            await handle(scope, receive, send)
+        finally:
+            maintenance.maintainer.request_finished()
+    finally:
+        if gate is not None:
+            gate.release()
+
+
+async def handle(scope, receive, send):
+    """Answer an HTTP request."""
+    try:
+        handler, args = resolve(scope['method'], scope['path'])
+        status, headers, body = await handler(scope, receive, *args)
+    except HTTPError as e:
+        status, headers, body = json_body({'error': e.message}, e.status)
+        headers = headers + e.headers
+    except Exception:
+        logging.exception('Unhandled error in %s %s',
+                          scope['method'], scope['path'])
+        status, headers, body = json_body(
+            {'error': 'Internal server error'}, 500)
+
+    if not isinstance(body, bytes):
+        await send({
+            'type': 'http.response.start', 'status': status,
+            'headers': headers})
+        await send_stream(send, body)
+        return
+
+    headers = headers + [(b'content-length', str(len(body)).encode())]
+    await send({
+        'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='127.0.0.1', port=5000)
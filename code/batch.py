@@ -0,0 +1,254 @@
+"""
+POST /batch: several product operations in one round trip.
+
+The body lists sub-operations, run in order:
+
+    {"atomic": true,
+     "operations": [
+         {"method": "POST", "path": "/products", "body": {...}},
+         {"method": "GET", "path": "/products/3"},
+         {"method": "PUT", "path": "/products/1", "body": {...}},
+         {"method": "PATCH", "path": "/products/2", "body": {"price": 9.5}},
+         {"method": "DELETE", "path": "/products/4"}]}
+
+and the response holds one {"status", "body"} result per operation. The
+statuses are those of the matching routes, except that PUT and DELETE of a
+missing product answer 404 and that POST validates the product and returns
+it with its new id.
+
+Atomic batches (the default) run in a single SQLite transaction: the first
+operation answering 400 or more rolls everything back, the batch answers
+409, and every other operation reports 424. With "atomic": false every
+operation stands on its own, but on the unsharded database they still share
+one connection and one commit. Atomic batches need the unsharded database
+(501 otherwise); with the hot tier, the rows they commit are then applied
+to its columns.
+"""
+import logging
+import os
+import re
+import sqlite3
+
+import database
+from cache import response_cache
+
+BATCH_MAX_OPERATIONS = int(os.environ.get('BATCH_MAX_OPERATIONS', 100))
+
+PRODUCT_PATH = re.compile(r'^/products(?:/(\d+))?$')
+
+
+def parse_batch(body) -> tuple:
+    """
+    Check the body of a batch request.
+
+    Args:
+        body: Decoded JSON body.
+
+    Returns:
+        tuple: The list of operations and whether the batch is atomic.
+
+    Raises:
+        ValueError: If the envelope or one of the operations is malformed,
+            or if there are more than BATCH_MAX_OPERATIONS operations.
+    """
+    if not isinstance(body, dict):
+        raise ValueError('Body must be a JSON object')
+    operations = body.get('operations')
+    if not isinstance(operations, list) or not operations:
+        raise ValueError('operations must be a non-empty list')
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        raise ValueError(
+            f'At most {BATCH_MAX_OPERATIONS} operations per batch')
+    atomic = body.get('atomic', True)
+    if not isinstance(atomic, bool):
+        raise ValueError('atomic must be true or false')
+    for index, operation in enumerate(operations):
+        if (not isinstance(operation, dict)
+                or not isinstance(operation.get('method'), str)
+                or not isinstance(operation.get('path'), str)):
+            raise ValueError(
+                f'Operation {index} must be an object with method and path')
+    return operations, atomic
+
+
+class Transaction:
+    """
+    Store methods on one connection, leaving the commit to the caller.
+
+    The rows written are kept in changes, as (id, product or None when
+    deleted) pairs, for hot_tier.HotTierStore.apply().
+    """
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.changes = []
+
+    def fetch_product(self, product_id: int) -> dict:
+        return database.fetch_product(self.conn, product_id)
+
+    def insert_product(self, product: dict) -> int:
+        product_id = database.insert_product(
+            self.conn, product, commit=False)
+        self.changes.append((product_id, self.fetch_product(product_id)))
+        return product_id
+
+    def update_product(self, product_id: int, product: dict) -> bool:
+        found = database.update_product(
+            self.conn, product_id, product, commit=False)
+        if found:
+            self.changes.append(
+                (product_id, self.fetch_product(product_id)))
+        return found
+
+    def patch_product(self, product_id: int, changes: dict) -> tuple:
+        product, changed = database.patch_product(
+            self.conn, product_id, changes, commit=False)
+        if changed:
+            self.changes.append((product_id, product))
+        return product, changed
+
+    def delete_product(self, product_id: int) -> bool:
+        found = database.delete_product(
+            self.conn, product_id, commit=False)
+        if found:
+            self.changes.append((product_id, None))
+        return found
+
+
+def execute(target, operation: dict) -> tuple:
+    """
+    Run one sub-operation.
+
+    Args:
+        target: Transaction or product store.
+        operation (dict): Method, path and optional body.
+
+    Returns:
+        tuple: Status code, response body and whether a row was written.
+    """
+    method = operation['method'].upper()
+    match = PRODUCT_PATH.match(operation['path'])
+    if match is None:
+        return 404, {"error": "Not found"}, False
+    body = operation.get('body')
+    try:
+        if match.group(1) is None:
+            if method != 'POST':
+                return 405, {"error": "Method not allowed"}, False
+            product = database.validate_product(body)
+            product_id = target.insert_product(product)
+            return 201, dict(product, id=product_id), True
+        product_id = int(match.group(1))
+        if method == 'GET':
+            product = target.fetch_product(product_id)
+            if product is None:
+                return 404, {"error": "Product not found"}, False
+            return 200, product, False
+        if method == 'PUT':
+            product = database.validate_product(body)
+            if not target.update_product(product_id, product):
+                return 404, {"error": "Product not found"}, False
+            return 200, product, True
+        if method == 'PATCH':
+            changes = database.validate_changes(body)
+            product, changed = target.patch_product(product_id, changes)
+            if product is None:
+                return 404, {"error": "Product not found"}, False
+            return 200, product, changed
+        if method == 'DELETE':
+            if not target.delete_product(product_id):
+                return 404, {"error": "Product not found"}, False
+            return 204, None, True
+    except ValueError as e:
+        return 400, {"error": str(e)}, False
+    except sqlite3.Error:
+        logging.exception('Batch operation %s %s failed',
+                          method, operation['path'])
+        return 500, {"error": "Internal server error"}, False
+    return 405, {"error": "Method not allowed"}, False
+
+
+def run_operations(target, operations: list, atomic: bool) -> tuple:
+    """
+    Run the sub-operations in order, stopping at the first failure of an
+    atomic batch.
+
+    Returns:
+        tuple: The results, the index of the failed operation (None when
+        none failed or the batch is not atomic) and whether a row was
+        written.
+    """
+    results = []
+    written = False
+    for index, operation in enumerate(operations):
+        status, body, wrote = execute(target, operation)
+        results.append({"status": status, "body": body})
+        written = written or wrote
+        if atomic and status >= 400:
+            return results, index, written
+    return results, None, written
+
+
+def rolled_back(results: list, operations: list, failed: int) -> list:
+    """Replace every result but the failed one with a 424."""
+    error = {"error": f"Not applied: operation {failed} failed"}
+    return [results[failed] if index == failed
+            else {"status": 424, "body": error}
+            for index in range(len(operations))]
+
+
+def run_transaction(store, operations: list, atomic: bool) -> tuple:
+    """
+    Run the sub-operations in one transaction of an SQLiteStore.
+
+    Returns:
+        tuple: The results of run_operations(), with the 424 results of a
+        rolled back batch, and the rows committed.
+    """
+    conn = store.connect()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        transaction = Transaction(conn)
+        results, failed, written = run_operations(
+            transaction, operations, atomic)
+        if failed is None:
+            conn.commit()
+            return (results, failed, written), transaction.changes
+        conn.rollback()
+    finally:
+        database.close_connection(conn)
+    return (rolled_back(results, operations, failed), failed, False), []
+
+
+def run_batch(store, operations: list, atomic: bool = True) -> dict:
+    """
+    Run a batch against a product store.
+
+    Args:
+        store: Object returned by database.get_store().
+        operations (list): Operations checked by parse_batch().
+        atomic (bool): Run all operations in one transaction.
+
+    Returns:
+        dict: Whether the batch was atomic and committed, and the per
+        operation results.
+
+    Raises:
+        NotImplementedError: For an atomic batch on sharded storage.
+    """
+    backing = getattr(store, 'backing', store)
+    if not isinstance(backing, database.SQLiteStore):
+        if atomic:
+            raise NotImplementedError(
+                'Atomic batches need the unsharded database')
+        results, failed, written = run_operations(store, operations, False)
+    elif backing is not store:
+        # The hot tier takes the committed rows instead of a reload
+        results, failed, written = store.apply(
+            lambda: run_transaction(backing, operations, atomic))
+    else:
+        (results, failed, written), _ = run_transaction(
+            backing, operations, atomic)
+    if written:
+        response_cache.invalidate()
+    return {"atomic": atomic, "committed": failed is None,
+            "results": results}
@@ -0,0 +1,149 @@
+"""
+Client-side batching of product calls over POST /batch.
+
+Calls made through a Batcher are buffered and sent together once
+max_size of them are pending or max_delay seconds after the first one,
+whichever comes first, so that many small calls over a slow link cost a
+few round trips. Each call returns a concurrent.futures.Future resolved
+with its BatchResult (status and body) when its batch comes back:
+
+    with Batcher() as batcher:
+        created = batcher.create(product)
+        updates = [batcher.patch(id, changes) for id, changes in edits]
+    print(created.result().body['id'])
+
+Batches are sent one at a time, in submission order. They are not atomic
+unless atomic=True is given, in which case a batch boundary falls wherever
+max_size or max_delay puts it; call flush() to end a group of dependent
+calls explicitly.
+"""
+import os
+import threading
+from concurrent.futures import Future
+from typing import NamedTuple
+
+from requests.exceptions import RequestException
+
+from client_stats import send
+from utilities import URL, APIClientError
+
+CLIENT_BATCH_SIZE = int(os.environ.get('CLIENT_BATCH_SIZE', 50))
+CLIENT_BATCH_DELAY = float(os.environ.get('CLIENT_BATCH_DELAY', 0.05))
+# Largest batch the server accepts, its BATCH_MAX_OPERATIONS
+SERVER_BATCH_LIMIT = int(os.environ.get('SERVER_BATCH_LIMIT', 100))
+
+
+class BatchResult(NamedTuple):
+    """
+    Outcome of one batched call.
+    """
+    status: int
+    body: object
+
+
+class Batcher:
+    """
+    Buffer of product calls flushed to POST /batch by size or time.
+    """
+    def __init__(self, max_size: int = CLIENT_BATCH_SIZE,
+                 max_delay: float = CLIENT_BATCH_DELAY,
+                 atomic: bool = False, url: str = URL):
+        self.max_size = min(max_size, SERVER_BATCH_LIMIT)
+        self.max_delay = max_delay
+        self.atomic = atomic
+        self.url = url
+        self.pending = []
+        self._timer = None
+        self._lock = threading.Lock()
+        # Held while a batch is in flight, so batches keep their order
+        self._send_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+    def submit(self, method: str, path: str, body=None) -> Future:
+        """
+        Queue a call.
+
+        Args:
+            method (str): HTTP method of the call.
+            path (str): Path of the call, e.g. '/products/3'.
+            body: JSON body of the call, if any.
+
+        Returns:
+            Future: Resolved with a BatchResult, or with APIClientError or
+            the RequestException when the batch itself failed.
+        """
+        operation = {"method": method, "path": path}
+        if body is not None:
+            operation["body"] = body
+        future = Future()
+        with self._lock:
+            self.pending.append((operation, future))
+            full = len(self.pending) >= self.max_size
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.max_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+        return future
+
+    def create(self, product: dict) -> Future:
+        return self.submit('POST', '/products', product)
+
+    def get(self, product_id: int) -> Future:
+        return self.submit('GET', f'/products/{product_id}')
+
+    def update(self, product_id: int, product: dict) -> Future:
+        return self.submit('PUT', f'/products/{product_id}', product)
+
+    def patch(self, product_id: int, changes: dict) -> Future:
+        return self.submit('PATCH', f'/products/{product_id}', changes)
+
+    def delete(self, product_id: int) -> Future:
+        return self.submit('DELETE', f'/products/{product_id}')
+
+    def flush(self) -> None:
+        """
+        Send every pending call, in batches of at most max_size, and wait
+        for the results.
+        """
+        with self._send_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                pending, self.pending = self.pending, []
+            for start in range(0, len(pending), self.max_size):
+                self._send(pending[start:start + self.max_size])
+
+    def _send(self, pending: list) -> None:
+        futures = [future for _, future in pending]
+        try:
+            response = send(
+                'batch', 'post', f'{self.url}/batch',
+                json={"atomic": self.atomic,
+                      "operations": [op for op, _ in pending]})
+            if response.status_code not in (200, 409):
+                raise APIClientError(
+                    f'Batch failed with status {response.status_code}: '
+                    f'{response.text}')
+            results = [BatchResult(result['status'], result['body'])
+                       for result in response.json()['results']]
+            if len(results) != len(pending):
+                raise APIClientError(
+                    f'Batch returned {len(results)} results '
+                    f'for {len(pending)} calls')
+        except (RequestException, APIClientError, ValueError, KeyError,
+                TypeError) as e:
+            # Also reached for a body that is not the expected JSON; the
+            # futures are the only way the error reaches the callers
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future, result in zip(futures, results):
+            future.set_result(result)
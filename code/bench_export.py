@@ -0,0 +1,90 @@
+"""
+Benchmark of loading the full catalog into a DataFrame.
+
+Compares the JSON path (GET /products, json decode, DataFrame from a list
+of dicts) with GET /products/export in each available format, measuring
+server encoding plus client decoding, the payload size and the peak Python
+memory. Run from the code directory: python bench_export.py --rows 1000000
+"""
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+import database
+import export
+import serialization
+from utilities import read_products_export
+
+
+def build_database(path: str, rows: int) -> None:
+    """Create a products database holding the given number of rows."""
+    conn = sqlite3.connect(path)
+    database.init_db(conn)
+    conn.executemany(
+        'INSERT INTO products (name, price, description) VALUES (?, ?, ?)',
+        ((f'Product {i}', i * 1.25, f'Description of product number {i}')
+         for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def json_path() -> tuple:
+    keys, rows = database.get_store().fetch_products()
+    body = serialization.encode_rows(keys, rows)
+    del keys, rows
+    return pd.DataFrame(json.loads(body)), len(body)
+
+
+def export_path(export_format: str):
+    def load() -> tuple:
+        body = b''.join(export.stream_export(export_format))
+        return read_products_export(body, export_format), len(body)
+    return load
+
+
+def measure(load, memory: bool) -> tuple:
+    """Return the duration, payload size and Python peak memory of a load."""
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    frame, size = load()
+    seconds = time.perf_counter() - start
+    peak = 0
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    del frame
+    return seconds, size, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--memory', action='store_true',
+                        help='Also report peak Python memory (slower)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database.DATABASE = os.path.join(directory, 'products.db')
+        build_database(database.DATABASE, args.rows)
+        paths = [('json', json_path)] + [
+            (name, export_path(name)) for name in export.available_formats()]
+        baseline = None
+        for label, load in paths:
+            seconds, size, peak = measure(load, args.memory)
+            baseline = baseline or seconds
+            line = (f'{label:<8} {seconds:8.2f} s ({baseline / seconds:.1f}x)'
+                    f' {size / 2 ** 20:9.1f} MiB payload')
+            if args.memory:
+                line += f' {peak / 2 ** 20:9.1f} MiB peak'
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
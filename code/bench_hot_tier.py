@@ -0,0 +1,70 @@
+"""
+Benchmark of the in-memory hot tier against dict rows and SQLite.
+
+Measures the Python memory held by the catalog as a list of dicts and as
+hot tier columns, and the time of a price filter served by SQLite and by
+the hot tier. Run from the code directory: python bench_hot_tier.py
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import database
+from bench_export import build_database
+from hot_tier import HotTierStore
+
+
+def traced(load) -> tuple:
+    """Return the result of a load and the Python memory it still holds."""
+    tracemalloc.start()
+    result = load()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def timed(query, repeat: int) -> float:
+    """Return the mean duration of a query."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        query()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'products.db')
+        build_database(path, args.rows)
+        sqlite_store = database.SQLiteStore(path)
+
+        def load_dicts():
+            keys, rows = sqlite_store.fetch_products()
+            return [dict(zip(keys, row)) for row in rows]
+
+        def load_hot_tier():
+            store = HotTierStore(sqlite_store)
+            store.load()
+            return store
+
+        dicts, dict_size = traced(load_dicts)
+        del dicts
+        hot_store, hot_size = traced(load_hot_tier)
+        print(f'dict rows {dict_size / 2 ** 20:9.1f} MiB')
+        print(f'hot tier  {hot_size / 2 ** 20:9.1f} MiB '
+              f'({hot_size / dict_size:.0%})')
+
+        filters = {'min_price': args.rows * 0.5, 'max_price': args.rows * 0.6}
+        for label, store in (('sqlite', sqlite_store), ('hot tier', hot_store)):
+            seconds = timed(lambda: store.filter_products(filters), args.repeat)
+            print(f'{label:<9} price filter {seconds * 1000:9.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
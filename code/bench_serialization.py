@@ -0,0 +1,78 @@
+"""
+Micro-benchmark of the GET /products serialization path.
+
+Compares the previous path (sqlite3.Row -> dict -> json) with
+serialization.encode_rows() on tuple rows, with orjson and with the stdlib
+fallback. Run from the code directory: python bench_serialization.py
+"""
+import argparse
+import json
+import sqlite3
+import time
+
+import database
+import serialization
+
+
+def build_database(rows: int) -> sqlite3.Connection:
+    """Create an in-memory products table holding the given number of rows."""
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    database.init_db(conn)
+    conn.executemany(
+        'INSERT INTO products (name, price, description) VALUES (?, ?, ?)',
+        ((f'Product {i}', i * 1.25, f'Description of product number {i}')
+         for i in range(rows)))
+    conn.commit()
+    return conn
+
+
+def row_dict_path(conn) -> bytes:
+    products = conn.execute('SELECT * FROM products').fetchall()
+    return json.dumps([dict(row) for row in products], sort_keys=True).encode()
+
+
+def tuple_path(conn) -> bytes:
+    return serialization.encode_rows(*database.fetch_products(conn))
+
+
+def stdlib_tuple_path(conn) -> bytes:
+    orjson, serialization.orjson = serialization.orjson, None
+    try:
+        return tuple_path(conn)
+    finally:
+        serialization.orjson = orjson
+
+
+def best_time(function, conn, repeat: int) -> float:
+    """Return the fastest of several runs, in seconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(conn)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    conn = build_database(args.rows)
+    baseline = None
+    paths = [('Row -> dict -> json', row_dict_path),
+             ('tuples, stdlib json', stdlib_tuple_path)]
+    if serialization.orjson is not None:
+        paths.append(('tuples, orjson', tuple_path))
+    for label, function in paths:
+        seconds = best_time(function, conn, args.repeat)
+        baseline = baseline or seconds
+        print(f'{label:<22} {args.rows / seconds:>12,.0f} rows/s '
+              f'({baseline / seconds:.2f}x)')
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+"""
+Offline bulk loader for products.db.
+
+Reads CSV or JSON Lines files, validates rows in batches and writes them
+straight into the database in large transactions:
+
+    python bulk_import.py products.csv more.jsonl --chunk-size 100000
+
+Secondary indexes and triggers on products are dropped during the load and
+recreated afterwards, then the catalog statistics are rebuilt from a full
+scan. The database is switched to WAL and every chunk is its own
+transaction, so a running app.py keeps serving reads during the load and
+its writes wait at most one chunk (busy timeout). The API response cache
+of a running server catches up within RESPONSE_CACHE_TTL.
+
+The statements recreating the dropped objects are saved in the
+bulk_load_pending table in the same transaction as the drops, so a load
+killed half way is repaired by the next run (restore_interrupted_load())
+instead of leaving the statistics silently stale.
+"""
+import argparse
+import csv
+import io
+import json
+import math
+import mmap
+import os
+import sqlite3
+import time
+
+import database
+import stats
+
+# Rows written per transaction
+CHUNK_SIZE = 50000
+
+# Invalid rows printed in the final report
+MAX_REPORTED_ERRORS = 20
+
+INSERT_SQL = (
+    'INSERT INTO products (id, name, price, description) VALUES (?, ?, ?, ?)')
+
+UPSERT_SQL = INSERT_SQL + (
+    ' ON CONFLICT (id) DO UPDATE SET name = excluded.name, '
+    'price = excluded.price, description = excluded.description')
+
+PENDING_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS bulk_load_pending (
+    position INTEGER PRIMARY KEY,
+    sql TEXT NOT NULL
+);
+'''
+
+
+def open_lines(path: str, use_mmap: bool = False):
+    """
+    Iterate over the text lines of a file.
+
+    Args:
+        path (str): File to read.
+        use_mmap (bool): Map the file in memory instead of buffered reads.
+
+    Yields:
+        str: Lines including their line terminator.
+    """
+    with open(path, 'rb') as file:
+        if not use_mmap or os.fstat(file.fileno()).st_size == 0:
+            yield from io.TextIOWrapper(file, encoding='utf-8', newline='')
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for line in iter(mapped.readline, b''):
+                yield line.decode('utf-8')
+
+
+def iter_records(lines, file_format: str):
+    """
+    Parse lines into records.
+
+    Args:
+        lines (iterator): Text lines from open_lines().
+        file_format (str): 'csv' (with a header line) or 'jsonl'.
+
+    Yields:
+        tuple: The record number (1-based) and the record, a dict, or the
+        error message when the line cannot be parsed.
+    """
+    if file_format == 'csv':
+        for number, record in enumerate(csv.DictReader(lines), start=1):
+            yield number, record
+        return
+    number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, f'Invalid JSON: {e}'
+
+
+def validate_record(record) -> tuple:
+    """
+    Check a record and convert it to a row for INSERT_SQL.
+
+    Args:
+        record (dict): Parsed record with name, price, description and an
+            optional id.
+
+    Returns:
+        tuple: (id, name, price, description), id being None when absent.
+
+    Raises:
+        ValueError: If a field is missing or invalid.
+    """
+    if not isinstance(record, dict):
+        raise ValueError(str(record))
+    name = str(record.get('name') or '').strip()
+    description = str(record.get('description') or '').strip()
+    if not name:
+        raise ValueError('Product name cannot be empty')
+    if not description:
+        raise ValueError('Product description cannot be empty')
+    try:
+        price = float(record.get('price'))
+    except (TypeError, ValueError):
+        raise ValueError('Price must be a number')
+    if not math.isfinite(price):
+        raise ValueError('Price must be a finite number')
+    product_id = record.get('id')
+    if product_id in (None, ''):
+        product_id = None
+    else:
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            raise ValueError('ID must be an integer')
+    return product_id, name, price, description
+
+
+def validate_batch(records: list) -> tuple:
+    """
+    Validate a batch of records.
+
+    Args:
+        records (list): (record number, record) pairs.
+
+    Returns:
+        tuple: The valid rows and a list of (record number, error) pairs.
+    """
+    rows, errors = [], []
+    for number, record in records:
+        try:
+            rows.append(validate_record(record))
+        except ValueError as e:
+            errors.append((number, str(e)))
+    return rows, errors
+
+
+def iter_batches(records, size: int):
+    """Group records into lists of at most size items."""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def configure_for_bulk_load(conn: sqlite3.Connection) -> None:
+    """
+    Set the connection pragmas used during a bulk load.
+
+    WAL lets a running server keep reading while chunks are written, and
+    synchronous=NORMAL only syncs at checkpoints in WAL mode.
+    """
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    conn.execute('PRAGMA cache_size = -262144')  # 256 MiB
+    conn.execute('PRAGMA busy_timeout = 30000')
+
+
+def drop_secondary_objects(conn: sqlite3.Connection) -> list:
+    """
+    Drop the indexes and triggers of the products table.
+
+    Args:
+        conn (sqlite3.Connection): Open connection to the database.
+
+    Returns:
+        list: The SQL statements recreating what was dropped, also saved
+        in bulk_load_pending until restore_secondary_objects() runs them.
+    """
+    conn.executescript(PENDING_SCHEMA)
+    objects = conn.execute(
+        "SELECT type, name, sql FROM sqlite_master "
+        "WHERE tbl_name = 'products' AND type IN ('index', 'trigger') "
+        "AND sql IS NOT NULL").fetchall()
+    # Indexes first, so the triggers' MIN/MAX lookups can use them
+    statements = [sql for object_type, _, sql in sorted(objects)]
+    # The INSERT opens the transaction the drops then join
+    conn.executemany(
+        'INSERT INTO bulk_load_pending (sql) VALUES (?)',
+        [(sql,) for sql in statements])
+    for object_type, name, _ in objects:
+        conn.execute(f'DROP {object_type.upper()} IF EXISTS "{name}"')
+    conn.commit()
+    return statements
+
+
+def restore_secondary_objects(conn: sqlite3.Connection, statements: list):
+    """Recreate dropped indexes and triggers and rebuild the statistics."""
+    # The DELETE opens the transaction the statements then join
+    conn.execute('DELETE FROM bulk_load_pending')
+    for statement in statements:
+        conn.execute(statement)
+    conn.commit()
+    has_stats = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'product_stats'").fetchone()
+    if has_stats:
+        stats.install_stats(conn)
+
+
+def restore_interrupted_load(conn: sqlite3.Connection,
+                             progress=print) -> int:
+    """
+    Recreate the indexes and triggers left dropped by a load that died.
+
+    Args:
+        conn (sqlite3.Connection): Open connection to the database.
+        progress (callable): Receives a warning when something is restored.
+
+    Returns:
+        int: The number of statements run.
+    """
+    has_pending = conn.execute(
+        "SELECT 1 FROM sqlite_master "
+        "WHERE name = 'bulk_load_pending'").fetchone()
+    if not has_pending:
+        return 0
+    statements = [row[0] for row in conn.execute(
+        'SELECT sql FROM bulk_load_pending ORDER BY position')]
+    if statements:
+        progress(f'Warning: a previous load was interrupted, recreating '
+                 f'{len(statements)} indexes and triggers')
+        restore_secondary_objects(conn, statements)
+    return len(statements)
+
+
+def bulk_load(conn: sqlite3.Connection, records, chunk_size: int = CHUNK_SIZE,
+              upsert: bool = False, rebuild_indexes: bool = True,
+              progress=print) -> dict:
+    """
+    Validate records and write them in chunked transactions.
+
+    Args:
+        conn (sqlite3.Connection): Open connection to the database.
+        records (iterator): (record number, record) pairs from
+            iter_records().
+        chunk_size (int): Rows validated and committed together.
+        upsert (bool): Update existing products with the same id instead
+            of failing on duplicates.
+        rebuild_indexes (bool): Drop indexes and triggers during the load.
+        progress (callable): Receives a progress line after each chunk.
+
+    Returns:
+        dict: Rows written, rows rejected, the first errors and the
+        throughput.
+    """
+    configure_for_bulk_load(conn)
+    conn.executescript(database.SCHEMA)
+    restore_interrupted_load(conn, progress)
+    statements = drop_secondary_objects(conn) if rebuild_indexes else []
+    sql = UPSERT_SQL if upsert else INSERT_SQL
+    report = {'written': 0, 'rejected': 0, 'errors': []}
+    start = time.perf_counter()
+    try:
+        for batch in iter_batches(records, chunk_size):
+            rows, errors = validate_batch(batch)
+            report['rejected'] += len(errors)
+            space = MAX_REPORTED_ERRORS - len(report['errors'])
+            report['errors'].extend(errors[:max(space, 0)])
+            with conn:
+                conn.executemany(sql, rows)
+            report['written'] += len(rows)
+            elapsed = time.perf_counter() - start
+            progress(f"{report['written']:,} rows written, "
+                     f"{report['rejected']:,} rejected, "
+                     f"{report['written'] / elapsed:,.0f} rows/s")
+    finally:
+        if statements:
+            restore_secondary_objects(conn, statements)
+    report['seconds'] = time.perf_counter() - start
+    report['rows_per_second'] = (
+        report['written'] / report['seconds'] if report['seconds'] else 0.0)
+    return report
+
+
+def detect_format(path: str) -> str:
+    """Guess the file format from its extension."""
+    extension = os.path.splitext(path)[1].lower()
+    return 'jsonl' if extension in ('.jsonl', '.ndjson') else 'csv'
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Bulk load products from CSV or JSON Lines files.')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--database', default=None,
+                        help='Path of products.db (default: PRODUCTS_DB)')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default=None,
+                        help='Input format (default: from the extension)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--upsert', action='store_true',
+                        help='Update products whose id already exists')
+    parser.add_argument('--mmap', action='store_true',
+                        help='Memory-map the input files')
+    parser.add_argument('--keep-indexes', action='store_true',
+                        help='Do not drop indexes and triggers during the load')
+    args = parser.parse_args()
+    if args.database is None and database.SHARDS > 1:
+        parser.error(
+            'the products are sharded (PRODUCTS_SHARDS), load a single file '
+            'with --database and split it with sharding.py reshard')
+
+    conn = sqlite3.connect(args.database or database.DATABASE)
+    try:
+        for path in args.files:
+            print(f'Loading {path}')
+            lines = open_lines(path, args.mmap)
+            records = iter_records(lines, args.format or detect_format(path))
+            report = bulk_load(
+                conn, records, args.chunk_size, args.upsert,
+                not args.keep_indexes)
+            for number, error in report['errors']:
+                print(f'  record {number}: {error}')
+            print(f"Done: {report['written']:,} rows written, "
+                  f"{report['rejected']:,} rejected in "
+                  f"{report['seconds']:.1f} s "
+                  f"({report['rows_per_second']:,.0f} rows/s)")
+    except sqlite3.IntegrityError as e:
+        print(f'Error: {e}. Use --upsert to update existing products.')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+In-process cache of encoded response bodies.
+
+Every write to the products table calls invalidate(), which drops all
+entries and bumps a generation counter. A response rendered from data read
+before that write is not stored, so a slow reader cannot put stale data
+back into the cache. Entries also expire after a TTL, which bounds
+staleness when the database is changed by another process.
+"""
+import os
+import threading
+import time
+
+import compression
+from singleflight import flights
+
+# Seconds an entry stays valid when no write invalidates it earlier
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 5))
+
+# Resources kept at most, the oldest entry is dropped first
+RESPONSE_CACHE_MAX_ENTRIES = int(
+    os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 256))
+
+
+class ResponseCache:
+    """
+    Cache of response bodies keyed by resource, with one variant per
+    content encoding.
+    """
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.generation = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, variant: str):
+        """
+        Look up a cached variant.
+
+        Args:
+            key: Resource key, e.g. the route name.
+            variant (str): Content encoding requested.
+
+        Returns:
+            The cached value, or None when missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, variants = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            return variants.get(variant)
+
+    def put(self, key, variant: str, value, generation: int) -> None:
+        """
+        Store a variant rendered from data read at the given generation.
+
+        Args:
+            key: Resource key.
+            variant (str): Content encoding of the value.
+            value: Value to cache.
+            generation (int): Cache generation read before loading the data.
+        """
+        with self._lock:
+            if generation != self.generation or self.ttl <= 0:
+                return
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                if self._entries and len(self._entries) >= self.max_entries:
+                    del self._entries[next(iter(self._entries))]
+                entry = (time.monotonic() + self.ttl, {})
+                self._entries[key] = entry
+            entry[1][variant] = value
+
+    def invalidate(self) -> None:
+        """Drop every entry after the underlying data changed."""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def fetch(self, key, encoding: str, render,
+              coalesce: bool = True) -> tuple:
+        """
+        Return an encoded response body, rendering and compressing it only
+        on a cache miss.
+
+        Args:
+            key: Resource key.
+            encoding (str): Encoding chosen by compression.negotiate().
+            render (callable): Builds the uncompressed body.
+            coalesce (bool): Share the work with identical concurrent
+                misses. Disabled by callers that already coalesce.
+
+        Returns:
+            tuple: The body and its Content-Encoding.
+        """
+        generation = self.generation
+        cached = self.get(key, encoding)
+        if cached is not None:
+            return cached
+        if not coalesce:
+            return self._build(key, encoding, render, generation)
+        return flights.do(
+            (generation, key, encoding),
+            lambda: self._build(key, encoding, render, generation))
+
+    def _build(self, key, encoding: str, render, generation: int) -> tuple:
+        """Render or compress a missing variant and store it."""
+        if encoding == compression.IDENTITY:
+            value = (render(), compression.IDENTITY)
+        else:
+            body = self.fetch(key, compression.IDENTITY, render)[0]
+            value = compression.compress(body, encoding)
+        self.put(key, encoding, value, generation)
+        return value
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,326 @@
+"""
+Client-side instrumentation of the API calls in api_operations.py.
+
+Every call goes through send(), which hands a RequestEvent (operation,
+latency, payload sizes, status code, retries) to the registered hooks.
+With no hook registered, send() calls requests directly and measures
+nothing. OperationStats is a hook aggregating the events into per
+operation latency histograms:
+
+    stats = OperationStats()
+    register_hook(stats)
+    ...
+    print(stats.summary())
+    stats.dump('client_stats.json')
+
+main.py collects them for a session when CLIENT_STATS=1 (summary printed
+on exit) or CLIENT_STATS_JSON=<path> (written as JSON on exit); batch
+scripts can use the session() context manager the same way.
+
+send() also retries responses meaning "not processed, come back later"
+(429 and 503, which the server's admission control answers when
+overloaded) up to CLIENT_MAX_RETRIES times. It waits for the Retry-After
+the server asked for, or CLIENT_BACKOFF seconds doubled on every attempt
+without one, plus up to 50% random jitter so that rejected clients do not
+all come back at once. Each attempt is a separate event for the hooks.
+"""
+import bisect
+import contextlib
+import email.utils
+import json
+import os
+import random
+import threading
+import time
+from typing import NamedTuple
+
+import requests
+
+CLIENT_STATS = os.environ.get('CLIENT_STATS', '0') == '1'
+CLIENT_STATS_JSON = os.environ.get('CLIENT_STATS_JSON')
+CLIENT_MAX_RETRIES = int(os.environ.get('CLIENT_MAX_RETRIES', 3))
+CLIENT_BACKOFF = float(os.environ.get('CLIENT_BACKOFF', 0.5))
+CLIENT_MAX_BACKOFF = float(os.environ.get('CLIENT_MAX_BACKOFF', 30))
+
+RETRY_STATUSES = (429, 503)
+
+# Upper bounds in seconds of the latency buckets, the last one is open
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0)
+
+HOOKS = []
+
+
+class RequestEvent(NamedTuple):
+    """
+    One API call, as seen by the hooks.
+    """
+    operation: str
+    method: str
+    url: str
+    status: int
+    seconds: float
+    request_bytes: int
+    response_bytes: int
+    retries: int
+    error: str
+
+
+def register_hook(hook) -> None:
+    """Call hook(event) with a RequestEvent after every API call."""
+    HOOKS.append(hook)
+
+
+def unregister_hook(hook) -> None:
+    HOOKS.remove(hook)
+
+
+def body_size(body) -> int:
+    """Return the size in bytes of a prepared request body."""
+    if body is None:
+        return 0
+    if isinstance(body, str):
+        return len(body.encode())
+    return len(body) if isinstance(body, (bytes, bytearray)) else 0
+
+
+def send(operation: str, method: str, url: str, retries: int = 0,
+         **kwargs) -> requests.Response:
+    """
+    Make an HTTP request, retry it while the server is overloaded and
+    report every attempt to the hooks.
+
+    Args:
+        operation (str): Name of the client operation, e.g. 'get_products'.
+        method (str): requests function to call: 'get', 'post', ...
+        url (str): Request URL.
+        retries (int): Attempts made before this one.
+        **kwargs: Passed to requests.
+
+    Returns:
+        requests.Response: The response, the last 429 or 503 one when the
+        retries are exhausted.
+
+    Raises:
+        RequestException: Errors of requests, after the hooks saw them.
+    """
+    request = getattr(requests, method)
+    while True:
+        response = send_once(
+            request, operation, method, url, retries, kwargs)
+        if (response.status_code not in RETRY_STATUSES
+                or retries >= CLIENT_MAX_RETRIES):
+            return response
+        time.sleep(retry_delay(response, retries))
+        retries += 1
+
+
+def send_once(request, operation: str, method: str, url: str,
+              retries: int, kwargs: dict) -> requests.Response:
+    """Make one request and report it to the hooks."""
+    if not HOOKS:
+        return request(url, **kwargs)
+    start = time.perf_counter()
+    try:
+        response = request(url, **kwargs)
+    except requests.RequestException as e:
+        emit(RequestEvent(
+            operation, method.upper(), url, None,
+            time.perf_counter() - start, 0, 0, retries, type(e).__name__))
+        raise
+    seconds = time.perf_counter() - start
+    prepared = getattr(response, 'request', None)
+    emit(RequestEvent(
+        operation, method.upper(), url, response.status_code, seconds,
+        body_size(getattr(prepared, 'body', None)), len(response.content),
+        retries, None))
+    return response
+
+
+def retry_after(response) -> float:
+    """
+    Read the Retry-After header of a response.
+
+    Returns:
+        float: Seconds to wait, or None when the header is absent or
+        invalid.
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+def retry_delay(response, retries: int) -> float:
+    """
+    Compute the wait before the next attempt.
+
+    Args:
+        response (requests.Response): The 429 or 503 response.
+        retries (int): Attempts already retried.
+
+    Returns:
+        float: Seconds to sleep, at most CLIENT_MAX_BACKOFF.
+    """
+    delay = retry_after(response)
+    if delay is None:
+        delay = CLIENT_BACKOFF * 2 ** retries
+    return min(delay * (1 + random.random() / 2), CLIENT_MAX_BACKOFF)
+
+
+def emit(event: RequestEvent) -> None:
+    for hook in list(HOOKS):
+        hook(event)
+
+
+class OperationStats:
+    """
+    Hook aggregating events into counts, sizes and a latency histogram per
+    operation.
+    """
+    def __init__(self):
+        self.operations = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event: RequestEvent) -> None:
+        self.record(event)
+
+    def record(self, event: RequestEvent) -> None:
+        with self._lock:
+            entry = self.operations.get(event.operation)
+            if entry is None:
+                entry = self.operations[event.operation] = {
+                    'count': 0, 'errors': 0, 'retries': 0,
+                    'statuses': {}, 'request_bytes': 0, 'response_bytes': 0,
+                    'seconds': 0.0, 'min': None, 'max': None,
+                    'buckets': [0] * (len(LATENCY_BUCKETS) + 1)}
+            entry['count'] += 1
+            entry['retries'] += event.retries
+            status = str(event.status) if event.status else event.error
+            entry['statuses'][status] = entry['statuses'].get(status, 0) + 1
+            if event.error or event.status >= 400:
+                entry['errors'] += 1
+            entry['request_bytes'] += event.request_bytes
+            entry['response_bytes'] += event.response_bytes
+            entry['seconds'] += event.seconds
+            if entry['min'] is None or event.seconds < entry['min']:
+                entry['min'] = event.seconds
+            if entry['max'] is None or event.seconds > entry['max']:
+                entry['max'] = event.seconds
+            entry['buckets'][
+                bisect.bisect_left(LATENCY_BUCKETS, event.seconds)] += 1
+
+    @staticmethod
+    def percentile(entry: dict, fraction: float) -> float:
+        """
+        Estimate a latency percentile from the histogram.
+
+        Returns:
+            float: Upper bound of the bucket holding the percentile, or the
+            maximum latency for the open last bucket.
+        """
+        rank = fraction * entry['count']
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, entry['buckets']):
+            seen += count
+            if seen >= rank:
+                return min(bound, entry['max'])
+        return entry['max']
+
+    def as_dict(self) -> dict:
+        """
+        Export the statistics.
+
+        Returns:
+            dict: Per operation counts, status codes, bytes, latency
+            summary in seconds and the histogram keyed by bucket bound.
+        """
+        with self._lock:
+            result = {}
+            for operation, entry in sorted(self.operations.items()):
+                bounds = [str(b) for b in LATENCY_BUCKETS] + ['+Inf']
+                result[operation] = {
+                    'count': entry['count'],
+                    'errors': entry['errors'],
+                    'retries': entry['retries'],
+                    'statuses': dict(entry['statuses']),
+                    'request_bytes': entry['request_bytes'],
+                    'response_bytes': entry['response_bytes'],
+                    'latency': {
+                        'mean': entry['seconds'] / entry['count'],
+                        'min': entry['min'],
+                        'max': entry['max'],
+                        'p50': self.percentile(entry, 0.5),
+                        'p90': self.percentile(entry, 0.9),
+                        'p99': self.percentile(entry, 0.99),
+                    },
+                    'histogram': dict(zip(bounds, entry['buckets'])),
+                }
+            return result
+
+    def to_json(self) -> str:
+        return json.dumps(self.as_dict(), indent=2)
+
+    def dump(self, path: str) -> None:
+        """Write the statistics to a JSON file."""
+        with open(path, 'w') as file:
+            file.write(self.to_json())
+
+    def summary(self) -> str:
+        """Format the statistics as a table, one line per operation."""
+        stats = self.as_dict()
+        if not stats:
+            return 'No API calls recorded.'
+        lines = [f"{'operation':<22}{'calls':>7}{'errors':>7}{'retries':>8}"
+                 f"{'mean ms':>9}{'p50 ms':>9}{'p99 ms':>9}{'sent KiB':>10}"
+                 f"{'recv KiB':>10}"]
+        for operation, entry in stats.items():
+            latency = entry['latency']
+            lines.append(
+                f"{operation:<22}{entry['count']:>7}{entry['errors']:>7}"
+                f"{entry['retries']:>8}{latency['mean'] * 1000:>9.1f}"
+                f"{latency['p50'] * 1000:>9.1f}{latency['p99'] * 1000:>9.1f}"
+                f"{entry['request_bytes'] / 1024:>10.1f}"
+                f"{entry['response_bytes'] / 1024:>10.1f}")
+        return '\n'.join(lines)
+
+
+@contextlib.contextmanager
+def session(summary: bool = None, json_path: str = None):
+    """
+    Collect statistics for the duration of a block.
+
+    Args:
+        summary (bool): Print the summary table at the end (default:
+            CLIENT_STATS).
+        json_path (str): Write the statistics to this file at the end
+            (default: CLIENT_STATS_JSON).
+
+    Yields:
+        OperationStats: The statistics, or None when neither output is
+        requested and nothing is collected.
+    """
+    summary = CLIENT_STATS if summary is None else summary
+    json_path = json_path or CLIENT_STATS_JSON
+    if not summary and not json_path:
+        yield None
+        return
+    stats = OperationStats()
+    register_hook(stats)
+    try:
+        yield stats
+    finally:
+        unregister_hook(stats)
+        if summary:
+            print(stats.summary())
+        if json_path:
+            stats.dump(json_path)
@@ -0,0 +1,103 @@
+"""
+Negotiated compression of response bodies.
+
+gzip is always available; zstd and brotli are offered only when the
+zstandard and brotli packages are installed.
+"""
+import gzip
+import os
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IDENTITY = 'identity'
+
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+
+# Compression level per encoding
+COMPRESS_LEVELS = {
+    'gzip': int(os.environ.get('COMPRESS_GZIP_LEVEL', 6)),
+    'br': int(os.environ.get('COMPRESS_BR_LEVEL', 5)),
+    'zstd': int(os.environ.get('COMPRESS_ZSTD_LEVEL', 3)),
+}
+
+
+def available_encodings() -> list:
+    """
+    List the encodings this server can produce, most preferred first.
+
+    Returns:
+        list: Encoding names as used in the Content-Encoding header.
+    """
+    encodings = []
+    if zstandard is not None:
+        encodings.append('zstd')
+    if brotli is not None:
+        encodings.append('br')
+    encodings.append('gzip')
+    return encodings
+
+
+def negotiate(accept_encoding: str) -> str:
+    """
+    Choose the response encoding for an Accept-Encoding header.
+
+    Args:
+        accept_encoding (str): Value of the request Accept-Encoding header.
+
+    Returns:
+        str: The preferred encoding accepted by the client, or 'identity'.
+    """
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name] = quality
+
+    best, best_quality = IDENTITY, 0.0
+    for encoding in available_encodings():
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str) -> tuple:
+    """
+    Compress a response body.
+
+    Args:
+        body (bytes): Uncompressed body.
+        encoding (str): Encoding returned by negotiate().
+
+    Returns:
+        tuple: The body to send and its Content-Encoding. Bodies under
+        COMPRESS_MIN_SIZE are returned unchanged with 'identity'.
+    """
+    if encoding == IDENTITY or len(body) < COMPRESS_MIN_SIZE:
+        return body, IDENTITY
+    level = COMPRESS_LEVELS[encoding]
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=level, mtime=0), encoding
+    if encoding == 'br':
+        return brotli.compress(body, quality=level), encoding
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(body), encoding
+    raise ValueError(f'Unsupported encoding: {encoding}')
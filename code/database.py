@@ -0,0 +1,477 @@
+import math
+import os
+import sqlite3
+
+import serialization
+import stats
+
+# Path of the products database, shared by app.py and asgi_app.py
+DATABASE = os.environ.get('PRODUCTS_DB', 'products.db')
+
+# Number of shard files the products are spread across (0 or 1: unsharded)
+SHARDS = int(os.environ.get('PRODUCTS_SHARDS', 0))
+
+# Keep the whole table in memory and serve reads from it (see hot_tier.py)
+HOT_TIER = os.environ.get('PRODUCTS_HOT_TIER', '0') == '1'
+
+# Functions called with every new connection, e.g. by profiling.py
+CONNECTION_HOOKS = []
+# Functions called with every connection about to be closed
+DISCONNECT_HOOKS = []
+
+# New files release the pages freed by deletes with incremental vacuum,
+# see maintenance.py
+SCHEMA = '''
+PRAGMA auto_vacuum = INCREMENTAL;
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    price REAL NOT NULL,
+    description TEXT NOT NULL
+);
+'''
+
+
+def close_connection(conn: sqlite3.Connection) -> None:
+    """
+    Run the DISCONNECT_HOOKS on a connection, then close it.
+
+    Args:
+        conn (sqlite3.Connection): Connection opened by SQLiteStore.
+    """
+    for hook in DISCONNECT_HOOKS:
+        hook(conn)
+    conn.close()
+
+
+def init_db(conn: sqlite3.Connection) -> None:
+    """
+    Create the products table and its statistics if they do not exist yet.
+
+    Args:
+        conn (sqlite3.Connection): Open connection to the database.
+    """
+    conn.executescript(SCHEMA)
+    conn.commit()
+    stats.install_stats(conn)
+
+
+def fetch_products(conn: sqlite3.Connection) -> tuple:
+    """
+    Fetch every product in the database.
+
+    Args:
+        conn (sqlite3.Connection): Open connection to the database.
+
+    Returns:
+        tuple: The column names and one tuple per product in id order,
+        ready for serialization.encode_rows().
+    """
+    return serialization.query_rows(
+        conn, 'SELECT * FROM products ORDER BY id')
+
+
+# Filters accepted by GET /products, all inclusive bounds
+PRODUCT_FILTERS = {
+    'min_id': (int, 'id >= ?'),
+    'max_id': (int, 'id <= ?'),
+    'min_price': (float, 'price >= ?'),
+    'max_price': (float, 'price <= ?'),
+}
+
+
+def parse_product_filters(params) -> dict:
+    """
+    Read the product filters from query string parameters.
+
+    Args:
+        params: Mapping of parameter names to string values.
+
+    Returns:
+        dict: The filters present, converted to numbers.
+
+    Raises:
+        ValueError: If a filter is not a valid number.
+    """
+    filters = {}
+    for name, (convert, _) in PRODUCT_FILTERS.items():
+        value = params.get(name)
+        if value is not None:
+            try:
+                filters[name] = convert(value)
+            except ValueError:
+                raise ValueError(f'Invalid {name}: {value}') from None
+    return filters
+
+
+def filter_products(conn: sqlite3.Connection, filters: dict) -> tuple:
+    """
+    Fetch the products within id and price ranges.
+
+    Args:
+        conn (sqlite3.Connection): Open connection to the database.
+        filters (dict): Bounds returned by parse_product_filters().
+
+    Returns:
+        tuple: The column names and the matching rows in id order.
+    """
+    clauses = [PRODUCT_FILTERS[name][1] for name in filters]
+    where = f' WHERE {" AND ".join(clauses)}' if clauses else ''
+    return serialization.query_rows(
+        conn, f'SELECT * FROM products{where} ORDER BY id',
+        tuple(filters.values()))
+
+
+def fetch_product(conn: sqlite3.Connection, product_id: int) -> dict:
+    """
+    Fetch a single product.
+
+    Args:
+        conn (sqlite3.Connection): Open connection to the database.
+        product_id (int): ID of the product.
+
+    Returns:
+        dict: The product, or None if it does not exist.
+    """
+    keys, rows = serialization.query_rows(
+        conn, 'SELECT * FROM products WHERE id = ?', (product_id,))
+    return dict(zip(keys, rows[0])) if rows else None
+
+
+def iter_product_batches(conn: sqlite3.Connection, batch_size: int):
+    """
+    Read the products table in batches of row tuples.
+
+    Args:
+        conn (sqlite3.Connection): Open connection to the database.
+        batch_size (int): Maximum number of rows per batch.
+
+    Yields:
+        list: (id, name, price, description) tuples in id order.
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(
+        'SELECT id, name, price, description FROM products ORDER BY id')
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def validate_price(price):
+    """
+    Check a product price.
+
+    Non-finite values must never reach the table: the stats triggers would
+    turn the price sum into NaN, which SQLite stores as NULL.
+
+    Args:
+        price: Decoded JSON value.
+
+    Returns:
+        The price, unmodified.
+
+    Raises:
+        ValueError: If the price is not a finite number.
+    """
+    try:
+        finite = (isinstance(price, (int, float))
+                  and not isinstance(price, bool)
+                  and math.isfinite(price))
+    except OverflowError:
+        finite = False
+    if not finite:
+        raise ValueError(f'Price must be a finite number: {price!r}')
+    return price
+
+
+def insert_product(
+        conn: sqlite3.Connection, product: dict, commit: bool = True) -> int:
+    """
+    Insert a new product.
+
+    Args:
+        conn (sqlite3.Connection): Open connection to the database.
+        product (dict): Product with name, price and description.
+        commit (bool): Commit the transaction; batch.py passes False to
+            run several writes in one.
+
+    Returns:
+        int: The ID assigned to the new product.
+    """
+    cursor = conn.execute(
+        'INSERT INTO products (name, price, description) VALUES (?, ?, ?)',
+        (product['name'], product['price'], product['description']))
+    if commit:
+        conn.commit()
+    return cursor.lastrowid
+
+
+def update_product(
+        conn: sqlite3.Connection, product_id: int, product: dict,
+        commit: bool = True) -> bool:
+    """
+    Overwrite the name, price and description of an existing product.
+
+    Args:
+        conn (sqlite3.Connection): Open connection to the database.
+        product_id (int): ID of the product to update.
+        product (dict): New name, price and description.
+        commit (bool): Commit the transaction.
+
+    Returns:
+        bool: Whether the product exists.
+    """
+    cursor = conn.execute(
+        'UPDATE products SET name = ?, price = ?, description = ? '
+        'WHERE id = ?',
+        (product['name'], product['price'], product['description'],
+         product_id))
+    if commit:
+        conn.commit()
+    return cursor.rowcount > 0
+
+
+# Columns a client may change, with the types they accept
+PRODUCT_FIELDS = {'name': str, 'price': (int, float), 'description': str}
+
+
+def validate_changes(changes) -> dict:
+    """
+    Check the body of a partial update.
+
+    Args:
+        changes: Decoded JSON body.
+
+    Returns:
+        dict: The changes, unmodified.
+
+    Raises:
+        ValueError: If the body is not an object, names an unknown field,
+            holds a value of the wrong type or a price that is not finite.
+    """
+    if not isinstance(changes, dict):
+        raise ValueError('Body must be a JSON object')
+    unknown = sorted(set(changes) - set(PRODUCT_FIELDS))
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+    for field, value in changes.items():
+        if (not isinstance(value, PRODUCT_FIELDS[field])
+                or isinstance(value, bool)):
+            raise ValueError(f'Invalid {field}: {value!r}')
+    if 'price' in changes:
+        validate_price(changes['price'])
+    return changes
+
+
+def validate_product(product) -> dict:
+    """
+    Check a complete product, as created or replaced.
+
+    Args:
+        product: Decoded JSON body.
+
+    Returns:
+        dict: The product, unmodified.
+
+    Raises:
+        ValueError: As validate_changes (including for a price that is not
+            finite), or if a field is missing.
+    """
+    validate_changes(product)
+    missing = [field for field in PRODUCT_FIELDS if field not in product]
+    if missing:
+        raise ValueError(f'Missing fields: {", ".join(missing)}')
+    return product
+
+
+def patch_product(
+        conn: sqlite3.Connection, product_id: int, changes: dict,
+        commit: bool = True) -> tuple:
+    """
+    Update only the supplied columns of a product.
+
+    The UPDATE only matches when a value actually differs, so a no-op
+    change writes nothing and fires no trigger.
+
+    Args:
+        conn (sqlite3.Connection): Open connection to the database.
+        product_id (int): ID of the product to update.
+        changes (dict): Subset of name, price and description.
+        commit (bool): Commit the transaction.
+
+    Returns:
+        tuple: The product after the update (None if it does not exist)
+        and whether a row was written.
+    """
+    columns = [field for field in PRODUCT_FIELDS if field in changes]
+    changed = False
+    if columns:
+        values = [changes[column] for column in columns]
+        assignments = ', '.join(f'{column} = ?' for column in columns)
+        differs = ' OR '.join(f'{column} IS NOT ?' for column in columns)
+        cursor = conn.execute(
+            f'UPDATE products SET {assignments} WHERE id = ? AND ({differs})',
+            values + [product_id] + values)
+        if commit:
+            conn.commit()
+        changed = cursor.rowcount > 0
+    return fetch_product(conn, product_id), changed
+
+
+def delete_product(
+        conn: sqlite3.Connection, product_id: int,
+        commit: bool = True) -> bool:
+    """
+    Delete a product.
+
+    Args:
+        conn (sqlite3.Connection): Open connection to the database.
+        product_id (int): ID of the product to delete.
+        commit (bool): Commit the transaction.
+
+    Returns:
+        bool: Whether the product existed.
+    """
+    cursor = conn.execute('DELETE FROM products WHERE id = ?', (product_id,))
+    if commit:
+        conn.commit()
+    return cursor.rowcount > 0
+
+
+class SQLiteStore:
+    """
+    Products kept in a single SQLite file.
+
+    Each method opens its own connection, so a store can be used from any
+    thread. sharding.ShardedStore offers the same methods over several
+    files; routes only talk to the object returned by get_store().
+    """
+    def __init__(self, path: str):
+        self.path = path
+
+    @property
+    def paths(self) -> list:
+        """Database files holding the products."""
+        return [self.path]
+
+    def connect(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=check_same_thread)
+        conn.row_factory = sqlite3.Row
+        for hook in CONNECTION_HOOKS:
+            hook(conn)
+        return conn
+
+    def run(self, operation, *args):
+        """
+        Run a database operation on a fresh connection and close it.
+
+        Args:
+            operation (callable): Function taking the connection first.
+            *args: Extra positional arguments passed to the operation.
+
+        Returns:
+            The value returned by the operation.
+        """
+        conn = self.connect()
+        try:
+            return operation(conn, *args)
+        finally:
+            close_connection(conn)
+
+    def fetch_products(self) -> tuple:
+        return self.run(fetch_products)
+
+    def fetch_product(self, product_id: int) -> dict:
+        return self.run(fetch_product, product_id)
+
+    def filter_products(self, filters: dict) -> tuple:
+        return self.run(filter_products, filters)
+
+    def insert_product(self, product: dict) -> int:
+        return self.run(insert_product, product)
+
+    def update_product(self, product_id: int, product: dict) -> bool:
+        return self.run(update_product, product_id, product)
+
+    def patch_product(self, product_id: int, changes: dict) -> tuple:
+        return self.run(patch_product, product_id, changes)
+
+    def delete_product(self, product_id: int) -> bool:
+        return self.run(delete_product, product_id)
+
+    def read_stats(self) -> dict:
+        return self.run(stats.read_stats)
+
+    def iter_batches(self, batch_size: int):
+        """
+        Stream the table in batches of row tuples, in id order.
+
+        The connection may be used from several threads in turn, as the
+        ASGI server pulls each batch from whichever worker is free.
+        """
+        conn = self.connect(check_same_thread=False)
+        try:
+            yield from iter_product_batches(conn, batch_size)
+        finally:
+            close_connection(conn)
+
+
+_stores = {}
+
+
+def get_store():
+    """
+    Return the product store for the configured DATABASE and SHARDS,
+    wrapped in a hot_tier.HotTierStore when HOT_TIER is set.
+
+    Returns:
+        SQLiteStore, sharding.ShardedStore or hot_tier.HotTierStore: The
+        store serving the routes.
+    """
+    key = (DATABASE, SHARDS, HOT_TIER)
+    store = _stores.get(key)
+    if store is None:
+        if SHARDS > 1:
+            import sharding
+            store = sharding.ShardedStore(
+                sharding.shard_paths(DATABASE, SHARDS))
+        else:
+            store = SQLiteStore(DATABASE)
+        if HOT_TIER:
+            import hot_tier
+            store = hot_tier.HotTierStore(store)
+        _stores[key] = store
+    return store
+
+
+def products_key(filters: dict):
+    """
+    Response cache key of a GET /products listing.
+
+    Args:
+        filters (dict): Filters from parse_product_filters().
+
+    Returns:
+        Hashable key, 'products' for the unfiltered listing.
+    """
+    return ('products', *sorted(filters.items())) if filters else 'products'
+
+
+def render_products(filters: dict = None) -> bytes:
+    """
+    Encode the GET /products body, for both app.py and asgi_app.py.
+
+    Args:
+        filters (dict): Filters from parse_product_filters(), if any.
+
+    Returns:
+        bytes: JSON array of the matching products.
+    """
+    if filters:
+        keys, rows = get_store().filter_products(filters)
+    else:
+        keys, rows = get_store().fetch_products()
+    return serialization.encode_rows(keys, rows)
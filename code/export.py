@@ -0,0 +1,146 @@
+"""
+Bulk export of the products table in columnar batches.
+
+Rows are read from the store with fetchmany() and encoded one batch at a
+time, so memory stays bounded by EXPORT_BATCH_SIZE however large the table is.
+CSV is always available; Arrow IPC streams and Parquet are offered only
+when pyarrow is installed.
+"""
+import csv
+import io
+import os
+
+import database
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Rows read from the cursor and written per batch
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 10000))
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+EXTENSIONS = {'csv': 'csv', 'arrow': 'arrows', 'parquet': 'parquet'}
+
+
+def available_formats() -> list:
+    """
+    List the export formats supported with the installed packages.
+
+    Returns:
+        list: Format names accepted by stream_export().
+    """
+    if pyarrow is None:
+        return ['csv']
+    return ['csv', 'arrow', 'parquet']
+
+
+def arrow_schema():
+    """Arrow schema of the products table."""
+    return pyarrow.schema([
+        ('id', pyarrow.int64()),
+        ('name', pyarrow.string()),
+        ('price', pyarrow.float64()),
+        ('description', pyarrow.string()),
+    ])
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file collecting what pyarrow writes until it is drained.
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def write_csv(batches):
+    """Encode batches as CSV with a header line."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(('id', 'name', 'price', 'description'))
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def to_record_batch(rows: list):
+    """Transpose row tuples into an Arrow record batch."""
+    schema = arrow_schema()
+    columns = list(zip(*rows))
+    return pyarrow.RecordBatch.from_arrays(
+        [pyarrow.array(column, type=field.type)
+         for column, field in zip(columns, schema)],
+        schema=schema)
+
+
+def write_arrow(batches):
+    """Encode batches as an Arrow IPC stream."""
+    sink = _ChunkSink()
+    with pyarrow.ipc.new_stream(sink, arrow_schema()) as writer:
+        for rows in batches:
+            writer.write_batch(to_record_batch(rows))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def write_parquet(batches):
+    """Encode batches as a Parquet file, one row group per batch."""
+    sink = _ChunkSink()
+    with pyarrow.parquet.ParquetWriter(sink, arrow_schema()) as writer:
+        for rows in batches:
+            writer.write_batch(to_record_batch(rows))
+            yield sink.drain()
+    yield sink.drain()
+
+
+WRITERS = {'csv': write_csv, 'arrow': write_arrow, 'parquet': write_parquet}
+
+
+def stream_export(export_format: str, batch_size: int = None):
+    """
+    Stream the whole products table in the requested format.
+
+    Args:
+        export_format (str): One of available_formats().
+        batch_size (int): Rows per batch, EXPORT_BATCH_SIZE by default.
+
+    Yields:
+        bytes: Consecutive chunks of the encoded file.
+
+    The store reads the table lazily and releases its connections when
+    the stream ends, so the generator can be handed to a streaming
+    response as is.
+    """
+    if export_format not in available_formats():
+        raise ValueError(f'Unsupported export format: {export_format}')
+    batches = database.get_store().iter_batches(
+        batch_size or EXPORT_BATCH_SIZE)
+    try:
+        for chunk in WRITERS[export_format](batches):
+            if chunk:
+                yield chunk
+    finally:
+        batches.close()
@@ -0,0 +1,268 @@
+"""
+Compact in-memory copy of the products table.
+
+With PRODUCTS_HOT_TIER=1 the store returned by database.get_store() keeps
+the whole table in column arrays sorted by id: ids in array('q'), prices
+in array('d') and interned name and description strings in lists. Point
+lookups and id ranges are binary searches over the ids, price filters scan
+the price column (vectorized with NumPy when it is installed), and listings
+and exports never touch the disk.
+
+Writes go to the SQLite store first and then update the arrays in place
+(appending for new ids, so inserts are cheap). Writes made by other
+processes are only seen after HOT_TIER_TTL seconds, when the next read
+reloads the table; the default of 0 never reloads and assumes this
+process is the only writer.
+"""
+import bisect
+import os
+import sys
+import threading
+import time
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Seconds after which a read reloads the table from disk (0: never)
+HOT_TIER_TTL = float(os.environ.get('HOT_TIER_TTL', 0))
+
+KEYS = ('id', 'name', 'price', 'description')
+
+# Rows read per batch when loading the table
+LOAD_BATCH_SIZE = 10000
+
+
+class HotTierStore:
+    """
+    Read-through, write-through in-memory tier over a product store.
+
+    Offers the same methods as database.SQLiteStore.
+    """
+    def __init__(self, backing, ttl: float = HOT_TIER_TTL):
+        self.backing = backing
+        self.ttl = ttl
+        self.ids = array('q')
+        self.prices = array('d')
+        self.names = []
+        self.descriptions = []
+        self.loaded_at = None
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+
+    @property
+    def paths(self) -> list:
+        """Database files holding the products."""
+        return self.backing.paths
+
+    def load(self) -> None:
+        """Replace the in-memory columns with the table on disk."""
+        ids, prices = array('q'), array('d')
+        names, descriptions = [], []
+        for rows in self.backing.iter_batches(LOAD_BATCH_SIZE):
+            for product_id, name, price, description in rows:
+                ids.append(product_id)
+                names.append(sys.intern(name))
+                prices.append(price)
+                descriptions.append(sys.intern(description))
+        with self._lock:
+            self.ids, self.prices = ids, prices
+            self.names, self.descriptions = names, descriptions
+            self.loaded_at = time.monotonic()
+
+    def reload(self) -> None:
+        """Reload the table after it was changed behind the store."""
+        with self._write_lock:
+            self.load()
+
+    def _ensure_loaded(self) -> None:
+        if self.loaded_at is None or (
+                self.ttl > 0 and time.monotonic() - self.loaded_at > self.ttl):
+            self.reload()
+
+    def _rows(self, positions) -> list:
+        ids, names = self.ids, self.names
+        prices, descriptions = self.prices, self.descriptions
+        return [(ids[i], names[i], prices[i], descriptions[i])
+                for i in positions]
+
+    def fetch_products(self) -> tuple:
+        self._ensure_loaded()
+        with self._lock:
+            return KEYS, list(zip(
+                self.ids, self.names, self.prices, self.descriptions))
+
+    def fetch_product(self, product_id: int) -> dict:
+        self._ensure_loaded()
+        with self._lock:
+            position = self._find(product_id)
+            if position is None:
+                return None
+            return dict(zip(KEYS, self._rows([position])[0]))
+
+    def filter_products(self, filters: dict) -> tuple:
+        """
+        Select products by id range and price range.
+
+        Args:
+            filters (dict): Optional min_id, max_id, min_price, max_price,
+                all inclusive.
+
+        Returns:
+            tuple: The column names and the matching rows in id order.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            low = 0
+            high = len(self.ids)
+            if filters.get('min_id') is not None:
+                low = bisect.bisect_left(self.ids, filters['min_id'])
+            if filters.get('max_id') is not None:
+                high = bisect.bisect_right(self.ids, filters['max_id'])
+            positions = self._price_positions(
+                low, high, filters.get('min_price'), filters.get('max_price'))
+            return KEYS, self._rows(positions)
+
+    def _price_positions(self, low: int, high: int, min_price, max_price):
+        """Return the positions in [low, high) within the price range."""
+        if high <= low:
+            return []
+        if min_price is None and max_price is None:
+            return range(low, high)
+        if numpy is not None:
+            # The view pins the array buffer, it must not outlive the lock
+            prices = numpy.frombuffer(self.prices, dtype=numpy.float64)
+            mask = numpy.ones(high - low, dtype=bool)
+            if min_price is not None:
+                mask &= prices[low:high] >= min_price
+            if max_price is not None:
+                mask &= prices[low:high] <= max_price
+            del prices
+            return (numpy.flatnonzero(mask) + low).tolist()
+        minimum = float('-inf') if min_price is None else min_price
+        maximum = float('inf') if max_price is None else max_price
+        prices = self.prices
+        return [i for i in range(low, high)
+                if minimum <= prices[i] <= maximum]
+
+    def _find(self, product_id: int):
+        """Return the position of an id, or None."""
+        position = bisect.bisect_left(self.ids, product_id)
+        if position < len(self.ids) and self.ids[position] == product_id:
+            return position
+        return None
+
+    def _apply(self, product_id: int, product: dict) -> None:
+        """
+        Store a written row in the columns, or drop it when None.
+
+        The row must be read back from SQLite rather than taken from the
+        request, so that the columns hold the values as SQLite stored them.
+        """
+        position = bisect.bisect_left(self.ids, product_id)
+        found = (position < len(self.ids)
+                 and self.ids[position] == product_id)
+        if product is None:
+            if found:
+                del self.ids[position]
+                del self.prices[position]
+                del self.names[position]
+                del self.descriptions[position]
+            return
+        price = float(product['price'])
+        name = sys.intern(product['name'])
+        description = sys.intern(product['description'])
+        if found:
+            self.prices[position] = price
+            self.names[position] = name
+            self.descriptions[position] = description
+        else:
+            self.ids.insert(position, product_id)
+            self.prices.insert(position, price)
+            self.names.insert(position, name)
+            self.descriptions.insert(position, description)
+
+    def apply(self, write):
+        """
+        Run a write made behind the store and apply its rows to the
+        columns, without reloading the table.
+
+        Args:
+            write (callable): Writes to the backing files and returns its
+                result and the committed rows, as a list of
+                (id, product or None when deleted) in write order.
+
+        Returns:
+            The result of write().
+        """
+        self._ensure_loaded()
+        with self._write_lock:
+            result, changes = write()
+            with self._lock:
+                for product_id, product in changes:
+                    self._apply(product_id, product)
+        return result
+
+    def insert_product(self, product: dict) -> int:
+        self._ensure_loaded()
+        with self._write_lock:
+            product_id = self.backing.insert_product(product)
+            stored = self.backing.fetch_product(product_id)
+            with self._lock:
+                self._apply(product_id, stored)
+        return product_id
+
+    def update_product(self, product_id: int, product: dict) -> bool:
+        self._ensure_loaded()
+        with self._write_lock:
+            found = self.backing.update_product(product_id, product)
+            if found:
+                stored = self.backing.fetch_product(product_id)
+                with self._lock:
+                    self._apply(product_id, stored)
+        return found
+
+    def patch_product(self, product_id: int, changes: dict) -> tuple:
+        self._ensure_loaded()
+        with self._write_lock:
+            product, changed = self.backing.patch_product(product_id, changes)
+            if changed and product is not None:
+                with self._lock:
+                    self._apply(product_id, product)
+        return product, changed
+
+    def delete_product(self, product_id: int) -> bool:
+        self._ensure_loaded()
+        with self._write_lock:
+            found = self.backing.delete_product(product_id)
+            with self._lock:
+                self._apply(product_id, None)
+        return found
+
+    def read_stats(self) -> dict:
+        return self.backing.read_stats()
+
+    def iter_batches(self, batch_size: int):
+        """Stream the in-memory table in batches of row tuples."""
+        keys, rows = self.fetch_products()
+        for start in range(0, len(rows), batch_size):
+            yield rows[start:start + batch_size]
+
+    def memory_usage(self) -> dict:
+        """
+        Estimate the memory held by the columns.
+
+        Returns:
+            dict: Row count and bytes used by the arrays, the string lists
+            and the distinct string objects.
+        """
+        with self._lock:
+            strings = {id(s): s for s in self.names}
+            strings.update({id(s): s for s in self.descriptions})
+            size = (sys.getsizeof(self.ids) + sys.getsizeof(self.prices)
+                    + sys.getsizeof(self.names)
+                    + sys.getsizeof(self.descriptions)
+                    + sum(sys.getsizeof(s) for s in strings.values()))
+            return {'rows': len(self.ids), 'bytes': size}
@@ -0,0 +1,514 @@
+"""
+Asynchronous product imports.
+
+POST /products/import streams the request body (a JSON array, JSON Lines,
+or CSV with a header line) to a spool file under IMPORT_DIR and answers
+202 with a job id straight away. A background thread then loads the file
+with the readers and validation of bulk_import.py, IMPORT_CHUNK_SIZE
+records per transaction, and GET /jobs/<id> reports its progress,
+throughput and the first rejected records.
+
+Each chunk is committed together with the progress of its job, in the
+products database, so a job interrupted by a restart resumes right after
+its last committed chunk without loading a record twice. The worker picks
+up unfinished jobs when it starts; a job still marked running by another
+process is only taken over once its heartbeat is IMPORT_STALE_SECONDS old.
+
+Unlike the offline bulk loader, jobs run next to live traffic, so the
+indexes and statistics triggers are kept during the load. Import jobs
+need the unsharded layout.
+"""
+import csv
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import bulk_import
+import database
+from cache import response_cache
+
+# Directory of the spooled uploads (default: imports/ next to the database)
+IMPORT_DIR = os.environ.get('IMPORT_DIR')
+
+# Records validated and committed per transaction
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 10000))
+
+# Seconds without progress after which a running job is taken over
+IMPORT_STALE_SECONDS = float(os.environ.get('IMPORT_STALE_SECONDS', 60))
+
+# Bytes read from the request body at a time
+SPOOL_CHUNK_SIZE = 64 * 1024
+
+# Accepted ?format= values and Content-Types, and the reader they use
+FORMATS = {'csv': 'csv', 'jsonl': 'jsonl', 'ndjson': 'jsonl', 'json': 'json'}
+CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'jsonl',
+    'application/jsonl': 'jsonl',
+    'application/json': 'json',
+}
+
+JOBS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS import_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    format TEXT NOT NULL,
+    upsert INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    path TEXT,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    total INTEGER,
+    records INTEGER NOT NULL DEFAULT 0,
+    written INTEGER NOT NULL DEFAULT 0,
+    rejected INTEGER NOT NULL DEFAULT 0,
+    errors TEXT NOT NULL DEFAULT '[]',
+    seconds REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    heartbeat REAL
+);
+'''
+
+
+def detect_format(requested: str, content_type: str) -> str:
+    """
+    Choose the reader for an upload.
+
+    Args:
+        requested (str): Value of the format query parameter, if any.
+        content_type (str): Content-Type of the request.
+
+    Returns:
+        str: 'csv', 'jsonl' or 'json'.
+
+    Raises:
+        ValueError: If the format is unknown or cannot be told.
+    """
+    if requested:
+        if requested not in FORMATS:
+            raise ValueError(f'Unsupported import format: {requested}')
+        return FORMATS[requested]
+    mimetype = (content_type or '').split(';')[0].strip().lower()
+    if mimetype not in CONTENT_TYPES:
+        raise ValueError(
+            'Set the format parameter or a Content-Type among: '
+            + ', '.join(CONTENT_TYPES))
+    return CONTENT_TYPES[mimetype]
+
+
+def import_dir() -> str:
+    return IMPORT_DIR or os.path.join(
+        os.path.dirname(os.path.abspath(database.DATABASE)), 'imports')
+
+
+def connect() -> sqlite3.Connection:
+    """
+    Open the products database holding the jobs.
+
+    Raises:
+        NotImplementedError: If the products are sharded.
+    """
+    paths = database.get_store().paths
+    if len(paths) != 1:
+        raise NotImplementedError(
+            'Import jobs need the unsharded layout, use bulk_import.py '
+            'and sharding.py reshard instead')
+    conn = sqlite3.connect(paths[0], timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(database.SCHEMA + JOBS_SCHEMA)
+    return conn
+
+
+def describe(row: sqlite3.Row) -> dict:
+    """
+    Build the public view of a job.
+
+    Returns:
+        dict: Status, progress (0 to 1, None when the total is unknown),
+        counts, throughput and the first rejected records.
+    """
+    if row['status'] == 'done':
+        progress = 1.0
+    elif row['total']:
+        progress = min(row['records'] / row['total'], 1.0)
+    else:
+        progress = None
+    return {
+        'id': row['id'],
+        'status': row['status'],
+        'format': row['format'],
+        'upsert': bool(row['upsert']),
+        'bytes': row['bytes'],
+        'total': row['total'],
+        'records': row['records'],
+        'progress': progress,
+        'written': row['written'],
+        'rejected': row['rejected'],
+        'errors': [{'record': number, 'error': error}
+                   for number, error in json.loads(row['errors'])],
+        'seconds': row['seconds'],
+        'rows_per_second': (
+            row['written'] / row['seconds'] if row['seconds'] else 0.0),
+        'message': row['message'],
+        'created': row['created'],
+        'started': row['started'],
+        'finished': row['finished'],
+    }
+
+
+def get_job(job_id: int) -> dict:
+    """
+    Look up a job.
+
+    Returns:
+        dict: The job from describe(), or None if it does not exist.
+    """
+    conn = connect()
+    try:
+        row = conn.execute(
+            'SELECT * FROM import_jobs WHERE id = ?', (job_id,)).fetchone()
+    finally:
+        conn.close()
+    return describe(row) if row is not None else None
+
+
+class Spool:
+    """
+    Upload being written to disk, queued as a job once complete.
+    """
+    def __init__(self, job_id: int, path: str, import_format: str):
+        self.job_id = job_id
+        self.path = path
+        self.format = import_format
+        self.size = 0
+        self.lines = 0
+        self.last_byte = b'\n'
+        self.file = open(path, 'wb')
+
+    def write(self, chunk: bytes) -> None:
+        self.file.write(chunk)
+        self.size += len(chunk)
+        self.lines += chunk.count(b'\n')
+        self.last_byte = chunk[-1:] or self.last_byte
+
+    def estimated_total(self):
+        """Records in the file, guessed from its lines (None for JSON)."""
+        if self.format == 'json':
+            return None
+        lines = self.lines + (self.last_byte != b'\n')
+        return max(lines - (self.format == 'csv'), 0)
+
+    def finish(self) -> dict:
+        """Queue the job and return it."""
+        self.file.close()
+        conn = connect()
+        try:
+            with conn:
+                conn.execute(
+                    "UPDATE import_jobs SET status = 'queued', bytes = ?, "
+                    "total = ? WHERE id = ?",
+                    (self.size, self.estimated_total(), self.job_id))
+        finally:
+            conn.close()
+        worker.submit(self.job_id)
+        return get_job(self.job_id)
+
+    def abort(self, message: str) -> None:
+        """Mark the job as failed and delete the partial upload."""
+        self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        conn = connect()
+        try:
+            with conn:
+                conn.execute(
+                    "UPDATE import_jobs SET status = 'failed', message = ?, "
+                    "finished = ? WHERE id = ?",
+                    (message, time.time(), self.job_id))
+        finally:
+            conn.close()
+
+
+def open_spool(import_format: str, upsert: bool = False) -> Spool:
+    """
+    Create a job and the file its upload is written to.
+
+    Args:
+        import_format (str): Reader from detect_format().
+        upsert (bool): Update products whose id already exists.
+
+    Returns:
+        Spool: Receives the request body, then finish() queues the job.
+    """
+    os.makedirs(import_dir(), exist_ok=True)
+    conn = connect()
+    try:
+        with conn:
+            job_id = conn.execute(
+                "INSERT INTO import_jobs (format, upsert, status, created) "
+                "VALUES (?, ?, 'uploading', ?)",
+                (import_format, int(upsert), time.time())).lastrowid
+            path = os.path.join(import_dir(), f'{job_id}.{import_format}')
+            conn.execute(
+                'UPDATE import_jobs SET path = ? WHERE id = ?', (path, job_id))
+    finally:
+        conn.close()
+    return Spool(job_id, path, import_format)
+
+
+def iter_json_array(file, chunk_size: int = SPOOL_CHUNK_SIZE):
+    """
+    Parse a JSON array element by element without loading the whole file.
+
+    Args:
+        file: Text file positioned at the start of the array.
+        chunk_size (int): Characters read at a time.
+
+    Yields:
+        tuple: The element number (1-based) and the element.
+
+    Raises:
+        ValueError: If the file is not a well-formed JSON array.
+    """
+    decoder = json.JSONDecoder()
+    buffer = file.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('Expected a JSON array')
+    buffer = buffer[1:]
+    number = 0
+    expect_value = True
+    while True:
+        buffer = buffer.lstrip()
+        if not buffer:
+            more = file.read(chunk_size)
+            if not more:
+                raise ValueError('Unterminated JSON array')
+            buffer = more
+            continue
+        if buffer[0] == ']' and (number == 0 or not expect_value):
+            return
+        if not expect_value:
+            if buffer[0] != ',':
+                raise ValueError(f'Expected "," after element {number}')
+            buffer = buffer[1:]
+            expect_value = True
+            continue
+        try:
+            element, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            more = file.read(chunk_size)
+            if not more:
+                raise ValueError(f'Invalid JSON in element {number + 1}')
+            buffer += more
+            continue
+        number += 1
+        expect_value = False
+        buffer = buffer[end:]
+        yield number, element
+
+
+def iter_job_records(path: str, import_format: str):
+    """Yield (record number, record) pairs of a spooled upload."""
+    if import_format == 'json':
+        with open(path, encoding='utf-8') as file:
+            yield from iter_json_array(file)
+        return
+    lines = bulk_import.open_lines(path)
+    try:
+        yield from bulk_import.iter_records(lines, import_format)
+    finally:
+        lines.close()
+
+
+def claim(conn: sqlite3.Connection, job_id: int) -> sqlite3.Row:
+    """
+    Mark a job as running by this process if nobody else is running it.
+
+    Returns:
+        sqlite3.Row: The job, or None if it is finished or taken.
+    """
+    now = time.time()
+    with conn:
+        cursor = conn.execute(
+            "UPDATE import_jobs SET status = 'running', "
+            "started = COALESCE(started, ?), heartbeat = ? "
+            "WHERE id = ? AND (status = 'queued' OR "
+            "(status = 'running' AND heartbeat < ?))",
+            (now, now, job_id, now - IMPORT_STALE_SECONDS))
+    if cursor.rowcount == 0:
+        return None
+    return conn.execute(
+        'SELECT * FROM import_jobs WHERE id = ?', (job_id,)).fetchone()
+
+
+def run_job(job_id: int, chunk_size: int = None) -> None:
+    """
+    Load a queued or interrupted job, resuming after its last chunk.
+
+    Args:
+        job_id (int): ID of the job.
+        chunk_size (int): Records per transaction, IMPORT_CHUNK_SIZE by
+            default.
+    """
+    conn = connect()
+    try:
+        job = claim(conn, job_id)
+        if job is None:
+            return
+        try:
+            load_job(conn, job, chunk_size or IMPORT_CHUNK_SIZE)
+        except sqlite3.IntegrityError as e:
+            fail(conn, job_id, f'{e}; retry with upsert=1 to update '
+                               'existing products')
+        except (ValueError, csv.Error, OSError, sqlite3.Error) as e:
+            fail(conn, job_id, str(e))
+        except Exception as e:
+            # Never leave a job claimed by a worker that gave up on it
+            logging.exception('Import job %s failed', job_id)
+            fail(conn, job_id, f'Internal error: {e!r}')
+    finally:
+        conn.close()
+    store = database.get_store()
+    if hasattr(store, 'reload'):
+        store.reload()
+
+
+def load_job(conn: sqlite3.Connection, job: sqlite3.Row,
+             chunk_size: int) -> None:
+    """Write the remaining records of a job, one transaction per chunk."""
+    conn.execute('PRAGMA journal_mode = WAL')
+    sql = bulk_import.UPSERT_SQL if job['upsert'] else bulk_import.INSERT_SQL
+    done = job['records']
+    written, rejected = job['written'], job['rejected']
+    errors = json.loads(job['errors'])
+    seconds = job['seconds']
+    records = iter_job_records(job['path'], job['format'])
+    try:
+        start = time.perf_counter()
+        # Records up to the last committed chunk were loaded before a restart
+        remaining = (record for record in records if record[0] > done)
+        for batch in bulk_import.iter_batches(remaining, chunk_size):
+            rows, batch_errors = bulk_import.validate_batch(batch)
+            space = bulk_import.MAX_REPORTED_ERRORS - len(errors)
+            errors.extend(batch_errors[:max(space, 0)])
+            written += len(rows)
+            rejected += len(batch_errors)
+            now = time.perf_counter()
+            seconds += now - start
+            start = now
+            with conn:
+                conn.executemany(sql, rows)
+                conn.execute(
+                    'UPDATE import_jobs SET records = ?, written = ?, '
+                    'rejected = ?, errors = ?, seconds = ?, heartbeat = ? '
+                    'WHERE id = ?',
+                    (batch[-1][0], written, rejected, json.dumps(errors),
+                     seconds, time.time(), job['id']))
+            response_cache.invalidate()
+    finally:
+        records.close()
+    with conn:
+        conn.execute(
+            "UPDATE import_jobs SET status = 'done', total = records, "
+            "finished = ? WHERE id = ?", (time.time(), job['id']))
+    os.remove(job['path'])
+
+
+def fail(conn: sqlite3.Connection, job_id: int, message: str) -> None:
+    """Mark a job as failed; the chunks already committed are kept."""
+    conn.rollback()
+    with conn:
+        conn.execute(
+            "UPDATE import_jobs SET status = 'failed', message = ?, "
+            "finished = ? WHERE id = ?", (message, time.time(), job_id))
+    response_cache.invalidate()
+
+
+def pending_jobs() -> tuple:
+    """
+    Find the jobs to resume.
+
+    Returns:
+        tuple: IDs of queued and stale running jobs, and whether other
+        running jobs may need to be taken over later.
+    """
+    conn = connect()
+    try:
+        stale = time.time() - IMPORT_STALE_SECONDS
+        rows = conn.execute(
+            "SELECT id, status, heartbeat FROM import_jobs "
+            "WHERE status IN ('queued', 'running') ORDER BY id").fetchall()
+    finally:
+        conn.close()
+    ready = [row['id'] for row in rows
+             if row['status'] == 'queued' or row['heartbeat'] < stale]
+    return ready, len(ready) < len(rows)
+
+
+class ImportWorker:
+    """
+    Background thread running the import jobs one after the other.
+    """
+    def __init__(self):
+        self.queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._watch = False
+
+    @property
+    def started(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        """Start the thread and queue the unfinished jobs, once."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._loop, name='import-jobs', daemon=True)
+            self._thread.start()
+        self.resume()
+
+    def resume(self) -> None:
+        try:
+            ready, self._watch = pending_jobs()
+        except (NotImplementedError, sqlite3.Error):
+            return
+        for job_id in ready:
+            self.queue.put(job_id)
+
+    def submit(self, job_id: int) -> None:
+        self.start()
+        self.queue.put(job_id)
+
+    def _loop(self) -> None:
+        while True:
+            # Poll again only while other processes are running jobs
+            try:
+                job_id = self.queue.get(
+                    timeout=IMPORT_STALE_SECONDS if self._watch else None)
+            except queue.Empty:
+                self.resume()
+                continue
+            try:
+                run_job(job_id)
+            except Exception:
+                logging.exception('Import job %s failed', job_id)
+            finally:
+                self.queue.task_done()
+
+
+worker = ImportWorker()
+
+
+def install(app) -> None:
+    """Start the worker of a Flask application with its first request."""
+    @app.before_request
+    def start_import_worker():
+        if not worker.started:
+            worker.start()
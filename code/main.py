@@ -1,9 +1,10 @@
 from api_operations import (
     create_product, 
-    get_products, 
-    update_product, 
+    get_products_frame,
+    patch_product,
     delete_product)
 
+import client_stats
 from utilities import (
     check_api_with_retries,
     log_error_to_file,
@@ -40,13 +41,14 @@ def operation() -> None:
             if new_product:
                 create_product(new_product)
         elif choice == 2:
-            products = get_products()
-            if type(products) == list:
+            products = get_products_frame()
+            if products is not False:
                 print_data(products)
         elif choice == 3:
             product_to_update = get_updated_product_info()
             if product_to_update:
-                update_product(product_to_update)
+                product_id = product_to_update.pop('product_id')
+                patch_product(product_id, product_to_update)
         elif choice == 4:
             product_to_delete = get_product_to_delete()
             if product_to_delete:
@@ -58,7 +60,9 @@ def operation() -> None:
 def main():
     """Main function to check API availability and execute operations."""
     if check_api_with_retries():
-        operation()
+        # Prints or saves the call statistics when CLIENT_STATS is set
+        with client_stats.session():
+            operation()
     else:
         print('API is not available. Exiting program.')
 
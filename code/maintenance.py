@@ -0,0 +1,354 @@
+"""
+Background maintenance of the products databases.
+
+Disabled unless MAINTENANCE_ENABLED=1, in which case a daemon thread wakes
+every MAINTENANCE_INTERVAL seconds and visits each database file of the
+store (every shard when sharded):
+
+- checkpoint_passive: a PASSIVE WAL checkpoint, which never waits for
+  readers or writers, on every wake-up,
+- optimize: PRAGMA optimize, or a full ANALYZE the first time, once every
+  MAINTENANCE_OPTIMIZE_INTERVAL seconds while idle,
+- incremental_vacuum: returns up to MAINTENANCE_VACUUM_PAGES free pages
+  left by deletes to the file system, on every wake-up while idle,
+- checkpoint_truncate: a TRUNCATE checkpoint that also empties the -wal
+  file, including what the previous tasks wrote, on every wake-up while
+  idle.
+
+The server counts as idle when no request is in flight and none finished in
+the last MAINTENANCE_IDLE_SECONDS. Idle-only tasks are deferred while the
+server is busy, but run anyway once they are MAINTENANCE_MAX_DEFER seconds
+overdue, so constant traffic cannot postpone them forever.
+
+Incremental vacuum needs auto_vacuum=INCREMENTAL, which database.SCHEMA
+sets for new files. Existing files are converted once, while the servers
+are stopped, with:
+
+    python maintenance.py enable-incremental-vacuum
+
+GET /maintenance reports the last runs, their durations, the space
+reclaimed and the current size of every file.
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import database
+
+MAINTENANCE_ENABLED = os.environ.get('MAINTENANCE_ENABLED', '0') == '1'
+MAINTENANCE_INTERVAL = float(os.environ.get('MAINTENANCE_INTERVAL', 60))
+MAINTENANCE_IDLE_SECONDS = float(
+    os.environ.get('MAINTENANCE_IDLE_SECONDS', 5))
+MAINTENANCE_OPTIMIZE_INTERVAL = float(
+    os.environ.get('MAINTENANCE_OPTIMIZE_INTERVAL', 3600))
+MAINTENANCE_VACUUM_PAGES = int(
+    os.environ.get('MAINTENANCE_VACUUM_PAGES', 1000))
+MAINTENANCE_MAX_DEFER = float(os.environ.get('MAINTENANCE_MAX_DEFER', 3600))
+
+# Seconds a task waits for a lock held by a request before giving up
+BUSY_TIMEOUT = 1.0
+
+# Value of PRAGMA auto_vacuum for INCREMENTAL
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def file_size(path: str) -> int:
+    """Return the size of a file, 0 if it does not exist."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def disk_usage(path: str) -> int:
+    """Return the bytes used by a database and its WAL file."""
+    return file_size(path) + file_size(path + '-wal')
+
+
+def checkpoint(conn: sqlite3.Connection, mode: str) -> dict:
+    """
+    Copy the WAL into the database file.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the database.
+        mode (str): PASSIVE or TRUNCATE.
+
+    Returns:
+        dict: Whether the checkpoint was blocked, the pages in the WAL and
+        the pages checkpointed (-1 when the database is not in WAL mode).
+    """
+    busy, wal_pages, checkpointed = conn.execute(
+        f'PRAGMA wal_checkpoint({mode})').fetchone()
+    return {'busy': bool(busy), 'wal_pages': wal_pages,
+            'checkpointed_pages': checkpointed}
+
+
+def optimize(conn: sqlite3.Connection) -> dict:
+    """
+    Refresh the statistics used by the query planner.
+
+    Returns:
+        dict: Whether a full ANALYZE was needed.
+    """
+    analyzed = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()
+    if analyzed is None:
+        conn.execute('ANALYZE')
+    else:
+        conn.execute('PRAGMA optimize')
+    conn.commit()
+    return {'full_analyze': analyzed is None}
+
+
+def incremental_vacuum(conn: sqlite3.Connection, pages: int) -> dict:
+    """
+    Release free pages at the end of the database file.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the database.
+        pages (int): Maximum number of pages to release.
+
+    Returns:
+        dict: Pages released and still free, or why nothing was done.
+    """
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != (
+            AUTO_VACUUM_INCREMENTAL):
+        return {'skipped': 'auto_vacuum is not INCREMENTAL'}
+    before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    conn.execute(f'PRAGMA incremental_vacuum({int(pages)})').fetchall()
+    after = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    return {'freed_pages': before - after, 'free_pages': after}
+
+
+class Maintainer:
+    """
+    Runs the maintenance tasks on a schedule and keeps their results.
+    """
+    def __init__(self, interval: float = MAINTENANCE_INTERVAL,
+                 idle_seconds: float = MAINTENANCE_IDLE_SECONDS,
+                 optimize_interval: float = MAINTENANCE_OPTIMIZE_INTERVAL,
+                 vacuum_pages: int = MAINTENANCE_VACUUM_PAGES,
+                 max_defer: float = MAINTENANCE_MAX_DEFER):
+        self.interval = interval
+        self.idle_seconds = idle_seconds
+        self.max_defer = max_defer
+        # Name, function, whether it waits for idle time, period
+        self.schedule = [
+            ('checkpoint_passive', lambda c: checkpoint(c, 'PASSIVE'),
+             False, interval),
+            ('optimize', optimize, True, optimize_interval),
+            ('incremental_vacuum',
+             lambda c: incremental_vacuum(c, vacuum_pages), True, interval),
+            ('checkpoint_truncate', lambda c: checkpoint(c, 'TRUNCATE'),
+             True, interval),
+        ]
+        started = time.monotonic()
+        self.tasks = {
+            name: {'runs': 0, 'deferred': 0, 'last_run': None,
+                   'last_seconds': None, 'last_error': None,
+                   'last_result': None, 'next_due': started}
+            for name, _, _, _ in self.schedule}
+        self.reclaimed_bytes = 0
+        self.in_flight = 0
+        self.last_request = float('-inf')
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def request_started(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.last_request = time.monotonic()
+
+    def idle(self) -> bool:
+        """Return True when no request ran in the last idle_seconds."""
+        with self._lock:
+            return self.in_flight == 0 and (
+                time.monotonic() - self.last_request >= self.idle_seconds)
+
+    def start(self) -> None:
+        """Start the maintenance thread if it is not running."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._loop, name='maintenance', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the maintenance thread and wait for the current run."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                logging.exception('Database maintenance failed')
+
+    def run_once(self, paths: list = None) -> None:
+        """
+        Run every task that is due, deferring idle-only tasks under load.
+
+        Args:
+            paths (list): Database files, by default those of the store.
+        """
+        paths = paths or database.get_store().paths
+        idle = self.idle()
+        for name, function, idle_only, period in self.schedule:
+            task = self.tasks[name]
+            now = time.monotonic()
+            if now < task['next_due']:
+                continue
+            if idle_only and not idle and (
+                    now - task['next_due'] < self.max_defer):
+                task['deferred'] += 1
+                continue
+            self._run(task, function, paths)
+            task['next_due'] = time.monotonic() + period
+
+    def _run(self, task: dict, function, paths: list) -> None:
+        """Run a task on every file and record its result."""
+        started = time.perf_counter()
+        results = {}
+        error = None
+        for path in paths:
+            before = disk_usage(path)
+            try:
+                conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+                try:
+                    results[path] = function(conn)
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                error = f'{path}: {e}'
+                continue
+            reclaimed = max(0, before - disk_usage(path))
+            results[path]['reclaimed_bytes'] = reclaimed
+            with self._lock:
+                self.reclaimed_bytes += reclaimed
+        task.update(
+            runs=task['runs'] + 1, last_run=time.time(),
+            last_seconds=time.perf_counter() - started,
+            last_error=error, last_result=results)
+
+    def status(self) -> dict:
+        """
+        Describe the schedule, the last runs and the database files.
+
+        Returns:
+            dict: Whether the thread runs, the load, the bytes reclaimed so
+            far, the state of each task and the size of each file.
+        """
+        tasks = {
+            name: {key: value for key, value in task.items()
+                   if key != 'next_due'}
+            for name, task in self.tasks.items()}
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'idle': self.idle(),
+            'in_flight': self.in_flight,
+            'reclaimed_bytes': self.reclaimed_bytes,
+            'tasks': tasks,
+            'databases': [
+                database_status(path)
+                for path in database.get_store().paths],
+        }
+
+
+def database_status(path: str) -> dict:
+    """Return the size, WAL size and free pages of a database file."""
+    status = {'path': path, 'size_bytes': file_size(path),
+              'wal_bytes': file_size(path + '-wal')}
+    try:
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        try:
+            status['free_pages'] = conn.execute(
+                'PRAGMA freelist_count').fetchone()[0]
+            status['incremental_vacuum'] = conn.execute(
+                'PRAGMA auto_vacuum').fetchone()[0] == AUTO_VACUUM_INCREMENTAL
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        status['error'] = str(e)
+    return status
+
+
+def enable_incremental_vacuum(path: str) -> None:
+    """
+    Switch an existing database to auto_vacuum=INCREMENTAL.
+
+    This rewrites the whole file with VACUUM and holds an exclusive lock
+    meanwhile, so run it while the servers are stopped.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(f'PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}')
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+
+
+maintainer = Maintainer()
+
+
+def install(app) -> None:
+    """
+    Track the requests of a Flask application and start the thread.
+
+    Does nothing unless MAINTENANCE_ENABLED is set.
+    """
+    if not MAINTENANCE_ENABLED:
+        return
+    from flask import g
+
+    @app.before_request
+    def count_request():
+        g.maintenance_counted = True
+        maintainer.request_started()
+
+    @app.teardown_request
+    def uncount_request(error=None):
+        if g.pop('maintenance_counted', False):
+            maintainer.request_finished()
+
+    maintainer.start()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Maintain the products databases.')
+    parser.add_argument('command', choices=['run', 'enable-incremental-vacuum'])
+    parser.add_argument('--database', default=None,
+                        help='Path of products.db (default: PRODUCTS_DB)')
+    args = parser.parse_args()
+
+    if args.database:
+        database.DATABASE = args.database
+    paths = database.get_store().paths
+    if args.command == 'enable-incremental-vacuum':
+        for path in paths:
+            enable_incremental_vacuum(path)
+            print(f'{path}: incremental vacuum enabled')
+        return
+    # Run every task once, as if the server were idle and they were due
+    once = Maintainer(max_defer=0)
+    once.run_once(paths)
+    for name, task in once.tasks.items():
+        print(f'{name}: {task["last_seconds"]:.3f} s '
+              f'{task["last_error"] or ""}'.rstrip())
+    print(f'Reclaimed {once.reclaimed_bytes:,} bytes')
+
+
+if __name__ == '__main__':
+    main()
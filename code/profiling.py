@@ -0,0 +1,288 @@
+"""
+On-demand per-request profiling for the Flask application.
+
+Disabled unless PROFILE_ENABLED=1, in which case install() registers the
+request hooks; when disabled nothing is registered and requests pay
+nothing. When enabled, a request is profiled if it sends the header
+"X-Profile: 1" or is picked at random with probability
+PROFILE_SAMPLE_RATE. Each profile records:
+
+- the top PROFILE_TOP_N functions of a cProfile run of the view,
+- every SQLite statement run by the request thread, captured with
+  set_trace_callback() and timed until the next statement on the same
+  connection starts or the connection is closed, which database.py does
+  as soon as the store operation returns and before the rows are encoded,
+- the time spent in serialization.py.
+
+Only one request is profiled at a time: from Python 3.12 cProfile runs on
+sys.monitoring, which accepts a single profiler per process. Requests
+asking for a profile while another one runs are served unprofiled.
+
+The last PROFILE_KEEP profiles are served by GET /debug/profiles and
+GET /debug/profiles/<id>, and also written to PROFILE_DIR when it is set,
+keeping the newest PROFILE_KEEP files.
+"""
+import collections
+import cProfile
+import itertools
+import json
+import os
+import pstats
+import random
+import threading
+import time
+
+import database
+
+PROFILE_ENABLED = os.environ.get('PROFILE_ENABLED', '0') == '1'
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_TOP_N = int(os.environ.get('PROFILE_TOP_N', 25))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 50))
+PROFILE_DIR = os.environ.get('PROFILE_DIR')
+
+SERIALIZATION_FILE = 'serialization.py'
+
+_local = threading.local()
+_ids = itertools.count(1)
+_lock = threading.Lock()
+# Held by the request being profiled
+_active = threading.Lock()
+profiles = collections.deque(maxlen=PROFILE_KEEP)
+
+
+class RequestProfile:
+    """
+    Data collected while one request is profiled.
+    """
+    def __init__(self, method: str, path: str):
+        self.id = next(_ids)
+        self.method = method
+        self.path = path
+        self.started = time.time()
+        self.profiler = cProfile.Profile()
+        self.statements = []
+        self._open = {}
+        self._start = time.perf_counter()
+        self.seconds = None
+
+    def trace(self, conn, sql: str) -> None:
+        """Record a statement, closing the previous one on the connection."""
+        now = time.perf_counter()
+        self._close_statement(conn, now)
+        statement = {'sql': sql, 'seconds': None}
+        self.statements.append(statement)
+        self._open[conn] = (statement, now)
+
+    def close(self, conn) -> None:
+        """Close the statement still open on a connection being closed."""
+        self._close_statement(conn, time.perf_counter())
+
+    def _close_statement(self, conn, now: float) -> None:
+        previous = self._open.pop(conn, None)
+        if previous is not None:
+            statement, started = previous
+            statement['seconds'] = now - started
+
+    def finish(self) -> None:
+        """Stop profiling and close the statements still open."""
+        self.profiler.disable()
+        now = time.perf_counter()
+        for statement, started in self._open.values():
+            statement['seconds'] = now - started
+        self._open.clear()
+        self.seconds = now - self._start
+
+    def report(self) -> dict:
+        """
+        Summarize the profile.
+
+        Returns:
+            dict: Timings, the top functions and the SQLite statements.
+        """
+        stats = pstats.Stats(self.profiler)
+        entries = sorted(
+            stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'started': self.started,
+            'seconds': self.seconds,
+            'sql_seconds': sum(
+                s['seconds'] or 0.0 for s in self.statements),
+            'serialization_seconds': serialization_seconds(stats.stats),
+            'statements': self.statements,
+            'functions': [
+                {'function': pstats.func_std_string(function),
+                 'calls': calls, 'tottime': tottime, 'cumtime': cumtime}
+                for function, (_, calls, tottime, cumtime, _)
+                in entries[:PROFILE_TOP_N]],
+        }
+
+
+def serialization_seconds(stats: dict) -> float:
+    """
+    Time spent in serialization.py, counted once per outside call.
+
+    Args:
+        stats (dict): pstats.Stats.stats of a profile.
+
+    Returns:
+        float: Cumulative seconds of serialization functions, only through
+        callers outside serialization.py so nested calls are not counted
+        twice.
+    """
+    total = 0.0
+    for function, (_, _, _, _, callers) in stats.items():
+        if not function[0].endswith(SERIALIZATION_FILE):
+            continue
+        for caller, (_, _, _, cumtime) in callers.items():
+            if not caller[0].endswith(SERIALIZATION_FILE):
+                total += cumtime
+    return total
+
+
+def _attach(conn) -> None:
+    """Connection hook tracing statements of the profiled thread."""
+    profile = getattr(_local, 'profile', None)
+    if profile is not None:
+        conn.set_trace_callback(lambda sql: profile.trace(conn, sql))
+
+
+def _detach(conn) -> None:
+    """Disconnect hook ending the last statement traced on conn."""
+    profile = getattr(_local, 'profile', None)
+    if profile is not None:
+        profile.close(conn)
+
+
+def start(method: str, path: str) -> RequestProfile:
+    """
+    Start profiling the current thread.
+
+    Returns:
+        RequestProfile: The profile, or None when another request is being
+        profiled or another profiler is active.
+    """
+    if not _active.acquire(blocking=False):
+        return None
+    profile = RequestProfile(method, path)
+    try:
+        profile.profiler.enable()
+    except ValueError:
+        _active.release()
+        return None
+    _local.profile = profile
+    return profile
+
+
+def stop() -> dict:
+    """
+    Stop profiling the current thread and store the report.
+
+    Returns:
+        dict: The report, or None if the thread was not profiled.
+    """
+    profile = getattr(_local, 'profile', None)
+    if profile is None:
+        return None
+    _local.profile = None
+    try:
+        profile.finish()
+    finally:
+        _active.release()
+    report = profile.report()
+    profiles.append(report)
+    if PROFILE_DIR:
+        dump(profile, report)
+    return report
+
+
+def dump(profile: RequestProfile, report: dict) -> None:
+    """
+    Write a profile to PROFILE_DIR and delete the oldest files.
+
+    Args:
+        profile (RequestProfile): The finished profile.
+        report (dict): Its report.
+    """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = os.path.join(
+        PROFILE_DIR, f'{int(profile.started * 1000)}-{profile.id}')
+    with open(name + '.json', 'w') as file:
+        json.dump(report, file, indent=2)
+    profile.profiler.dump_stats(name + '.pstats')
+    with _lock:
+        reports = sorted(
+            f for f in os.listdir(PROFILE_DIR) if f.endswith('.json'))
+        for old in reports[:-PROFILE_KEEP or None]:
+            for extension in ('.json', '.pstats'):
+                path = os.path.join(PROFILE_DIR, old[:-5] + extension)
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def should_profile(header: str) -> bool:
+    """
+    Decide whether to profile a request.
+
+    Args:
+        header (str): Value of the X-Profile request header.
+
+    Returns:
+        bool: True when asked by the header or picked by the sampling rate.
+    """
+    if header == '1':
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def install(app) -> None:
+    """
+    Register the profiling hooks and debug routes on a Flask application.
+
+    Does nothing unless PROFILE_ENABLED is set.
+    """
+    if not PROFILE_ENABLED:
+        return
+    from flask import abort, jsonify, request
+
+    database.CONNECTION_HOOKS.append(_attach)
+    database.DISCONNECT_HOOKS.append(_detach)
+
+    @app.before_request
+    def start_profile():
+        if should_profile(request.headers.get('X-Profile')):
+            start(request.method, request.path)
+
+    @app.after_request
+    def stop_profile(response):
+        report = stop()
+        if report is not None:
+            response.headers['X-Profile-Id'] = str(report['id'])
+            response.headers['Server-Timing'] = (
+                f"total;dur={report['seconds'] * 1000:.2f}, "
+                f"sql;dur={report['sql_seconds'] * 1000:.2f}, "
+                f"serialize;dur={report['serialization_seconds'] * 1000:.2f}")
+        return response
+
+    @app.teardown_request
+    def discard_profile(error=None):
+        # Ends profiles of requests that failed before after_request
+        if getattr(_local, 'profile', None) is not None:
+            stop()
+
+    @app.route('/debug/profiles', methods=['GET'])
+    def list_profiles():
+        return jsonify([
+            {key: report[key] for key in
+             ('id', 'method', 'path', 'started', 'seconds', 'sql_seconds',
+              'serialization_seconds')}
+            for report in list(profiles)])
+
+    @app.route('/debug/profiles/<int:profile_id>', methods=['GET'])
+    def get_profile(profile_id):
+        for report in list(profiles):
+            if report['id'] == profile_id:
+                return jsonify(report)
+        abort(404)
@@ -0,0 +1,63 @@
+"""
+JSON encoding of query results.
+
+Rows are read from the cursor as plain tuples and paired with column keys
+computed once per query, which avoids building a sqlite3.Row and then a
+dict through the mapping protocol for every row. orjson is used when it is
+installed; otherwise the stdlib encoder produces compact output.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(data) -> bytes:
+    """
+    Encode a JSON document.
+
+    Args:
+        data: JSON serializable object.
+
+    Returns:
+        bytes: Compact UTF-8 encoded JSON.
+    """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':')).encode()
+
+
+def query_rows(conn, sql: str, params: tuple = ()) -> tuple:
+    """
+    Run a query returning rows as tuples, whatever the connection's
+    row_factory.
+
+    Args:
+        conn (sqlite3.Connection): Open connection to the database.
+        sql (str): SELECT statement.
+        params (tuple): Query parameters.
+
+    Returns:
+        tuple: The column names and the list of row tuples.
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(sql, params)
+    keys = tuple(column[0] for column in cursor.description)
+    return keys, cursor.fetchall()
+
+
+def encode_rows(keys: tuple, rows: list) -> bytes:
+    """
+    Encode rows as a JSON array of objects.
+
+    Args:
+        keys (tuple): Column names, in row order.
+        rows (list): Row tuples.
+
+    Returns:
+        bytes: The encoded JSON array.
+    """
+    return dumps([dict(zip(keys, row)) for row in rows])
@@ -0,0 +1,308 @@
+"""
+Hash-sharded product storage across several SQLite files.
+
+SQLite allows a single writer per file, so spreading the products over N
+files lets N writes proceed at once. A product lives in shard id % N:
+point reads, updates and deletes open one file, while listing, statistics
+and exports query every shard in parallel and merge the results in id
+order. New products go to the shards in turn, and each shard only hands
+out ids congruent to its index modulo N, above any id it has ever used,
+which keeps ids globally unique without a shared sequence. Each process
+also allocates above the highest id it has seen, so ids keep growing in
+insertion order across shards.
+
+Enable it with PRODUCTS_SHARDS=N. Shards are stored next to PRODUCTS_DB
+as products-0-of-N.db, products-1-of-N.db, ... and a catalog is moved
+between layouts with the reshard command:
+
+    python sharding.py reshard --from-shards 0 --to-shards 4
+"""
+import argparse
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+
+import database
+import stats
+
+# Rows copied per transaction by the reshard command
+RESHARD_CHUNK_SIZE = 50000
+
+
+def shard_paths(path: str, count: int) -> list:
+    """
+    Build the file names of a sharded layout.
+
+    Args:
+        path (str): Path of the unsharded database, e.g. products.db.
+        count (int): Number of shards; 0 or 1 means the unsharded file.
+
+    Returns:
+        list: One path per shard.
+    """
+    if count <= 1:
+        return [path]
+    root, extension = os.path.splitext(path)
+    return [f'{root}-{index}-of-{count}{extension}' for index in range(count)]
+
+
+def last_used_id(conn: sqlite3.Connection) -> int:
+    """Return the largest id ever used in a database, deleted or not."""
+    return conn.execute(
+        "SELECT MAX("
+        "COALESCE((SELECT seq FROM sqlite_sequence "
+        "WHERE name = 'products'), 0), "
+        "COALESCE((SELECT MAX(id) FROM products), 0))").fetchone()[0]
+
+
+def insert_allocated(conn: sqlite3.Connection, product: dict,
+                     count: int, index: int, floor: int = 0) -> int:
+    """
+    Insert a product with the next id belonging to a shard.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the shard.
+        product (dict): Product with name, price and description.
+        count (int): Number of shards.
+        index (int): Index of this shard.
+        floor (int): Allocate above this id too, so ids keep growing
+            across shards in insertion order.
+
+    Returns:
+        int: The allocated id, congruent to index modulo count.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        first_free = max(last_used_id(conn), floor) + 1
+        product_id = first_free + (index - first_free) % count
+        conn.execute(
+            'INSERT INTO products (id, name, price, description) '
+            'VALUES (?, ?, ?, ?)',
+            (product_id, product['name'], product['price'],
+             product['description']))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return product_id
+
+
+def merge_stats(shard_stats: list) -> dict:
+    """
+    Combine the statistics of every shard.
+
+    Args:
+        shard_stats (list): Results of stats.read_stats() per shard, all
+            installed with the same bucket width.
+
+    Returns:
+        dict: Statistics of the whole catalog.
+    """
+    count = sum(item['count'] for item in shard_stats)
+    price_sum = sum(item['sum'] for item in shard_stats)
+    minimums = [item['min'] for item in shard_stats if item['count']]
+    maximums = [item['max'] for item in shard_stats if item['count']]
+    buckets = {}
+    for item in shard_stats:
+        for bucket in item['histogram']:
+            key = (bucket['min'], bucket['max'])
+            buckets[key] = buckets.get(key, 0) + bucket['count']
+    return {
+        'count': count,
+        'sum': price_sum,
+        'min': min(minimums, default=None),
+        'max': max(maximums, default=None),
+        'avg': price_sum / count if count else None,
+        'bucket_width': shard_stats[0]['bucket_width'],
+        'histogram': [
+            {'min': low, 'max': high, 'count': bucket_count}
+            for (low, high), bucket_count in sorted(buckets.items())],
+    }
+
+
+def merge_batches(generators: list):
+    """Merge batch generators, each in id order, into one row iterator."""
+    streams = [itertools.chain.from_iterable(g) for g in generators]
+    return heapq.merge(*streams, key=itemgetter(0))
+
+
+def regroup(rows, batch_size: int):
+    """Group an iterator of rows into lists of at most batch_size rows."""
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+class ShardedStore:
+    """
+    Products spread across several SQLite files by id.
+
+    Offers the same methods as database.SQLiteStore.
+    """
+    def __init__(self, paths: list):
+        self.shards = [database.SQLiteStore(path) for path in paths]
+        self._turn = itertools.count()
+        self._turn_lock = threading.Lock()
+        # Highest id this process has seen, loaded on the first insert
+        self._last_id = None
+        self._pool = ThreadPoolExecutor(
+            max_workers=len(paths), thread_name_prefix='shard')
+        for shard in self.shards:
+            shard.run(lambda conn: conn.executescript(database.SCHEMA))
+
+    @property
+    def paths(self) -> list:
+        """Database files holding the products."""
+        return [shard.path for shard in self.shards]
+
+    def shard_for(self, product_id: int):
+        """Return the shard holding a product id."""
+        return self.shards[product_id % len(self.shards)]
+
+    def fan_out(self, method: str, *args) -> list:
+        """Call a store method on every shard in parallel."""
+        return list(self._pool.map(
+            lambda shard: getattr(shard, method)(*args), self.shards))
+
+    def fetch_products(self) -> tuple:
+        results = self.fan_out('fetch_products')
+        keys = results[0][0]
+        rows = list(heapq.merge(
+            *(rows for _, rows in results), key=itemgetter(0)))
+        return keys, rows
+
+    def fetch_product(self, product_id: int) -> dict:
+        return self.shard_for(product_id).fetch_product(product_id)
+
+    def filter_products(self, filters: dict) -> tuple:
+        results = self.fan_out('filter_products', filters)
+        keys = results[0][0]
+        rows = list(heapq.merge(
+            *(rows for _, rows in results), key=itemgetter(0)))
+        return keys, rows
+
+    def insert_product(self, product: dict) -> int:
+        with self._turn_lock:
+            if self._last_id is None:
+                self._last_id = max(self.fan_out('run', last_used_id))
+            index = next(self._turn) % len(self.shards)
+            floor = self._last_id
+        product_id = self.shards[index].run(
+            insert_allocated, product, len(self.shards), index, floor)
+        with self._turn_lock:
+            self._last_id = max(self._last_id, product_id)
+        return product_id
+
+    def update_product(self, product_id: int, product: dict) -> bool:
+        return self.shard_for(product_id).update_product(product_id, product)
+
+    def patch_product(self, product_id: int, changes: dict) -> tuple:
+        return self.shard_for(product_id).patch_product(product_id, changes)
+
+    def delete_product(self, product_id: int) -> bool:
+        return self.shard_for(product_id).delete_product(product_id)
+
+    def read_stats(self) -> dict:
+        return merge_stats(self.fan_out('read_stats'))
+
+    def iter_batches(self, batch_size: int):
+        """Stream every shard merged in id order, in batches of rows."""
+        generators = [shard.iter_batches(batch_size) for shard in self.shards]
+        try:
+            yield from regroup(merge_batches(generators), batch_size)
+        finally:
+            for generator in generators:
+                generator.close()
+
+
+def reshard(path: str, from_shards: int, to_shards: int,
+            chunk_size: int = RESHARD_CHUNK_SIZE, progress=print) -> int:
+    """
+    Copy every product from one layout into a new one.
+
+    Args:
+        path (str): Path of the unsharded database the layouts derive from.
+        from_shards (int): Number of shards of the current layout.
+        to_shards (int): Number of shards of the new layout.
+        chunk_size (int): Rows copied per transaction.
+        progress (callable): Receives a progress line per chunk.
+
+    Returns:
+        int: Number of products copied.
+
+    The source files are left untouched; restart the servers with
+    PRODUCTS_SHARDS set to the new count once the copy is done.
+    """
+    sources = [database.SQLiteStore(p) for p in shard_paths(path, from_shards)]
+    targets = shard_paths(path, to_shards)
+    for target in targets:
+        if os.path.exists(target):
+            raise FileExistsError(f'{target} already exists')
+
+    # Never reuse an id handed out by the old layout, even if deleted
+    last_id = max(source.run(last_used_id) for source in sources)
+    connections = [sqlite3.connect(target) for target in targets]
+    generators = [source.iter_batches(chunk_size) for source in sources]
+    copied = 0
+    try:
+        for conn in connections:
+            conn.executescript(database.SCHEMA)
+        for batch in regroup(merge_batches(generators), chunk_size):
+            for index, conn in enumerate(connections):
+                conn.executemany(
+                    'INSERT INTO products (id, name, price, description) '
+                    'VALUES (?, ?, ?, ?)',
+                    [row for row in batch
+                     if row[0] % len(connections) == index])
+            for conn in connections:
+                conn.commit()
+            copied += len(batch)
+            progress(f'{copied:,} products copied')
+        for conn in connections:
+            conn.execute(
+                "UPDATE sqlite_sequence SET seq = MAX(seq, ?) "
+                "WHERE name = 'products'", (last_id,))
+            conn.execute(
+                "INSERT INTO sqlite_sequence (name, seq) SELECT 'products', ? "
+                "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence "
+                "WHERE name = 'products')", (last_id,))
+            conn.commit()
+            stats.install_stats(conn)
+    finally:
+        for generator in generators:
+            generator.close()
+        for conn in connections:
+            conn.close()
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Move the products catalog between shard layouts.')
+    parser.add_argument('command', choices=['reshard'])
+    parser.add_argument('--database', default=None,
+                        help='Path of products.db (default: PRODUCTS_DB)')
+    parser.add_argument('--from-shards', type=int, default=database.SHARDS)
+    parser.add_argument('--to-shards', type=int, required=True)
+    parser.add_argument('--chunk-size', type=int, default=RESHARD_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    path = args.database or database.DATABASE
+    try:
+        copied = reshard(path, args.from_shards, args.to_shards,
+                         args.chunk_size)
+    except FileExistsError as e:
+        print(f'Error: {e}. Remove the target layout first.')
+        return
+    print(f'Copied {copied:,} products into '
+          f'{", ".join(shard_paths(path, args.to_shards))}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Coalescing of identical concurrent reads.
+
+The first caller for a key runs the work; callers arriving while it is in
+flight wait for its result instead of repeating the query and the
+serialization. Nothing is remembered once the call finishes, caching is
+left to cache.py. Keys should include the cache generation so a request
+arriving after a write never joins a read started before it.
+"""
+import asyncio
+import threading
+
+
+class _Call:
+    """
+    A call in flight, shared by its leader and the threads waiting on it.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time, from threads or coroutines.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._futures = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, function):
+        """
+        Run function, or wait for the identical call already in flight.
+
+        Args:
+            key: Hashable identifier of the work.
+            function (callable): Zero-argument function doing the work.
+
+        Returns:
+            The result of the call, shared by every coalesced caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def do_async(self, key, function):
+        """
+        Coroutine version of do() for the ASGI server.
+
+        Args:
+            key: Hashable identifier of the work.
+            function (callable): Zero-argument function returning an
+                awaitable that does the work.
+
+        Returns:
+            The result of the call, shared by every coalesced caller.
+        """
+        future = self._futures.get(key)
+        while future is not None:
+            with self._lock:
+                self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    # This caller was cancelled, not the leader
+                    raise
+            # The leader went away, e.g. its client disconnected: join the
+            # next call in flight or run the work here
+            future = self._futures.get(key)
+
+        future = asyncio.get_running_loop().create_future()
+        # Mark errors as retrieved when no follower awaited the future
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._futures[key] = future
+        with self._lock:
+            self.leaders += 1
+        try:
+            result = await function()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._futures[key]
+
+    def metrics(self) -> dict:
+        """
+        Report how much work was saved.
+
+        Returns:
+            dict: Calls executed, calls coalesced into another one and
+            calls currently in flight.
+        """
+        with self._lock:
+            return {
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._calls) + len(self._futures),
+            }
+
+
+flights = SingleFlight()
@@ -0,0 +1,220 @@
+"""
+Catalog statistics maintained incrementally by SQLite triggers.
+
+product_stats holds the count, sum, min and max of the prices and
+product_price_histogram the number of products per price bucket. Triggers
+on products keep both up to date on insert, update and delete, so reading
+them costs the same however large the table is. Min and max are only
+recomputed when the current extreme is removed, through an index on price.
+
+A full-scan rebuild repairs the aggregates and changes the bucket width:
+    python stats.py rebuild --bucket-width 5
+"""
+import argparse
+import os
+import sqlite3
+
+# Width of the price histogram buckets used when the stats are installed
+STATS_BUCKET_WIDTH = float(os.environ.get('STATS_BUCKET_WIDTH', 10))
+
+TRIGGERS = (
+    'product_stats_insert', 'product_stats_update', 'product_stats_delete')
+
+
+def bucket_sql(price: str, width: float) -> str:
+    """
+    Build the SQL expression mapping a price to its histogram bucket.
+
+    Args:
+        price (str): SQL expression of the price, e.g. 'NEW.price'.
+        width (float): Bucket width.
+
+    Returns:
+        str: Expression computing floor(price / width) as an integer.
+    """
+    quotient = f'({price} / {width!r})'
+    return (f'(CAST({quotient} AS INTEGER) - '
+            f'({quotient} < CAST({quotient} AS INTEGER)))')
+
+
+def stats_script(width: float) -> str:
+    """
+    Build the script creating the aggregates, their triggers and
+    recomputing them from a full scan, in one transaction.
+
+    Args:
+        width (float): Histogram bucket width.
+
+    Returns:
+        str: SQL script for sqlite3.Connection.executescript().
+    """
+    new_bucket = bucket_sql('NEW.price', width)
+    old_bucket = bucket_sql('OLD.price', width)
+    drop_triggers = ''.join(
+        f'DROP TRIGGER IF EXISTS {name};\n' for name in TRIGGERS)
+    return f'''
+BEGIN IMMEDIATE;
+{drop_triggers}
+CREATE TABLE IF NOT EXISTS product_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    count INTEGER NOT NULL,
+    price_sum REAL NOT NULL,
+    price_min REAL,
+    price_max REAL,
+    bucket_width REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS product_price_histogram (
+    bucket INTEGER PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_products_price ON products (price);
+
+CREATE TRIGGER product_stats_insert AFTER INSERT ON products
+BEGIN
+    UPDATE product_stats SET
+        count = count + 1,
+        price_sum = price_sum + NEW.price,
+        price_min = MIN(COALESCE(price_min, NEW.price), NEW.price),
+        price_max = MAX(COALESCE(price_max, NEW.price), NEW.price)
+    WHERE id = 1;
+    INSERT INTO product_price_histogram (bucket, count)
+    VALUES ({new_bucket}, 1)
+    ON CONFLICT (bucket) DO UPDATE SET count = count + 1;
+END;
+
+CREATE TRIGGER product_stats_delete AFTER DELETE ON products
+BEGIN
+    UPDATE product_stats SET
+        count = count - 1,
+        price_sum = CASE WHEN count = 1 THEN 0.0
+                         ELSE price_sum - OLD.price END,
+        price_min = CASE WHEN OLD.price <= price_min
+                         THEN (SELECT MIN(price) FROM products)
+                         ELSE price_min END,
+        price_max = CASE WHEN OLD.price >= price_max
+                         THEN (SELECT MAX(price) FROM products)
+                         ELSE price_max END
+    WHERE id = 1;
+    UPDATE product_price_histogram SET count = count - 1
+    WHERE bucket = {old_bucket};
+END;
+
+CREATE TRIGGER product_stats_update AFTER UPDATE OF price ON products
+WHEN OLD.price IS NOT NEW.price
+BEGIN
+    UPDATE product_stats SET
+        price_sum = price_sum - OLD.price + NEW.price,
+        price_min = CASE WHEN NEW.price <= price_min THEN NEW.price
+                         WHEN OLD.price <= price_min
+                         THEN (SELECT MIN(price) FROM products)
+                         ELSE price_min END,
+        price_max = CASE WHEN NEW.price >= price_max THEN NEW.price
+                         WHEN OLD.price >= price_max
+                         THEN (SELECT MAX(price) FROM products)
+                         ELSE price_max END
+    WHERE id = 1;
+    UPDATE product_price_histogram SET count = count - 1
+    WHERE bucket = {old_bucket};
+    INSERT INTO product_price_histogram (bucket, count)
+    VALUES ({new_bucket}, 1)
+    ON CONFLICT (bucket) DO UPDATE SET count = count + 1;
+END;
+
+DELETE FROM product_price_histogram;
+INSERT INTO product_price_histogram (bucket, count)
+SELECT {bucket_sql('price', width)} AS bucket, COUNT(*)
+FROM products GROUP BY bucket;
+INSERT OR REPLACE INTO product_stats
+    (id, count, price_sum, price_min, price_max, bucket_width)
+SELECT 1, COUNT(*), COALESCE(SUM(price), 0.0), MIN(price), MAX(price),
+       {width!r}
+FROM products;
+COMMIT;
+'''
+
+
+def install_stats(conn: sqlite3.Connection, bucket_width: float = None) -> None:
+    """
+    Create or repair the aggregates and recompute them from a full scan.
+
+    Args:
+        conn (sqlite3.Connection): Open connection to the database.
+        bucket_width (float): New histogram bucket width. Defaults to the
+            width already installed, or STATS_BUCKET_WIDTH.
+    """
+    if bucket_width is None:
+        try:
+            row = conn.execute(
+                'SELECT bucket_width FROM product_stats WHERE id = 1'
+            ).fetchone()
+        except sqlite3.OperationalError:
+            row = None
+        bucket_width = row[0] if row else STATS_BUCKET_WIDTH
+    if bucket_width <= 0:
+        raise ValueError('Bucket width must be positive')
+    try:
+        conn.executescript(stats_script(float(bucket_width)))
+    except sqlite3.Error:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+
+
+def read_stats(conn: sqlite3.Connection) -> dict:
+    """
+    Read the catalog statistics, installing the aggregates on first use.
+
+    Args:
+        conn (sqlite3.Connection): Open connection to the database.
+
+    Returns:
+        dict: count, sum, min, max and avg of the prices plus the
+        non-empty histogram buckets.
+    """
+    try:
+        row = conn.execute(
+            'SELECT count, price_sum, price_min, price_max, bucket_width '
+            'FROM product_stats WHERE id = 1').fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    if row is None:
+        install_stats(conn)
+        return read_stats(conn)
+
+    count, price_sum, price_min, price_max, width = tuple(row)
+    buckets = conn.execute(
+        'SELECT bucket, count FROM product_price_histogram '
+        'WHERE count > 0 ORDER BY bucket').fetchall()
+    return {
+        'count': count,
+        'sum': price_sum,
+        'min': price_min,
+        'max': price_max,
+        'avg': price_sum / count if count else None,
+        'bucket_width': width,
+        'histogram': [
+            {'min': bucket * width, 'max': (bucket + 1) * width,
+             'count': bucket_count}
+            for bucket, bucket_count in buckets],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Maintain the incremental catalog statistics.')
+    parser.add_argument('command', choices=['rebuild', 'show'])
+    parser.add_argument('--database', default=None,
+                        help='Path of products.db (default: PRODUCTS_DB)')
+    parser.add_argument('--bucket-width', type=float, default=None)
+    args = parser.parse_args()
+
+    import database
+    conn = sqlite3.connect(args.database or database.DATABASE)
+    if args.command == 'rebuild':
+        install_stats(conn, args.bucket_width)
+    print(read_stats(conn))
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
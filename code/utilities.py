@@ -1,3 +1,4 @@
+import io
 import traceback
 import time
 import logging
@@ -7,11 +8,55 @@ from datetime import datetime
 import requests
 import pandas as pd
 
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
 # Constants
 URL = 'http://127.0.0.1:5000'
 MAX_RETRIES = 5
 RETRY_DELAY = 3
 
+# Column types of the products table; text uses the pandas string dtype,
+# backed by Arrow buffers when pyarrow is installed
+PRODUCT_DTYPES = {
+    'id': 'int64', 'name': 'string', 'price': 'float64',
+    'description': 'string'}
+
+# Column order shown by print_data()
+DISPLAY_COLUMNS = ['name', 'description', 'price']
+
+
+def get_accept_encoding() -> str:
+    """
+    Build the Accept-Encoding header advertised to the API.
+
+    Returns:
+        str: The encodings urllib3 can decode with the installed packages.
+
+    gzip is always supported; brotli and zstd are added only when the
+    packages urllib3 uses to decode them are installed.
+    """
+    encodings = []
+    try:
+        import zstandard  # noqa: F401
+        encodings.append('zstd')
+    except ImportError:
+        pass
+    try:
+        import brotli  # noqa: F401
+        encodings.append('br')
+    except ImportError:
+        pass
+    encodings.append('gzip')
+    return ', '.join(encodings)
+
+
+ACCEPT_ENCODING = get_accept_encoding()
+
 # Configuration for rotating logs daily and automatically deleting old files
 log_filename = 'error_log.log'
 log_handler = TimedRotatingFileHandler(
@@ -68,24 +113,67 @@ class APIClientError(Exception):
         self.message = message
 
 
-def print_data(products: list) -> None:
+def print_data(products) -> None:
     """
     Print the product list in a tabular format.
 
     Args:
-        products (list): The list of products to be printed.
+        products (list or pd.DataFrame): The products to be printed, as a
+            list of dicts or as a frame indexed by id from
+            get_products_frame().
 
-    Converts the list of products to a DataFrame and prints it in a structured 
-    format. If the product list is empty, it prints an informative message.
+    A list is converted to a DataFrame in display order; a frame is printed
+    as is, without copying its columns. If there are no products, it prints
+    an informative message.
     """
-    if not products:
+    if isinstance(products, list):
+        if not products:
+            print('There are no products in database')
+            return
+        df_products = pd.DataFrame(products, columns=['id'] + DISPLAY_COLUMNS)
+        df_products.set_index('id', inplace=True)
+        print(df_products, end='\n\n')
+        del df_products
+        return
+    if products.empty:
         print('There are no products in database')
         return
-    df_products = pd.DataFrame(products)
-    df_products.set_index('id', inplace=True)
-    df_products = df_products[['name', 'description', 'price']]
-    print(df_products, end='\n\n')
-    del df_products
+    print(products.to_string(columns=DISPLAY_COLUMNS), end='\n\n')
+
+
+def read_products_export(data: bytes, export_format: str,
+                         categories: tuple = ()) -> pd.DataFrame:
+    """
+    Load a products export into a DataFrame.
+
+    Args:
+        data (bytes): Body returned by GET /products/export.
+        export_format (str): 'csv', 'arrow' or 'parquet'.
+        categories (tuple): Text columns to load as pandas.Categorical,
+            worthwhile when their values repeat a lot.
+
+    Returns:
+        pd.DataFrame: One row per product with the PRODUCT_DTYPES columns.
+
+    The columnar formats are decoded straight into column buffers, and CSV
+    is parsed by the pandas C reader, so no per-row Python dict is built.
+    """
+    if export_format in ('arrow', 'parquet'):
+        if export_format == 'arrow':
+            table = pyarrow.ipc.open_stream(data).read_all()
+        else:
+            table = pyarrow.parquet.read_table(pyarrow.BufferReader(data))
+        # Dictionary-encoded columns become pandas.Categorical
+        for column in categories:
+            table = table.set_column(
+                table.schema.get_field_index(column), column,
+                table.column(column).dictionary_encode())
+        return table.to_pandas(
+            types_mapper={pyarrow.string(): pd.StringDtype()}.get)
+    dtypes = dict(PRODUCT_DTYPES)
+    dtypes.update({column: 'category' for column in categories})
+    # Product names such as "NA" must not be read as missing values
+    return pd.read_csv(io.BytesIO(data), dtype=dtypes, keep_default_na=False)
 
 
 def check_api_available() -> bool:
@@ -170,15 +258,16 @@ def get_new_product_info() -> dict:
 
 def get_updated_product_info() -> dict:
     """
-    Get information for updating an existing product from user input.
+    Get the fields to change in an existing product from user input.
 
     Returns:
-        dict: Dictionary containing updated product details if input is valid.
-        Returns False if any input is invalid.
+        dict: The product ID and only the fields the user filled in.
+        Returns False if any input is invalid or nothing would change.
 
-    Prompts the user for the product ID, name, description, and price to update
-    an existing product. Logs errors for invalid input and 
-    prints corresponding messages.
+    Prompts the user for the product ID, then for the name, description and
+    price; a blank answer keeps the current value, so a price-only update
+    needs a single field. Logs errors for invalid input and prints
+    corresponding messages.
     """
     try:
         product_id = int(input('Enter the ID of the product to update: '))
@@ -187,37 +276,30 @@ def get_updated_product_info() -> dict:
         print('Error: ID must be a number. Operation canceled.')
         return False
 
-    # Request product name and ensure it is not empty
-    name = input('Enter product name: ').strip()
-    if not name:
-        print('Error: Product name cannot be empty. Operation canceled.')
-        log_error_to_file(
-            'Error: Product name cannot be empty. Operation canceled.')
-        return False
-
-    # Request product description and ensure it is not empty
-    description = input('Enter product description: ').strip()
-    if not description:
-        log_error_to_file(
-            'Error: Product name cannot be empty. Operation canceled.')
-        print('Error: Product description cannot be empty.'
-                'Operation canceled.')
-        return False
-
-    # Request product price and convert it to float, validating input
-    try:
-        price = float(input('Enter product price: '))
-    except ValueError as e:
-        log_error_to_file(e)
-        print('Error: Price must be a number. Operation canceled.')
+    updated_product = {'product_id': product_id}
+
+    name = input('Enter product name (blank to keep): ').strip()
+    if name:
+        updated_product['name'] = name
+
+    description = input('Enter product description (blank to keep): ').strip()
+    if description:
+        updated_product['description'] = description
+
+    # Convert the price to float when given, validating input
+    price = input('Enter product price (blank to keep): ').strip()
+    if price:
+        try:
+            updated_product['price'] = float(price)
+        except ValueError as e:
+            log_error_to_file(e)
+            print('Error: Price must be a number. Operation canceled.')
+            return False
+
+    if len(updated_product) == 1:
+        log_error_to_file('Error: No field to update. Operation canceled.')
+        print('Error: No field to update. Operation canceled.')
         return False
-
-    updated_product = {
-        'product_id': product_id,
-        'name': name,
-        'price': price,
-        'description': description
-    }
     return updated_product
 
 def get_product_to_delete() -> int:
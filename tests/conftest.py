@@ -0,0 +1,114 @@
+import asyncio
+import sqlite3
+from json import dumps, loads
+
+import pytest
+
+import database
+from cache import response_cache
+
+
+class ASGIResponse:
+    """
+    Minimal response object mirroring the Flask test client response.
+    """
+    def __init__(self, status_code: int, headers: list, data: bytes):
+        self.status_code = status_code
+        self.headers = {
+            name.decode().title(): value.decode() for name, value in headers}
+        self.data = data
+
+    def get_json(self):
+        return loads(self.data)
+
+    def close(self):
+        pass
+
+
+class ASGITestClient:
+    """
+    Drive an ASGI application in-process with the Flask test client API.
+    """
+    def __init__(self, asgi_app):
+        self.asgi_app = asgi_app
+
+    def open(self, path, method='GET', json=None, data=None, headers=None):
+        if json is not None:
+            data = dumps(json).encode()
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http',
+            'method': method,
+            'path': path,
+            'query_string': query.encode(),
+            'headers': [
+                (name.lower().encode(), value.encode())
+                for name, value in (headers or {}).items()],
+        }
+        return asyncio.run(self._request(scope, data or b''))
+
+    async def _request(self, scope, body):
+        messages = []
+        received = False
+
+        async def receive():
+            nonlocal received
+            if received:
+                return {'type': 'http.disconnect'}
+            received = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        await self.asgi_app(scope, receive, send)
+        start = messages[0]
+        data = b''.join(m.get('body', b'') for m in messages[1:])
+        return ASGIResponse(start['status'], start['headers'], data)
+
+    def get(self, path, **kwargs):
+        return self.open(path, method='GET', **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.open(path, method='POST', **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.open(path, method='PUT', **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self.open(path, method='PATCH', **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.open(path, method='DELETE', **kwargs)
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """
+    Point the API at a temporary database holding three products.
+    """
+    path = str(tmp_path / 'products.db')
+    monkeypatch.setattr(database, 'DATABASE', path)
+    conn = sqlite3.connect(path)
+    database.init_db(conn)
+    conn.executemany(
+        'INSERT INTO products (name, price, description) VALUES (?, ?, ?)',
+        [('Product A', 10.0, 'First product'),
+         ('Product B', 20.5, 'Second product'),
+         ('Product C', 30.0, 'Third product')])
+    conn.commit()
+    conn.close()
+    response_cache.invalidate()
+    return path
+
+
+@pytest.fixture(params=['flask', 'asgi'])
+def client(request, db_path):
+    """
+    Test client for the Flask application and for its ASGI variant.
+    """
+    if request.param == 'flask':
+        from app import app
+        return app.test_client()
+    from asgi_app import app
+    return ASGITestClient(app)
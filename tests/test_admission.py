@@ -0,0 +1,181 @@
+import asyncio
+import threading
+import time
+
+import pytest
+import admission
+import import_jobs
+from admission import Gate
+
+
+@pytest.fixture
+def saturated(monkeypatch):
+    """
+    Replace the gates with ones that reject every request.
+    """
+    gates = {'read': Gate(0, 0), 'write': Gate(0, 0), 'bulk': Gate(0, 0)}
+    monkeypatch.setattr(admission, 'gates', gates)
+    return gates
+
+def test_gate_admits_up_to_limit():
+    """
+    Test for Gate.acquire with free slots and a full queue.
+    """
+    gate = Gate(2, 0)
+    assert gate.acquire() and gate.acquire()
+    assert not gate.acquire()
+    gate.release()
+    assert gate.acquire()
+    status = gate.status()
+    assert (status['active'], status['admitted']) == (2, 3)
+    assert status['rejected'] == {'queue_full': 1, 'timeout': 0}
+
+def test_gate_queue_times_out():
+    """
+    Test for rejecting a queued request after the queue timeout.
+    """
+    gate = Gate(1, 1, queue_timeout=0.01)
+    assert gate.acquire()
+    assert not gate.acquire()
+    status = gate.status()
+    assert status['rejected']['timeout'] == 1
+    assert status['waiting'] == 0
+
+def test_gate_slot_handed_over_after_timeout(monkeypatch):
+    """
+    Test for a slot released between the end of the wait and its
+    settlement.
+    Verify that the waiter is admitted and the slot does not leak.
+    """
+    gate = Gate(1, 1, queue_timeout=0.01)
+    assert gate.acquire()
+    settle = gate._settle
+
+    def release_first(waiter, start):
+        gate.release()
+        return settle(waiter, start)
+
+    monkeypatch.setattr(gate, '_settle', release_first)
+    assert gate.acquire()
+    gate.release()
+    status = gate.status()
+    assert (status['active'], status['waiting']) == (0, 0)
+    assert status['rejected']['timeout'] == 0
+
+def test_gate_hands_slots_over_in_order():
+    """
+    Test for handing a released slot to the oldest waiter.
+    Verify that admitted requests never queue longer than the timeout.
+    """
+    gate = Gate(1, 2, queue_timeout=5)
+    assert gate.acquire()
+    order = []
+
+    def worker(name):
+        if gate.acquire():
+            order.append(name)
+            gate.release()
+
+    threads = []
+    for name in ('first', 'second'):
+        threads.append(threading.Thread(target=worker, args=(name,)))
+        threads[-1].start()
+        while gate.status()['waiting'] < len(threads):
+            time.sleep(0.001)
+    assert not gate.acquire()
+    gate.release()
+    for thread in threads:
+        thread.join()
+    assert order == ['first', 'second']
+    status = gate.status()
+    assert status['active'] == 0
+    assert status['queue_time']['max'] < 5
+
+def test_gate_async():
+    """
+    Test for Gate.acquire_async with a slot freed while waiting and a
+    queue timeout.
+    """
+    async def scenario():
+        gate = Gate(1, 1, queue_timeout=1)
+        assert await gate.acquire_async()
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.01, gate.release)
+        assert await gate.acquire_async()
+        gate.queue_timeout = 0.01
+        assert not await gate.acquire_async()
+        gate.release()
+        return gate.status()
+
+    status = asyncio.run(scenario())
+    assert (status['active'], status['waiting'], status['admitted']) == (
+        0, 0, 2)
+    assert status['rejected']['timeout'] == 1
+
+def test_overloaded_requests_get_503(client, saturated):
+    """
+    Test for rejecting requests when the gates are full.
+    Verify that probes bypass the gates and that rejections are counted.
+    """
+    response = client.get('/products')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(
+        admission.ADMISSION_RETRY_AFTER)
+    assert 'error' in response.get_json()
+    assert client.delete('/products/1').status_code == 503
+    assert client.get('/health').status_code == 200
+    metrics = client.get('/metrics').get_json()['admission']
+    assert metrics['read']['rejected']['queue_full'] == 1
+    assert metrics['write']['rejected']['queue_full'] == 1
+
+def test_admitted_requests_release_slots(client):
+    """
+    Test for releasing the slot at the end of every request.
+    """
+    for _ in range(3):
+        assert client.get('/products/1').status_code == 200
+    assert client.get('/products/99').status_code == 404
+    read = client.get('/metrics').get_json()['admission']['read']
+    assert read['active'] == 0 and read['admitted'] >= 4
+def test_transfers_use_their_own_gate(client, monkeypatch):
+    """
+    Test for routing imports and exports through the bulk gate.
+    Verify that long transfers and short requests do not share slots.
+    """
+    gates = {'read': Gate(0, 0), 'write': Gate(0, 0), 'bulk': Gate(1, 0)}
+    monkeypatch.setattr(admission, 'gates', gates)
+    response = client.get('/products/export?format=csv')
+    assert response.status_code == 200
+    # The server closes the response once the body is sent
+    response.close()
+    response = client.post(
+        '/products/import?format=json', data=b'[]')
+    assert response.status_code == 202
+    import_jobs.worker.queue.join()
+    assert client.get('/products').status_code == 503
+    gates['read'] = Gate(1, 0)
+    assert gates['bulk'].acquire()
+    assert client.get('/products/export').status_code == 503
+    assert client.get('/products').status_code == 200
+    gates['bulk'].release()
+def test_export_holds_bulk_slot_while_streaming(db_path, monkeypatch):
+    """
+    Test for the Flask bulk slot of a streamed export.
+    Verify that it is held while the body is read chunk by chunk and only
+    released when the response is closed.
+    """
+    import export
+    from app import app
+    gates = {'read': Gate(1, 0), 'write': Gate(1, 0), 'bulk': Gate(1, 0)}
+    monkeypatch.setattr(admission, 'gates', gates)
+    monkeypatch.setattr(export, 'EXPORT_BATCH_SIZE', 1)
+    response = app.test_client().get(
+        '/products/export?format=csv', buffered=False)
+    assert response.status_code == 200
+    chunks = iter(response.response)
+    assert next(chunks).startswith(b'id,')
+    assert gates['bulk'].active == 1
+    assert list(chunks)
+    assert gates['bulk'].active == 1
+    response.close()
+    assert gates['bulk'].active == 0
@@ -4,9 +4,14 @@ from unittest.mock import patch, MagicMock
 from api_operations import (
     create_product, 
     get_products, 
+    get_product_stats,
+    load_products_frame,
+    get_products_frame,
     update_product, 
+    patch_product,
     delete_product
 )
+from utilities import ACCEPT_ENCODING
 
 
 @patch('api_operations.requests.post')
@@ -57,7 +62,9 @@ def test_get_products_success(mock_get):
     
     products = get_products()
     assert products == [{"id": 1, "name": "Product 1"}]
-    mock_get.assert_called_once_with('http://127.0.0.1:5000/products')
+    mock_get.assert_called_once_with(
+        'http://127.0.0.1:5000/products',
+        headers={'Accept-Encoding': ACCEPT_ENCODING})
 
 @patch(
     'api_operations.requests.get', 
@@ -72,6 +79,97 @@ def test_get_products_failure(mock_log, mock_get):
     assert products is False
     mock_log.assert_called_once()
 
+@patch('api_operations.requests.get')
+def test_get_product_stats_success(mock_get):
+    """
+    Test for get_product_stats - success.
+    Mock requests.get to simulate fetching the catalog statistics.
+    """
+    mock_get.return_value = MagicMock(
+        status_code=200,
+        json=lambda: {"count": 3, "avg": 20.0})
+    assert get_product_stats() == {"count": 3, "avg": 20.0}
+    mock_get.assert_called_once_with('http://127.0.0.1:5000/products/stats')
+
+@patch(
+    'api_operations.requests.get',
+    side_effect=RequestException("Failed to get statistics"))
+@patch('api_operations.log_error_to_file')
+def test_get_product_stats_failure(mock_log, mock_get):
+    """
+    Test for get_product_stats - failure.
+    """
+    assert get_product_stats() is False
+    mock_log.assert_called_once()
+
+@patch('api_operations.requests.get')
+def test_load_products_frame_success(mock_get):
+    """
+    Test for load_products_frame - success.
+    Mock requests.get to return a CSV export and verify the DataFrame.
+    """
+    mock_get.return_value = MagicMock(
+        status_code=200,
+        content=b'id,name,price,description\n1,NA,2.5,First\n')
+    frame = load_products_frame('csv')
+    mock_get.assert_called_once_with(
+        'http://127.0.0.1:5000/products/export', params={'format': 'csv'})
+    assert frame.to_dict('records') == [
+        {"id": 1, "name": "NA", "price": 2.5, "description": "First"}]
+
+@patch('api_operations.pyarrow', new=object())
+@patch('api_operations.requests.get')
+def test_load_products_frame_falls_back_to_csv(mock_get):
+    """
+    Test for load_products_frame with pyarrow only on the client.
+    Verify that CSV is asked for when the server does not offer Arrow.
+    """
+    mock_get.side_effect = [
+        MagicMock(status_code=400),
+        MagicMock(status_code=200,
+                  content=b'id,name,price,description\n1,A,2.5,First\n')]
+    frame = load_products_frame()
+    assert [call.kwargs['params'] for call in mock_get.call_args_list] == [
+        {'format': 'arrow'}, {'format': 'csv'}]
+    assert frame['name'].tolist() == ['A']
+
+@patch(
+    'api_operations.requests.get',
+    side_effect=RequestException("Failed to export products"))
+@patch('api_operations.log_error_to_file')
+def test_load_products_frame_failure(mock_log, mock_get):
+    """
+    Test for load_products_frame - failure.
+    """
+    assert load_products_frame('csv') is False
+    mock_log.assert_called_once()
+
+@patch('api_operations.requests.get')
+def test_get_products_frame_success(mock_get):
+    """
+    Test for get_products_frame - success.
+    Verify that the columns are typed and indexed by id.
+    """
+    mock_get.return_value = MagicMock(
+        status_code=200,
+        content=b'id,name,price,description\n7,A,2.5,Same\n9,B,3,Same\n')
+    frame = get_products_frame('csv', categories=('description',))
+    assert frame.index.tolist() == [7, 9]
+    assert frame.index.dtype == 'int64'
+    assert frame['price'].dtype == 'float64'
+    assert frame['name'].dtype == 'string'
+    assert frame['description'].dtype == 'category'
+
+@patch(
+    'api_operations.requests.get',
+    side_effect=RequestException("Failed to export products"))
+@patch('api_operations.log_error_to_file')
+def test_get_products_frame_failure(mock_log, mock_get):
+    """
+    Test for get_products_frame - failure.
+    """
+    assert get_products_frame('csv') is False
+
 @patch('api_operations.requests.put')
 def test_update_product_success(mock_put):
     """
@@ -87,7 +185,8 @@ def test_update_product_success(mock_put):
     update_product(updated_product)
     mock_put.assert_called_once_with(
         'http://127.0.0.1:5000/products/1', 
-        json=updated_product)
+        json={"name": "Updated Product", "price": 25.0,
+              "description": "Updated description"})
 
 @patch(
     'api_operations.requests.put', 
@@ -106,6 +205,41 @@ def test_update_product_failure(mock_log, mock_put):
     update_product(updated_product)
     mock_log.assert_called_once()
 
+@patch('api_operations.requests.patch')
+def test_patch_product_sends_diff(mock_patch):
+    """
+    Test for patch_product - success.
+    Verify that only the fields differing from the current product are sent.
+    """
+    current = {"id": 1, "name": "A", "price": 10.0, "description": "d"}
+    mock_patch.return_value = MagicMock(status_code=200)
+    mock_patch.return_value.json.return_value = {**current, "price": 12.0}
+    result = patch_product(1, {"name": "A", "price": 12.0}, current)
+    mock_patch.assert_called_once_with(
+        'http://127.0.0.1:5000/products/1', json={"price": 12.0})
+    assert result["price"] == 12.0
+
+@patch('api_operations.requests.patch')
+def test_patch_product_nothing_changed(mock_patch):
+    """
+    Test for patch_product when nothing differs.
+    Verify that no request is made.
+    """
+    current = {"id": 1, "name": "A", "price": 10.0, "description": "d"}
+    assert patch_product(1, {"price": 10.0}, current) == current
+    mock_patch.assert_not_called()
+
+@patch(
+    'api_operations.requests.patch',
+    side_effect=RequestException("Failed to update product"))
+@patch('api_operations.log_error_to_file')
+def test_patch_product_failure(mock_log, mock_patch):
+    """
+    Test for patch_product - failure.
+    """
+    assert patch_product(1, {"price": 12.0}) is False
+    mock_log.assert_called_once()
+
 @patch('api_operations.requests.delete')
 def test_delete_product_success(mock_delete):
     """
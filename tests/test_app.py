@@ -0,0 +1,294 @@
+"""
+Endpoint tests, run against both app.py (Flask) and asgi_app.py (ASGI)
+through the parametrized client fixture in conftest.py.
+"""
+import gzip
+import json
+
+import pytest
+import compression
+import database
+
+
+def test_health_check(client):
+    """
+    Test for GET /health.
+    Verify that the API reports itself as up.
+    """
+    response = client.get('/health')
+    assert response.status_code == 200
+    assert response.get_json() == {"status": "up"}
+
+def test_get_products(client):
+    """
+    Test for GET /products.
+    Verify that every product in the database is returned.
+    """
+    response = client.get('/products')
+    assert response.status_code == 200
+    products = response.get_json()
+    assert [p['name'] for p in products] == [
+        'Product A', 'Product B', 'Product C']
+    assert products[1] == {
+        "id": 2,
+        "name": "Product B",
+        "price": 20.5,
+        "description": "Second product"}
+
+def test_create_product(client):
+    """
+    Test for POST /products.
+    Verify that the product is stored and echoed back.
+    """
+    new_product = {
+        "name": "New Product",
+        "price": 20.0,
+        "description": "A new product"}
+    response = client.post('/products', json=new_product)
+    assert response.status_code == 201
+    assert response.get_json() == new_product
+    products = client.get('/products').get_json()
+    assert products[-1] == dict(new_product, id=4)
+
+def test_update_product(client):
+    """
+    Test for PUT /products/<id>.
+    Verify that every field of the product is overwritten.
+    """
+    updated_product = {
+        "name": "Updated Product",
+        "price": 25.0,
+        "description": "Updated description"}
+    response = client.put('/products/1', json=updated_product)
+    assert response.status_code == 200
+    assert response.get_json() == updated_product
+    products = client.get('/products').get_json()
+    assert products[0] == dict(updated_product, id=1)
+
+def test_delete_product(client):
+    """
+    Test for DELETE /products/<id>.
+    Verify that the product is no longer returned.
+    """
+    response = client.delete('/products/2')
+    assert response.status_code == 204
+    products = client.get('/products').get_json()
+    assert [p['id'] for p in products] == [1, 3]
+
+@pytest.mark.parametrize('price', ['1e999', '-Infinity', 'NaN', '"10"'])
+def test_non_finite_price_is_rejected(client, price):
+    """
+    Test for POST and PUT /products with a price that is not a finite
+    number.
+    Verify that the rows and their aggregates can still be written.
+    """
+    body = ('{"name": "Bad", "price": %s, "description": "Overflow"}'
+            % price).encode()
+    headers = {'Content-Type': 'application/json'}
+    assert client.post(
+        '/products', data=body, headers=headers).status_code == 400
+    assert client.put(
+        '/products/1', data=body, headers=headers).status_code == 400
+    assert client.post('/products', json={
+        "name": "Good", "price": 5.0, "description": "d"}).status_code == 201
+    assert client.delete('/products/1').status_code == 204
+    assert client.put('/products/2', json={
+        "name": "B2", "price": 1.0, "description": "d"}).status_code == 200
+    stats = client.get('/products/stats').get_json()
+    assert stats['count'] == 3 and stats['sum'] == 36.0
+
+@pytest.mark.parametrize('body', [
+    {"name": 5, "price": 2, "description": "d"},
+    {"name": "A", "price": 2},
+    {"name": "A", "price": 2, "description": "d", "color": "red"},
+    [1],
+])
+def test_invalid_product_is_rejected(client, monkeypatch, body):
+    """
+    Test for POST and PUT /products with a body of the wrong shape.
+    Verify that nothing is written, also through the hot tier.
+    """
+    monkeypatch.setattr(database, 'HOT_TIER', True)
+    assert client.post('/products', json=body).status_code == 400
+    assert client.put('/products/1', json=body).status_code == 400
+    products = client.get('/products').get_json()
+    assert len(products) == 3 and products[0]['name'] == 'Product A'
+
+def test_unknown_route(client):
+    """
+    Test for an unknown path.
+    Verify that the API answers 404.
+    """
+    assert client.get('/unknown').status_code == 404
+
+def test_method_not_allowed(client):
+    """
+    Test for an unsupported method on a known path.
+    Verify that the API answers 405.
+    """
+    assert client.delete('/products').status_code == 405
+
+def test_get_products_gzip(client, monkeypatch):
+    """
+    Test for GET /products with Accept-Encoding: gzip.
+    Verify that the body is compressed and decodes to the product list.
+    """
+    monkeypatch.setattr(compression, 'COMPRESS_MIN_SIZE', 0)
+    plain = client.get('/products')
+    response = client.get(
+        '/products', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert json.loads(gzip.decompress(response.data)) == plain.get_json()
+
+def test_get_products_small_body_uncompressed(client):
+    """
+    Test for GET /products below the compression threshold.
+    Verify that no Content-Encoding is applied.
+    """
+    response = client.get(
+        '/products', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert len(response.get_json()) == 3
+
+def test_write_invalidates_cached_products(client):
+    """
+    Test for the response cache.
+    Verify that a write is visible to the next GET /products.
+    """
+    assert len(client.get('/products').get_json()) == 3
+    client.delete('/products/1')
+    assert len(client.get('/products').get_json()) == 2
+
+def test_get_product_stats(client):
+    """
+    Test for GET /products/stats.
+    Verify that the statistics follow writes made through the API.
+    """
+    response = client.get('/products/stats')
+    assert response.status_code == 200
+    assert response.get_json()['count'] == 3
+    assert response.get_json()['max'] == 30.0
+    client.delete('/products/3')
+    product_stats = client.get('/products/stats').get_json()
+    assert product_stats['count'] == 2
+    assert product_stats['sum'] == 30.5
+    assert product_stats['max'] == 20.5
+
+def test_get_metrics(client):
+    """
+    Test for GET /metrics.
+    Verify that the single-flight counters are reported.
+    """
+    client.get('/products')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert set(response.get_json()['singleflight']) == {
+        'leaders', 'coalesced', 'in_flight'}
+
+def test_export_products_csv(client):
+    """
+    Test for GET /products/export?format=csv.
+    Verify that the whole table is streamed as CSV.
+    """
+    response = client.get('/products/export?format=csv')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('text/csv')
+    lines = response.data.decode().splitlines()
+    assert lines[0] == 'id,name,price,description'
+    assert len(lines) == 4
+
+def test_export_products_unknown_format(client):
+    """
+    Test for GET /products/export with an unsupported format.
+    Verify that the API answers 400 and lists the available formats.
+    """
+    response = client.get('/products/export?format=xml')
+    assert response.status_code == 400
+    assert 'csv' in response.get_json()['formats']
+
+def test_get_product(client):
+    """
+    Test for GET /products/<id>.
+    Verify that a single product is returned, and 404 when it is missing.
+    """
+    response = client.get('/products/2')
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "id": 2,
+        "name": "Product B",
+        "price": 20.5,
+        "description": "Second product"}
+    assert client.get('/products/99').status_code == 404
+
+def test_get_products_filters(client):
+    """
+    Test for GET /products with id and price filters.
+    Verify that filtered listings are cached apart and follow writes.
+    """
+    response = client.get('/products?min_price=15&max_id=2')
+    assert response.status_code == 200
+    assert [p['id'] for p in response.get_json()] == [2]
+    assert len(client.get('/products').get_json()) == 3
+    client.delete('/products/2')
+    assert client.get('/products?min_price=15&max_id=2').get_json() == []
+
+def test_get_products_invalid_filter(client):
+    """
+    Test for GET /products with a filter that is not a number.
+    """
+    response = client.get('/products?min_price=cheap')
+    assert response.status_code == 400
+    assert 'min_price' in response.get_json()['error']
+
+def test_patch_product(client):
+    """
+    Test for PATCH /products/<id>.
+    Verify that only the supplied fields change and the new row is returned.
+    """
+    client.get('/products')
+    response = client.patch('/products/2', json={"price": 22.0})
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "id": 2,
+        "name": "Product B",
+        "price": 22.0,
+        "description": "Second product"}
+    assert client.get('/products').get_json()[1]['price'] == 22.0
+    assert client.get('/products/stats').get_json()['sum'] == 62.0
+
+def test_patch_product_without_changes(client):
+    """
+    Test for PATCH /products/<id> with the current values.
+    Verify that nothing is written and the cache is kept.
+    """
+    from cache import response_cache
+    generation = response_cache.generation
+    response = client.patch(
+        '/products/1', json={"name": "Product A", "price": 10.0})
+    assert response.status_code == 200
+    assert response.get_json()['name'] == 'Product A'
+    assert response_cache.generation == generation
+
+def test_patch_product_errors(client):
+    """
+    Test for PATCH /products/<id> with invalid bodies and missing products.
+    """
+    assert client.patch('/products/99', json={"price": 1.0}).status_code == 404
+    assert client.patch('/products/1', json={"color": "red"}).status_code == 400
+    assert client.patch('/products/1', json={"price": "x"}).status_code == 400
+    assert client.patch('/products/1', json=[1]).status_code == 400
+@pytest.mark.parametrize('price', ['NaN', 'Infinity', '-Infinity', '1e999'])
+def test_patch_product_non_finite_price(client, price):
+    """
+    Test for PATCH /products/<id> with a price that is not finite.
+    Verify that the row is left untouched and stays writable.
+    """
+    response = client.patch(
+        '/products/1', data=('{"price": %s}' % price).encode(),
+        headers={'Content-Type': 'application/json'})
+    assert response.status_code == 400
+    assert client.get('/products/1').get_json()['price'] == 10.0
+    assert client.patch('/products/1', json={"price": 2.0}).status_code == 200
+    assert client.get('/products/stats').get_json()['sum'] == 52.5
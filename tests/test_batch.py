@@ -0,0 +1,226 @@
+from concurrent.futures import Future
+from unittest.mock import patch, MagicMock
+
+import pytest
+import batch
+import database
+import batcher as batcher_module
+from batcher import Batcher, BatchResult
+
+
+NEW_PRODUCT = {"name": "Product D", "price": 40.0, "description": "Fourth"}
+
+
+def post_batch(client, operations, atomic=True):
+    return client.post(
+        '/batch', json={"atomic": atomic, "operations": operations})
+
+def test_batch_runs_operations_in_order(client):
+    """
+    Test for POST /batch with every kind of operation.
+    Verify that later operations see the writes of earlier ones.
+    """
+    response = post_batch(client, [
+        {"method": "POST", "path": "/products", "body": NEW_PRODUCT},
+        {"method": "PATCH", "path": "/products/4", "body": {"price": 41.0}},
+        {"method": "GET", "path": "/products/4"},
+        {"method": "PUT", "path": "/products/1",
+         "body": {"name": "A2", "price": 1.0, "description": "Replaced"}},
+        {"method": "DELETE", "path": "/products/2"},
+    ])
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result['committed'] is True
+    assert [r['status'] for r in result['results']] == [
+        201, 200, 200, 200, 204]
+    assert result['results'][0]['body']['id'] == 4
+    assert result['results'][2]['body']['price'] == 41.0
+    names = [p['name'] for p in client.get('/products').get_json()]
+    assert names == ['A2', 'Product C', 'Product D']
+
+def test_atomic_batch_rolls_back(client):
+    """
+    Test for an atomic batch with a failing operation.
+    """
+    response = post_batch(client, [
+        {"method": "DELETE", "path": "/products/1"},
+        {"method": "PATCH", "path": "/products/99", "body": {"price": 1}},
+        {"method": "GET", "path": "/products/2"},
+    ])
+    assert response.status_code == 409
+    result = response.get_json()
+    assert result['committed'] is False
+    assert [r['status'] for r in result['results']] == [424, 404, 424]
+    assert client.get('/products/1').status_code == 200
+
+def test_independent_batch_keeps_successes(client):
+    """
+    Test for a non-atomic batch with failing operations.
+    """
+    response = post_batch(client, [
+        {"method": "DELETE", "path": "/products/1"},
+        {"method": "POST", "path": "/products", "body": {"name": "X"}},
+        {"method": "DELETE", "path": "/products/1"},
+        {"method": "GET", "path": "/orders/1"},
+        {"method": "PUT", "path": "/products"},
+    ], atomic=False)
+    assert response.status_code == 200
+    assert [r['status'] for r in response.get_json()['results']] == [
+        204, 400, 404, 404, 405]
+    assert client.get('/products/1').status_code == 404
+
+def test_batch_rejects_non_finite_prices(client):
+    """
+    Test for batched POST and PUT with an infinite price.
+    """
+    body = ('{"atomic": false, "operations": ['
+            '{"method": "POST", "path": "/products", "body": '
+            '{"name": "X", "price": Infinity, "description": "d"}},'
+            '{"method": "PUT", "path": "/products/1", "body": '
+            '{"name": "X", "price": 1e999, "description": "d"}}]}').encode()
+    response = client.post(
+        '/batch', data=body, headers={'Content-Type': 'application/json'})
+    assert [r['status'] for r in response.get_json()['results']] == [400, 400]
+    assert client.get('/products/stats').get_json()['count'] == 3
+
+@pytest.mark.parametrize('body', [
+    [],
+    {"operations": []},
+    {"operations": [{"method": "GET"}]},
+    {"operations": [{"method": "GET", "path": "/products/1"}],
+     "atomic": "yes"},
+])
+def test_batch_rejects_malformed_bodies(client, body):
+    """
+    Test for POST /batch with an invalid envelope.
+    """
+    assert client.post('/batch', json=body).status_code == 400
+
+def test_batch_size_limit(client, monkeypatch):
+    """
+    Test for BATCH_MAX_OPERATIONS.
+    """
+    monkeypatch.setattr(batch, 'BATCH_MAX_OPERATIONS', 2)
+    operations = [{"method": "GET", "path": "/products/1"}] * 3
+    assert post_batch(client, operations).status_code == 400
+
+def test_batch_on_sharded_store(db_path, tmp_path, monkeypatch):
+    """
+    Test for run_batch on sharded storage: independent batches only.
+    """
+    monkeypatch.setattr(database, 'DATABASE', str(tmp_path / 'shards.db'))
+    monkeypatch.setattr(database, 'SHARDS', 2)
+    store = database.get_store()
+    operations = [{"method": "POST", "path": "/products",
+                   "body": NEW_PRODUCT},
+                  {"method": "GET", "path": "/products/99"}]
+    with pytest.raises(NotImplementedError):
+        batch.run_batch(store, operations)
+    result = batch.run_batch(store, operations, atomic=False)
+    assert [r['status'] for r in result['results']] == [201, 404]
+
+def test_batch_through_hot_tier(db_path, monkeypatch):
+    """
+    Test for keeping the hot tier in sync with batched writes, without
+    reloading the table.
+    """
+    monkeypatch.setattr(database, 'HOT_TIER', True)
+    store = database.get_store()
+    store.fetch_products()
+    monkeypatch.setattr(store, 'reload', None)
+    for atomic in (True, False):
+        batch.run_batch(store, [
+            {"method": "POST", "path": "/products", "body": NEW_PRODUCT}],
+            atomic)
+    batch.run_batch(store, [
+        {"method": "PATCH", "path": "/products/1", "body": {"price": 2.0}},
+        {"method": "DELETE", "path": "/products/2"},
+        {"method": "PUT", "path": "/products/3", "body": NEW_PRODUCT}])
+    batch.run_batch(store, [
+        {"method": "DELETE", "path": "/products/3"},
+        {"method": "GET", "path": "/products/99"}])
+    assert store.fetch_products() == store.backing.fetch_products()
+    assert [row[0] for row in store.fetch_products()[1]] == [1, 3, 4, 5]
+
+def batch_response(*results):
+    response = MagicMock(status_code=200)
+    response.json.return_value = {"results": [
+        {"status": status, "body": body} for status, body in results]}
+    return response
+
+@patch('client_stats.requests.post')
+def test_batcher_flushes_by_size(mock_post):
+    """
+    Test for Batcher sending a batch once max_size calls are pending.
+    """
+    mock_post.return_value = batch_response((200, {"id": 1}), (204, None))
+    batcher = Batcher(max_size=2, max_delay=60)
+    first = batcher.get(1)
+    assert not first.done()
+    second = batcher.delete(2)
+    assert first.result() == BatchResult(200, {"id": 1})
+    assert second.result(timeout=0) == BatchResult(204, None)
+    sent = mock_post.call_args[1]['json']
+    assert sent == {"atomic": False, "operations": [
+        {"method": "GET", "path": "/products/1"},
+        {"method": "DELETE", "path": "/products/2"}]}
+    assert batcher._timer is None
+
+@patch('client_stats.requests.post')
+def test_batcher_flushes_by_time(mock_post):
+    """
+    Test for Batcher sending pending calls after max_delay.
+    """
+    mock_post.return_value = batch_response((201, {"id": 4}))
+    batcher = Batcher(max_size=10, max_delay=0.01)
+    future = batcher.create(NEW_PRODUCT)
+    assert future.result(timeout=5).status == 201
+    assert mock_post.call_count == 1
+
+@patch('client_stats.requests.post')
+def test_batcher_failure_reaches_every_call(mock_post):
+    """
+    Test for a failed batch request.
+    """
+    mock_post.return_value = MagicMock(status_code=400, text='bad')
+    with Batcher(max_delay=60) as batcher:
+        futures = [batcher.patch(1, {"price": 1.0}), batcher.get(2)]
+    for future in futures:
+        with pytest.raises(Exception, match='status 400'):
+            future.result(timeout=0)
+@patch('client_stats.requests.post')
+def test_batcher_splits_pending_calls(mock_post):
+    """
+    Test for flushing more pending calls than fit in one batch.
+    """
+    mock_post.side_effect = lambda url, json: batch_response(
+        *[(200, op['path']) for op in json['operations']])
+    batcher = Batcher(max_size=2, max_delay=60)
+    batcher.pending = [
+        ({"method": "GET", "path": f"/products/{i}"}, Future())
+        for i in range(5)]
+    futures = [future for _, future in batcher.pending]
+    batcher.flush()
+    sizes = [len(call[1]['json']['operations'])
+             for call in mock_post.call_args_list]
+    assert sizes == [2, 2, 1]
+    assert [f.result(timeout=0).body for f in futures] == [
+        f'/products/{i}' for i in range(5)]
+    assert (Batcher(max_size=10 ** 6).max_size
+            == batcher_module.SERVER_BATCH_LIMIT)
+
+@pytest.mark.parametrize('response', [
+    MagicMock(status_code=200, **{'json.side_effect': ValueError('html')}),
+    MagicMock(status_code=200, **{'json.return_value': {}}),
+    MagicMock(status_code=200, **{'json.return_value': {"results": [{}]}}),
+])
+@patch('client_stats.requests.post')
+def test_batcher_unexpected_body(mock_post, response):
+    """
+    Test for a batch response that is not the expected JSON document.
+    """
+    mock_post.return_value = response
+    batcher = Batcher(max_size=10, max_delay=0.01)
+    future = batcher.get(1)
+    with pytest.raises((ValueError, KeyError)):
+        future.result(timeout=5)
@@ -0,0 +1,169 @@
+import json
+import sqlite3
+import sys
+
+import pytest
+import bulk_import
+import database
+from bulk_import import (
+    bulk_load,
+    drop_secondary_objects,
+    iter_records,
+    open_lines,
+    restore_interrupted_load,
+    validate_record)
+from stats import read_stats
+
+
+def write_file(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+def load(db_path, path, file_format, **kwargs):
+    conn = sqlite3.connect(db_path)
+    records = iter_records(open_lines(path, kwargs.pop('use_mmap', False)),
+                           file_format)
+    report = bulk_load(conn, records, progress=lambda line: None, **kwargs)
+    return conn, report
+
+def test_validate_record():
+    """
+    Test for validate_record.
+    Verify conversion of valid records and rejection of invalid ones.
+    """
+    assert validate_record(
+        {"name": " A ", "price": "2.5", "description": "d"}) == (
+            None, 'A', 2.5, 'd')
+    assert validate_record(
+        {"id": "7", "name": "A", "price": 1, "description": "d"})[0] == 7
+    for record in [{"name": "", "price": 1, "description": "d"},
+                   {"name": "A", "price": "abc", "description": "d"},
+                   {"name": "A", "price": "nan", "description": "d"},
+                   {"name": "A", "price": 1}]:
+        with pytest.raises(ValueError):
+            validate_record(record)
+
+@pytest.mark.parametrize('use_mmap', [False, True])
+def test_bulk_load_csv(db_path, tmp_path, use_mmap):
+    """
+    Test for bulk_load with a CSV file.
+    Verify that rows are appended in chunks, with quoted multi-line fields.
+    """
+    path = write_file(
+        tmp_path, 'products.csv',
+        'name,price,description\n'
+        'D,1.5,"Line one\nline two"\n'
+        'E,2.5,Plain\n'
+        'F,3.5,Plain\n')
+    conn, report = load(db_path, path, 'csv', chunk_size=2,
+                        use_mmap=use_mmap)
+    assert report['written'] == 3
+    assert report['rejected'] == 0
+    rows = conn.execute(
+        'SELECT id, description FROM products WHERE name = ?', ('D',)
+    ).fetchall()
+    assert rows == [(4, 'Line one\nline two')]
+
+def test_bulk_load_jsonl_reports_errors(db_path, tmp_path):
+    """
+    Test for bulk_load with invalid JSON Lines records.
+    Verify that invalid records are rejected with their record number.
+    """
+    path = write_file(
+        tmp_path, 'products.jsonl',
+        json.dumps({"name": "D", "price": 4, "description": "d"}) + '\n'
+        '{broken\n'
+        + json.dumps({"name": "", "price": 4, "description": "d"}) + '\n')
+    conn, report = load(db_path, path, 'jsonl')
+    assert report['written'] == 1
+    assert report['rejected'] == 2
+    assert [number for number, _ in report['errors']] == [2, 3]
+
+def test_bulk_load_upsert(db_path, tmp_path):
+    """
+    Test for bulk_load in upsert mode.
+    Verify that existing ids are updated and new rows inserted.
+    """
+    path = write_file(
+        tmp_path, 'products.csv',
+        'id,name,price,description\n'
+        '1,Product A2,11.0,Updated\n'
+        ',Product D,40.0,New\n')
+    conn, report = load(db_path, path, 'csv', upsert=True)
+    assert report['written'] == 2
+    assert conn.execute(
+        'SELECT name, price FROM products WHERE id = 1').fetchone() == (
+            'Product A2', 11.0)
+    assert conn.execute('SELECT COUNT(*) FROM products').fetchone()[0] == 4
+
+def test_bulk_load_duplicate_without_upsert(db_path, tmp_path):
+    """
+    Test for bulk_load with an existing id and no upsert.
+    Verify that the load fails but indexes and triggers are restored.
+    """
+    path = write_file(
+        tmp_path, 'products.csv', 'id,name,price,description\n1,A,1,d\n')
+    with pytest.raises(sqlite3.IntegrityError):
+        load(db_path, path, 'csv')
+    conn = sqlite3.connect(db_path)
+    names = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')")}
+    assert 'idx_products_price' in names
+    assert 'product_stats_insert' in names
+
+def test_bulk_load_rebuilds_indexes_and_stats(db_path, tmp_path):
+    """
+    Test for bulk_load index handling.
+    Verify that indexes and triggers come back and statistics are correct.
+    """
+    path = write_file(
+        tmp_path, 'products.jsonl',
+        ''.join(json.dumps({"name": f"P{i}", "price": i, "description": "d"})
+                + '\n' for i in range(100)))
+    conn, report = load(db_path, path, 'jsonl', chunk_size=30)
+    assert report['written'] == 100
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    product_stats = read_stats(conn)
+    assert product_stats['count'] == 103
+    assert product_stats['max'] == 99.0
+    conn.execute('DELETE FROM products WHERE price = 99')
+    assert read_stats(conn)['max'] == 98.0
+def test_interrupted_load_is_restored(db_path, tmp_path):
+    """
+    Test for a load that dies between dropping and recreating the indexes
+    and triggers.
+    Verify that the next load puts them back and repairs the statistics.
+    """
+    conn = sqlite3.connect(db_path)
+    objects = sorted(conn.execute(
+        "SELECT name FROM sqlite_master WHERE tbl_name = 'products' "
+        "AND type IN ('index', 'trigger') AND sql IS NOT NULL").fetchall())
+    statements = drop_secondary_objects(conn)
+    conn.execute(
+        "INSERT INTO products (name, price, description) "
+        "VALUES ('Lost', 500.0, 'd')")
+    conn.commit()
+    conn.close()
+
+    messages = []
+    conn = sqlite3.connect(db_path)
+    assert restore_interrupted_load(conn, messages.append) == len(statements)
+    assert 'interrupted' in messages[0]
+    assert sorted(conn.execute(
+        "SELECT name FROM sqlite_master WHERE tbl_name = 'products' "
+        "AND type IN ('index', 'trigger') AND sql IS NOT NULL").fetchall()
+    ) == objects
+    assert read_stats(conn)['max'] == 500.0
+    assert restore_interrupted_load(conn, messages.append) == 0
+    assert len(messages) == 1
+
+def test_main_refuses_sharded_layout(monkeypatch, tmp_path):
+    """
+    Test for running bulk_import.py against sharded storage.
+    """
+    path = write_file(tmp_path, 'products.csv', 'name,price,description\n')
+    monkeypatch.setattr(database, 'SHARDS', 4)
+    monkeypatch.setattr(sys, 'argv', ['bulk_import.py', path])
+    with pytest.raises(SystemExit):
+        bulk_import.main()
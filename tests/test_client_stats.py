@@ -0,0 +1,129 @@
+import json
+from unittest.mock import patch, MagicMock
+
+import pytest
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+import client_stats
+from api_operations import get_products, delete_product
+from client_stats import OperationStats, RequestEvent, send, session
+
+
+@pytest.fixture
+def stats():
+    """
+    Register an OperationStats hook for the duration of a test.
+    """
+    hook = OperationStats()
+    client_stats.register_hook(hook)
+    yield hook
+    client_stats.unregister_hook(hook)
+
+def event(operation='get_products', status=200, seconds=0.004, **fields):
+    values = dict(
+        operation=operation, method='GET', url='u', status=status,
+        seconds=seconds, request_bytes=0, response_bytes=100, retries=0,
+        error=None)
+    values.update(fields)
+    return RequestEvent(**values)
+
+@patch('api_operations.requests.get')
+def test_send_without_hooks_only_calls_requests(mock_get):
+    """
+    Test for send with no hook registered.
+    """
+    assert client_stats.HOOKS == []
+    assert send('op', 'get', 'http://x', params={'a': 1}) is (
+        mock_get.return_value)
+    mock_get.assert_called_once_with('http://x', params={'a': 1})
+
+@patch('api_operations.requests.get')
+def test_operations_are_recorded(mock_get, stats):
+    """
+    Test for the hooks around api_operations calls.
+    Verify that status codes, sizes and errors reach the statistics.
+    """
+    mock_get.return_value = MagicMock(status_code=200, content=b'[]')
+    mock_get.return_value.json.return_value = []
+    get_products()
+    get_products()
+    with patch('api_operations.requests.delete',
+               side_effect=RequestsConnectionError('down')):
+        delete_product(1)
+    result = stats.as_dict()
+    assert result['get_products']['count'] == 2
+    assert result['get_products']['statuses'] == {'200': 2}
+    assert result['get_products']['response_bytes'] == 4
+    assert result['delete_product']['errors'] == 1
+    assert result['delete_product']['statuses'] == {'ConnectionError': 1}
+
+def test_histogram_and_percentiles():
+    """
+    Test for OperationStats latency buckets and percentile estimates.
+    """
+    stats = OperationStats()
+    for seconds in [0.002] * 90 + [0.3] * 9 + [20.0]:
+        stats.record(event(seconds=seconds))
+    stats.record(event(status=503, retries=2))
+    entry = stats.as_dict()['get_products']
+    assert entry['count'] == 101
+    assert entry['errors'] == 1
+    assert entry['retries'] == 2
+    assert entry['histogram']['0.0025'] == 90
+    assert entry['histogram']['0.5'] == 9
+    assert entry['histogram']['+Inf'] == 1
+    assert entry['latency']['p50'] == 0.0025
+    assert entry['latency']['p99'] == 0.5
+    assert entry['latency']['max'] == 20.0
+
+def test_session_prints_and_dumps(tmp_path, capsys):
+    """
+    Test for session with a summary and a JSON export.
+    """
+    path = tmp_path / 'stats.json'
+    with session(summary=True, json_path=str(path)):
+        client_stats.emit(event())
+    assert client_stats.HOOKS == []
+    assert 'get_products' in capsys.readouterr().out
+    assert json.loads(path.read_text())['get_products']['count'] == 1
+
+def test_session_disabled(capsys):
+    """
+    Test for session without any output requested.
+    """
+    with session(summary=False) as stats:
+        assert stats is None
+        assert client_stats.HOOKS == []
+    assert capsys.readouterr().out == ''
+@patch('client_stats.time.sleep')
+@patch('api_operations.requests.get')
+def test_send_retries_overloaded_responses(mock_get, mock_sleep, stats):
+    """
+    Test for honoring Retry-After on 503 responses.
+    """
+    busy = MagicMock(status_code=503, content=b'{}',
+                     headers={'Retry-After': '2'})
+    ok = MagicMock(status_code=200, content=b'[]')
+    mock_get.side_effect = [busy, ok]
+    assert send('op', 'get', 'http://x') is ok
+    delay = mock_sleep.call_args[0][0]
+    assert 2 <= delay <= 3
+    entry = stats.as_dict()['op']
+    assert entry['count'] == 2 and entry['retries'] == 1
+    assert entry['statuses'] == {'503': 1, '200': 1}
+
+@patch('client_stats.time.sleep')
+@patch('api_operations.requests.post')
+def test_send_backs_off_until_retries_exhausted(mock_post, mock_sleep,
+                                                monkeypatch):
+    """
+    Test for the exponential backoff without Retry-After.
+    """
+    monkeypatch.setattr(client_stats, 'CLIENT_MAX_RETRIES', 3)
+    monkeypatch.setattr(client_stats.random, 'random', lambda: 0.0)
+    busy = MagicMock(status_code=503, headers={})
+    mock_post.return_value = busy
+    assert send('op', 'post', 'http://x', json={}) is busy
+    assert mock_post.call_count == 4
+    assert [c[0][0] for c in mock_sleep.call_args_list] == [
+        client_stats.CLIENT_BACKOFF * 2 ** i for i in range(3)]
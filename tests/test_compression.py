@@ -0,0 +1,78 @@
+import gzip
+
+from unittest.mock import patch
+import compression
+from cache import ResponseCache
+from compression import negotiate, compress
+
+
+def test_negotiate_gzip():
+    """
+    Test for negotiate with a client accepting gzip.
+    """
+    assert negotiate('gzip, deflate') == 'gzip'
+
+def test_negotiate_identity():
+    """
+    Test for negotiate without a usable encoding.
+    Verify that missing headers, unknown encodings and q=0 fall back to
+    identity.
+    """
+    assert negotiate(None) == 'identity'
+    assert negotiate('deflate') == 'identity'
+    assert negotiate('gzip;q=0') == 'identity'
+
+def test_negotiate_wildcard():
+    """
+    Test for negotiate with a wildcard.
+    """
+    assert negotiate('*') in compression.available_encodings()
+
+def test_compress_below_threshold():
+    """
+    Test for compress with a body under COMPRESS_MIN_SIZE.
+    Verify that the body is returned unchanged.
+    """
+    body = b'[]'
+    assert compress(body, 'gzip') == (body, 'identity')
+
+def test_compress_gzip():
+    """
+    Test for compress with a large body.
+    Verify that the gzip output decompresses to the original body.
+    """
+    body = b'{"description": "A very compressible product"}' * 100
+    encoded, encoding = compress(body, 'gzip')
+    assert encoding == 'gzip'
+    assert len(encoded) < len(body)
+    assert gzip.decompress(encoded) == body
+
+@patch('cache.compression.compress', wraps=compression.compress)
+def test_cache_fetch_reuses_compressed_body(mock_compress):
+    """
+    Test for ResponseCache.fetch.
+    Verify that repeated hits neither re-render nor recompress the body.
+    """
+    cache = ResponseCache(ttl=60)
+    renders = []
+    def render():
+        renders.append(1)
+        return b'x' * 2048
+    first = cache.fetch('products', 'gzip', render)
+    second = cache.fetch('products', 'gzip', render)
+    assert first == second
+    assert first[1] == 'gzip'
+    assert len(renders) == 1
+    mock_compress.assert_called_once()
+
+def test_cache_invalidate_drops_stale_render():
+    """
+    Test for ResponseCache.invalidate.
+    Verify that a body rendered before a write is not stored.
+    """
+    cache = ResponseCache(ttl=60)
+    def render():
+        cache.invalidate()
+        return b'stale'
+    cache.fetch('products', 'identity', render)
+    assert cache.get('products', 'identity') is None
@@ -0,0 +1,65 @@
+import csv
+import io
+
+import pytest
+import export
+from export import available_formats, stream_export
+from utilities import read_products_export
+
+
+def test_available_formats():
+    """
+    Test for available_formats.
+    Verify that CSV is always offered.
+    """
+    assert 'csv' in available_formats()
+
+def test_stream_csv_in_batches(db_path):
+    """
+    Test for stream_export in CSV.
+    Verify that every row is written, one chunk per batch.
+    """
+    chunks = list(stream_export('csv', batch_size=2))
+    assert len(chunks) == 2
+    rows = list(csv.reader(io.StringIO(b''.join(chunks).decode())))
+    assert rows[0] == ['id', 'name', 'price', 'description']
+    assert rows[1:] == [
+        ['1', 'Product A', '10.0', 'First product'],
+        ['2', 'Product B', '20.5', 'Second product'],
+        ['3', 'Product C', '30.0', 'Third product']]
+
+def test_stream_unsupported_format(db_path):
+    """
+    Test for stream_export with an unknown format.
+    """
+    with pytest.raises(ValueError):
+        list(stream_export('xml'))
+
+@pytest.mark.parametrize('export_format', ['csv', 'arrow', 'parquet'])
+def test_read_products_export(db_path, export_format):
+    """
+    Test for read_products_export.
+    Verify that each format loads into a typed DataFrame.
+    """
+    if export_format not in available_formats():
+        pytest.skip('pyarrow is not installed')
+    data = b''.join(stream_export(export_format, batch_size=2))
+    frame = read_products_export(data, export_format)
+    assert list(frame.columns) == ['id', 'name', 'price', 'description']
+    assert frame['id'].dtype == 'int64'
+    assert frame['price'].dtype == 'float64'
+    assert frame['name'].tolist() == ['Product A', 'Product B', 'Product C']
+    assert frame['name'].dtype == 'string'
+    assert frame['description'].dtype == 'string'
+
+@pytest.mark.parametrize('export_format', ['csv', 'arrow', 'parquet'])
+def test_read_products_export_categories(db_path, export_format):
+    """
+    Test for read_products_export with categorical text columns.
+    """
+    if export_format not in available_formats():
+        pytest.skip('pyarrow is not installed')
+    data = b''.join(stream_export(export_format))
+    frame = read_products_export(data, export_format, ('description',))
+    assert frame['description'].dtype == 'category'
+    assert frame['name'].dtype == 'string'
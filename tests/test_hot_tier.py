@@ -0,0 +1,135 @@
+import sqlite3
+
+import pytest
+import database
+import hot_tier
+from hot_tier import HotTierStore
+
+
+@pytest.fixture
+def hot_store(db_path, monkeypatch):
+    """
+    Serve the temporary database through the hot tier.
+    """
+    monkeypatch.setattr(database, 'HOT_TIER', True)
+    return database.get_store()
+
+def test_get_store_wraps_in_hot_tier(hot_store):
+    """
+    Test for get_store with PRODUCTS_HOT_TIER.
+    """
+    assert isinstance(hot_store, HotTierStore)
+    assert isinstance(hot_store.backing, database.SQLiteStore)
+
+def test_reads_match_sqlite(hot_store):
+    """
+    Test for HotTierStore.fetch_products and fetch_product.
+    """
+    assert hot_store.fetch_products() == hot_store.backing.fetch_products()
+    assert hot_store.fetch_product(2) == hot_store.backing.fetch_product(2)
+    assert hot_store.fetch_product(99) is None
+
+@pytest.mark.parametrize('filters', [
+    {},
+    {'min_id': 2},
+    {'max_id': 2},
+    {'min_id': 2, 'max_id': 2},
+    {'min_price': 20.5},
+    {'max_price': 20.5},
+    {'min_id': 1, 'max_id': 3, 'min_price': 15, 'max_price': 40},
+    {'min_id': 3, 'max_id': 1},
+    {'min_price': 100},
+])
+def test_filters_match_sqlite(hot_store, filters):
+    """
+    Test for HotTierStore.filter_products against the SQL filters.
+    """
+    assert (hot_store.filter_products(filters)
+            == hot_store.backing.filter_products(filters))
+
+def test_filters_without_numpy(hot_store, monkeypatch):
+    """
+    Test for the pure Python price scan.
+    """
+    monkeypatch.setattr(hot_tier, 'numpy', None)
+    keys, rows = hot_store.filter_products({'min_price': 15})
+    assert [row[0] for row in rows] == [2, 3]
+
+def test_writes_go_through(hot_store, db_path):
+    """
+    Test for HotTierStore.insert_product, update_product and delete_product.
+    Verify that SQLite and the in-memory columns stay in sync.
+    """
+    hot_store.fetch_products()
+    new_id = hot_store.insert_product(
+        {"name": "Product D", "price": 5.0, "description": "Fourth"})
+    hot_store.update_product(
+        1, {"name": "Product A2", "price": 11.0, "description": "Changed"})
+    hot_store.delete_product(2)
+    assert hot_store.fetch_products() == hot_store.backing.fetch_products()
+    assert [row[0] for row in hot_store.fetch_products()[1]] == [1, 3, new_id]
+    assert hot_store.filter_products({'max_price': 11}) == (
+        hot_tier.KEYS, [(1, 'Product A2', 11.0, 'Changed'),
+                        (new_id, 'Product D', 5.0, 'Fourth')])
+
+def test_reads_do_not_touch_disk(hot_store, db_path):
+    """
+    Test for serving reads from memory once loaded.
+    """
+    hot_store.fetch_products()
+    conn = sqlite3.connect(db_path)
+    conn.execute('DELETE FROM products')
+    conn.commit()
+    conn.close()
+    assert len(hot_store.fetch_products()[1]) == 3
+    assert hot_store.fetch_product(1)['name'] == 'Product A'
+
+def test_ttl_reloads(db_path):
+    """
+    Test for seeing writes of other processes after HOT_TIER_TTL.
+    """
+    store = HotTierStore(database.SQLiteStore(db_path), ttl=0.01)
+    store.fetch_products()
+    conn = sqlite3.connect(db_path)
+    conn.execute('DELETE FROM products WHERE id = 1')
+    conn.commit()
+    conn.close()
+    store.loaded_at -= 1
+    assert [row[0] for row in store.fetch_products()[1]] == [2, 3]
+
+def test_strings_are_interned(hot_store):
+    """
+    Test for sharing repeated strings between rows.
+    """
+    for _ in range(2):
+        hot_store.insert_product(
+            {"name": "Same", "price": 1.0, "description": "Shared text"})
+    assert hot_store.descriptions[-1] is hot_store.descriptions[-2]
+    assert hot_store.memory_usage()['rows'] == 5
+
+def test_iter_batches(hot_store):
+    """
+    Test for HotTierStore.iter_batches.
+    """
+    batches = list(hot_store.iter_batches(2))
+    assert [len(batch) for batch in batches] == [2, 1]
+
+def test_patch_goes_through(hot_store):
+    """
+    Test for HotTierStore.patch_product.
+    """
+    hot_store.fetch_products()
+    product, changed = hot_store.patch_product(3, {"price": 31.0})
+    assert changed and product['price'] == 31.0
+    assert hot_store.fetch_product(3) == hot_store.backing.fetch_product(3)
+    assert hot_store.patch_product(3, {"price": 31.0})[1] is False
+def test_writes_store_rows_as_sqlite_did(hot_store):
+    """
+    Test for keeping the values SQLite stored, not the request's.
+    """
+    hot_store.fetch_products()
+    product_id = hot_store.insert_product(
+        {"name": 5, "price": 2, "description": "d"})
+    hot_store.update_product(1, {"name": 7, "price": 3, "description": "d"})
+    assert hot_store.fetch_products() == hot_store.backing.fetch_products()
+    assert hot_store.fetch_product(product_id)['name'] == '5'
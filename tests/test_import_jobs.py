@@ -0,0 +1,191 @@
+import io
+import json
+
+import pytest
+import bulk_import
+import import_jobs
+from import_jobs import iter_json_array, open_spool, run_job
+
+
+CSV_BODY = (
+    'name,price,description\n'
+    'Imported 1,1.5,First import\n'
+    'Imported 2,not a price,Broken row\n'
+    'Imported 3,3.5,Third import\n')
+
+
+def wait_for_job(client, job_id: int) -> dict:
+    """Wait for the import worker to be idle and return the job."""
+    import_jobs.worker.queue.join()
+    return client.get(f'/jobs/{job_id}').get_json()
+
+def test_iter_json_array():
+    """
+    Test for iter_json_array across read boundaries.
+    """
+    records = [{"name": f"P{i}", "price": i, "description": "d, [x]"}
+               for i in range(20)]
+    text = ' [\n' + ',\n'.join(json.dumps(r) for r in records) + '\n] '
+    parsed = list(iter_json_array(io.StringIO(text), chunk_size=7))
+    assert parsed == list(enumerate(records, start=1))
+    assert list(iter_json_array(io.StringIO('[]'))) == []
+
+@pytest.mark.parametrize('text', ['{"a": 1}', '[{"a": 1}', '[{"a": 1} {}]'])
+def test_iter_json_array_invalid(text):
+    """
+    Test for iter_json_array with malformed documents.
+    """
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(text)))
+
+def test_import_csv(client):
+    """
+    Test for POST /products/import and GET /jobs/<id> with a CSV upload.
+    Verify that valid rows are loaded and rejected rows are reported.
+    """
+    response = client.post(
+        '/products/import', data=CSV_BODY.encode(),
+        headers={'Content-Type': 'text/csv'})
+    assert response.status_code == 202
+    job_id = response.get_json()['id']
+    assert response.headers['Location'] == f'/jobs/{job_id}'
+    job = wait_for_job(client, job_id)
+    assert job['status'] == 'done'
+    assert job['progress'] == 1.0
+    assert (job['records'], job['written'], job['rejected']) == (3, 2, 1)
+    assert job['errors'] == [{'record': 2, 'error': 'Price must be a number'}]
+    names = [p['name'] for p in client.get('/products').get_json()]
+    assert names[-2:] == ['Imported 1', 'Imported 3']
+    assert client.get('/products/stats').get_json()['count'] == 5
+
+@pytest.mark.parametrize('path, body', [
+    ('/products/import?format=json',
+     '[{"name": "J", "price": 2, "description": "From JSON"}]'),
+    ('/products/import?format=ndjson',
+     '{"name": "J", "price": 2, "description": "From JSON"}\n'),
+])
+def test_import_json_formats(client, path, body):
+    """
+    Test for POST /products/import with a JSON array and JSON Lines.
+    """
+    response = client.post(path, data=body.encode())
+    assert response.status_code == 202
+    job = wait_for_job(client, response.get_json()['id'])
+    assert job['status'] == 'done' and job['written'] == 1
+    assert client.get('/products/4').get_json()['name'] == 'J'
+
+def test_import_duplicate_ids_fail_without_upsert(client):
+    """
+    Test for importing ids that already exist.
+    Verify that the job fails unless upsert=1 is given.
+    """
+    body = b'id,name,price,description\n1,Replaced,9.0,Again\n'
+    headers = {'Content-Type': 'text/csv'}
+    job_id = client.post(
+        '/products/import', data=body, headers=headers).get_json()['id']
+    job = wait_for_job(client, job_id)
+    assert job['status'] == 'failed'
+    assert 'upsert=1' in job['message']
+    job_id = client.post(
+        '/products/import?upsert=1', data=body,
+        headers=headers).get_json()['id']
+    assert wait_for_job(client, job_id)['status'] == 'done'
+    assert client.get('/products/1').get_json()['name'] == 'Replaced'
+
+def test_import_errors(client):
+    """
+    Test for POST /products/import without a known format and for
+    GET /jobs/<id> with an unknown job.
+    """
+    response = client.post('/products/import?format=xml', data=b'x')
+    assert response.status_code == 400
+    response = client.post(
+        '/products/import', data=b'x', headers={'Content-Type': 'text/plain'})
+    assert response.status_code == 400
+    assert client.get('/jobs/999').status_code == 404
+
+def test_import_reader_error_fails_job(client):
+    """
+    Test for a CSV the reader cannot parse (a field over the csv module's
+    size limit).
+    Verify that the job is marked failed instead of staying running.
+    """
+    body = ('name,price,description\nBig,1.0,' + 'x' * 200000
+            + '\n').encode()
+    response = client.post(
+        '/products/import', data=body, headers={'Content-Type': 'text/csv'})
+    job = wait_for_job(client, response.get_json()['id'])
+    assert job['status'] == 'failed'
+    assert 'field larger than field limit' in job['message']
+
+def test_unexpected_error_fails_job(db_path, monkeypatch):
+    """
+    Test for an error no handler expects.
+    """
+    spool = open_spool('jsonl')
+    spool.write(b'{"name": "A", "price": 1, "description": "d"}\n')
+    spool.file.close()
+    conn = import_jobs.connect()
+    with conn:
+        conn.execute(
+            "UPDATE import_jobs SET status = 'queued' WHERE id = ?",
+            (spool.job_id,))
+    conn.close()
+
+    def broken(batch):
+        raise RuntimeError('bug')
+
+    monkeypatch.setattr(bulk_import, 'validate_batch', broken)
+    run_job(spool.job_id)
+    job = import_jobs.get_job(spool.job_id)
+    assert job['status'] == 'failed' and 'bug' in job['message']
+
+def test_job_resumes_after_last_chunk(db_path, monkeypatch):
+    """
+    Test for resuming an interrupted job.
+    Verify that committed chunks are not loaded twice.
+    """
+    spool = open_spool('jsonl')
+    for i in range(5):
+        spool.write(json.dumps(
+            {"name": f"R{i}", "price": i, "description": "d"}).encode() + b'\n')
+    spool.file.close()
+    conn = import_jobs.connect()
+    with conn:
+        conn.execute(
+            "UPDATE import_jobs SET status = 'queued' WHERE id = ?",
+            (spool.job_id,))
+    conn.close()
+
+    validate_batch = bulk_import.validate_batch
+    calls = []
+
+    class ServerStopped(BaseException):
+        """Stands for the process dying, which no handler sees."""
+
+    def crash_on_second_chunk(batch):
+        calls.append(batch)
+        if len(calls) == 2:
+            raise ServerStopped()
+        return validate_batch(batch)
+
+    monkeypatch.setattr(bulk_import, 'validate_batch', crash_on_second_chunk)
+    with pytest.raises(ServerStopped):
+        run_job(spool.job_id, chunk_size=2)
+    job = import_jobs.get_job(spool.job_id)
+    assert (job['status'], job['records'], job['written']) == ('running', 2, 2)
+
+    # A fresh heartbeat means another process may still be running it
+    run_job(spool.job_id, chunk_size=2)
+    assert import_jobs.get_job(spool.job_id)['records'] == 2
+
+    monkeypatch.setattr(bulk_import, 'validate_batch', validate_batch)
+    monkeypatch.setattr(import_jobs, 'IMPORT_STALE_SECONDS', -1)
+    run_job(spool.job_id, chunk_size=2)
+    job = import_jobs.get_job(spool.job_id)
+    assert (job['status'], job['records'], job['written']) == ('done', 5, 5)
+    conn = import_jobs.connect()
+    names = [row[0] for row in conn.execute(
+        "SELECT name FROM products WHERE name LIKE 'R%' ORDER BY id")]
+    conn.close()
+    assert names == [f'R{i}' for i in range(5)]
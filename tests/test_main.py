@@ -1,5 +1,5 @@
 import pytest
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 from main import (
     main,
     operation,
@@ -53,14 +53,15 @@ def test_operation_insert_product(mock_create, mock_input):
     mock_create.assert_called_once()
 
 @patch('builtins.input', side_effect=['2', '0'])
-@patch('main.get_products')
+@patch('main.get_products_frame')
 @patch('main.print_data')
 def test_operation_view_products(mock_print, mock_get, mock_input):
     """
     Test the 'View all products' option in the operation function.
-    Mock user input and verify that get_products and print_data are called.
+    Mock user input and verify that get_products_frame and print_data
+    are called.
     """
-    mock_get.return_value = [{"id": 1, "name": "Test Product"}]
+    mock_get.return_value = MagicMock()
     operation()
     mock_get.assert_called()
     mock_print.assert_called()
@@ -69,15 +70,28 @@ def test_operation_view_products(mock_print, mock_get, mock_input):
     'builtins.input', 
     side_effect=['3', '1', 'Updated Product',
                  'Updated Description', '25.0', '0'])
-@patch('main.update_product')
+@patch('main.patch_product')
 def test_operation_update_product(mock_update, mock_input):
     """
     Test the 'Update product' option in the operation function.
     Mock user input to simulate updating a product 
-    and verify that update_product is called.
+    and verify that patch_product is called with the fields entered.
     """
     operation()
-    mock_update.assert_called_once()
+    mock_update.assert_called_once_with(1, {
+        "name": "Updated Product",
+        "description": "Updated Description",
+        "price": 25.0})
+
+@patch('builtins.input', side_effect=['3', '1', '', '', '19.5', '0'])
+@patch('main.patch_product')
+def test_operation_update_price_only(mock_update, mock_input):
+    """
+    Test the 'Update product' option when only the price is entered.
+    Verify that only the price is sent.
+    """
+    operation()
+    mock_update.assert_called_once_with(1, {"price": 19.5})
     
 @patch('builtins.input', side_effect=['4', '1', '0'])
 @patch('main.delete_product')
@@ -106,13 +120,13 @@ def test_operation_delete_product_wrong_id(mock_delete, mock_input):
     
 @patch(
     'builtins.input', 
-    side_effect=['3', '1', 'Product AA', 'Description AA','','0'])
+    side_effect=['3', '1', 'Product AA', 'Description AA','abc','0'])
 @patch('utilities.log_error_to_file')
 def test_operation_update_product_wrong_price(mock_log, mock_input):
     """
     Test the 'Update product' option in the operation function.
     Mock user input to simulate updating a product with an invalid price
-    (empty string). Verify that 'log_error_to_file' is called once
+    (not a number). Verify that 'log_error_to_file' is called once
     when an invalid price is provided.
     """
     operation()
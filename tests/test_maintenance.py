@@ -0,0 +1,117 @@
+import os
+import sqlite3
+
+import maintenance
+from maintenance import Maintainer
+
+
+def insert_and_delete(path: str, rows: int) -> None:
+    """Grow a database and delete what was added, leaving free pages."""
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        'INSERT INTO products (name, price, description) VALUES (?, ?, ?)',
+        ((f'P{i}', 1.0, 'x' * 500) for i in range(rows)))
+    conn.commit()
+    conn.execute('DELETE FROM products WHERE id > 3')
+    conn.commit()
+    conn.close()
+
+def test_new_databases_use_incremental_vacuum(db_path):
+    """
+    Test for auto_vacuum=INCREMENTAL in database.SCHEMA.
+    """
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('PRAGMA auto_vacuum').fetchone()[0] == (
+        maintenance.AUTO_VACUUM_INCREMENTAL)
+    conn.close()
+
+def test_incremental_vacuum_reclaims_space(db_path):
+    """
+    Test for Maintainer.run_once when idle.
+    Verify that free pages left by deletes are returned to the disk.
+    """
+    insert_and_delete(db_path, 2000)
+    before = os.path.getsize(db_path)
+    maintainer = Maintainer()
+    maintainer.run_once()
+    task = maintainer.tasks['incremental_vacuum']
+    assert task['runs'] == 1
+    assert task['last_result'][db_path]['freed_pages'] > 0
+    assert os.path.getsize(db_path) < before
+    assert maintainer.reclaimed_bytes >= before - os.path.getsize(db_path)
+    assert maintainer.tasks['optimize']['last_result'][db_path] == {
+        'full_analyze': True, 'reclaimed_bytes': 0}
+
+def test_truncate_checkpoint_empties_wal(db_path):
+    """
+    Test for the WAL checkpoints.
+    """
+    # An open connection keeps SQLite from removing the WAL on close
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('SELECT COUNT(*) FROM products').fetchone()
+    insert_and_delete(db_path, 500)
+    assert os.path.getsize(db_path + '-wal') > 0
+    maintainer = Maintainer()
+    maintainer.run_once()
+    assert os.path.getsize(db_path + '-wal') == 0
+    conn.close()
+    result = maintainer.tasks['checkpoint_passive']['last_result'][db_path]
+    assert result['busy'] is False
+    assert result['checkpointed_pages'] == result['wal_pages']
+
+def test_busy_server_defers_idle_tasks(db_path):
+    """
+    Test for deferring idle-only tasks while requests are in flight.
+    """
+    maintainer = Maintainer()
+    maintainer.request_started()
+    maintainer.run_once()
+    assert maintainer.tasks['checkpoint_passive']['runs'] == 1
+    for name in ('checkpoint_truncate', 'optimize', 'incremental_vacuum'):
+        assert maintainer.tasks[name]['runs'] == 0
+        assert maintainer.tasks[name]['deferred'] == 1
+    maintainer.request_finished()
+    assert not maintainer.idle()
+
+def test_overdue_tasks_run_under_load(db_path):
+    """
+    Test for MAINTENANCE_MAX_DEFER.
+    """
+    maintainer = Maintainer(max_defer=0)
+    maintainer.request_started()
+    maintainer.run_once()
+    assert maintainer.tasks['incremental_vacuum']['runs'] == 1
+
+def test_tasks_wait_for_their_period(db_path):
+    """
+    Test for the schedule of each task.
+    """
+    maintainer = Maintainer(interval=60, optimize_interval=3600)
+    maintainer.run_once()
+    maintainer.run_once()
+    assert all(task['runs'] == 1 for task in maintainer.tasks.values())
+
+def test_enable_incremental_vacuum(tmp_path):
+    """
+    Test for converting a database created without auto_vacuum.
+    """
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE t (x)')
+    conn.close()
+    maintenance.enable_incremental_vacuum(path)
+    assert maintenance.database_status(path)['incremental_vacuum'] is True
+
+def test_maintenance_status(client, db_path):
+    """
+    Test for GET /maintenance.
+    """
+    response = client.get('/maintenance')
+    assert response.status_code == 200
+    status = response.get_json()
+    assert set(status['tasks']) == {
+        'checkpoint_passive', 'checkpoint_truncate', 'optimize',
+        'incremental_vacuum'}
+    assert status['databases'][0]['path'] == db_path
+    assert status['databases'][0]['incremental_vacuum'] is True
@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+import database
+import profiling
+import serialization
+from database import get_store
+
+
+@pytest.fixture
+def profiled_client(db_path, tmp_path, monkeypatch):
+    """
+    Flask application with profiling enabled and no random sampling.
+    """
+    monkeypatch.setattr(profiling, 'PROFILE_ENABLED', True)
+    monkeypatch.setattr(profiling, 'PROFILE_SAMPLE_RATE', 0.0)
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', str(tmp_path / 'profiles'))
+    monkeypatch.setattr(profiling, 'PROFILE_KEEP', 2)
+    monkeypatch.setattr(database, 'CONNECTION_HOOKS', [])
+    monkeypatch.setattr(database, 'DISCONNECT_HOOKS', [])
+    monkeypatch.setattr(profiling, 'profiles', [])
+    app = Flask(__name__)
+
+    @app.route('/products')
+    def products():
+        keys, rows = get_store().fetch_products()
+        return serialization.encode_rows(keys, rows)
+
+    profiling.install(app)
+    return app.test_client()
+
+def test_install_disabled():
+    """
+    Test for install with profiling disabled.
+    Verify that no hook or route is registered.
+    """
+    app = Flask(__name__)
+    profiling.install(app)
+    assert not app.before_request_funcs
+    assert 'list_profiles' not in app.view_functions
+
+def test_unprofiled_request(profiled_client):
+    """
+    Test for a request without the X-Profile header.
+    """
+    response = profiled_client.get('/products')
+    assert 'X-Profile-Id' not in response.headers
+    assert profiled_client.get('/debug/profiles').get_json() == []
+
+def test_profiled_request(profiled_client, tmp_path):
+    """
+    Test for a request sent with X-Profile: 1.
+    Verify the report, the debug endpoints and the dumped files.
+    """
+    response = profiled_client.get('/products', headers={'X-Profile': '1'})
+    assert response.status_code == 200
+    assert 'sql;dur=' in response.headers['Server-Timing']
+    profile_id = response.headers['X-Profile-Id']
+
+    report = profiled_client.get(f'/debug/profiles/{profile_id}').get_json()
+    assert report['path'] == '/products'
+    assert report['statements'][0]['sql'].startswith('SELECT * FROM products')
+    assert report['statements'][0]['seconds'] >= 0
+    assert report['serialization_seconds'] > 0
+    assert report['functions']
+    assert profiled_client.get('/debug/profiles/999').status_code == 404
+
+    for _ in range(2):
+        profiled_client.get('/products', headers={'X-Profile': '1'})
+    files = sorted(os.listdir(tmp_path / 'profiles'))
+    assert len(files) == 4
+    with open(tmp_path / 'profiles' / files[0]) as file:
+        assert json.load(file)['path'] == '/products'
+
+def test_statement_time_excludes_encoding(profiled_client, monkeypatch):
+    """
+    Test that statements are timed until their connection is closed.
+    Verify that the encoding of the rows is not counted as SQL time.
+    """
+    encode_rows = serialization.encode_rows
+
+    def slow_encode_rows(keys, rows):
+        time.sleep(0.2)
+        return encode_rows(keys, rows)
+
+    monkeypatch.setattr(serialization, 'encode_rows', slow_encode_rows)
+    response = profiled_client.get('/products', headers={'X-Profile': '1'})
+    profile_id = response.headers['X-Profile-Id']
+    report = profiled_client.get(f'/debug/profiles/{profile_id}').get_json()
+    assert report['seconds'] >= 0.2
+    assert report['sql_seconds'] < 0.2
+    assert all(s['seconds'] is not None for s in report['statements'])
+def test_should_profile_sampling(monkeypatch):
+    """
+    Test for should_profile with a sampling rate.
+    """
+    monkeypatch.setattr(profiling, 'PROFILE_SAMPLE_RATE', 0.0)
+    assert not profiling.should_profile(None)
+    assert profiling.should_profile('1')
+    monkeypatch.setattr(profiling, 'PROFILE_SAMPLE_RATE', 1.0)
+    assert profiling.should_profile(None)
+def test_one_profile_at_a_time(profiled_client):
+    """
+    Test for a profiled request arriving while another one is profiled.
+    Verify that it is served without a profile instead of failing.
+    """
+    started, done = threading.Event(), threading.Event()
+
+    def other_request():
+        profiling.start('GET', '/other')
+        started.set()
+        done.wait(5)
+        profiling.stop()
+
+    thread = threading.Thread(target=other_request)
+    thread.start()
+    started.wait(5)
+    try:
+        response = profiled_client.get(
+            '/products', headers={'X-Profile': '1'})
+    finally:
+        done.set()
+        thread.join()
+    assert response.status_code == 200
+    assert 'X-Profile-Id' not in response.headers
+    response = profiled_client.get('/products', headers={'X-Profile': '1'})
+    assert 'X-Profile-Id' in response.headers
+
+def test_profiler_already_active(profiled_client, monkeypatch):
+    """
+    Test for enable() refused because another profiler is active.
+    """
+    def refuse(self):
+        raise ValueError('Another profiling tool is already active')
+
+    monkeypatch.setattr(profiling.cProfile.Profile, 'enable', refuse)
+    response = profiled_client.get('/products', headers={'X-Profile': '1'})
+    assert response.status_code == 200
+    assert 'X-Profile-Id' not in response.headers
+    assert profiling._active.acquire(blocking=False)
+    profiling._active.release()
@@ -0,0 +1,46 @@
+import json
+import sqlite3
+
+from unittest.mock import patch
+import database
+from serialization import dumps, encode_rows, query_rows
+
+
+def make_connection():
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    database.init_db(conn)
+    conn.execute(
+        'INSERT INTO products (name, price, description) '
+        'VALUES (\'Product "A"\', 10.0, \'Ünïcode\')')
+    return conn
+
+def test_query_rows_returns_tuples():
+    """
+    Test for query_rows.
+    Verify that rows are plain tuples even with a sqlite3.Row factory.
+    """
+    keys, rows = query_rows(make_connection(), 'SELECT * FROM products')
+    assert keys == ('id', 'name', 'price', 'description')
+    assert rows == [(1, 'Product "A"', 10.0, 'Ünïcode')]
+
+def test_encode_rows():
+    """
+    Test for encode_rows.
+    Verify that rows are encoded as a JSON array of objects.
+    """
+    keys, rows = query_rows(make_connection(), 'SELECT * FROM products')
+    assert json.loads(encode_rows(keys, rows)) == [{
+        "id": 1,
+        "name": 'Product "A"',
+        "price": 10.0,
+        "description": 'Ünïcode'}]
+
+@patch('serialization.orjson', None)
+def test_dumps_stdlib_fallback():
+    """
+    Test for dumps without orjson installed.
+    Verify that the stdlib encoder produces the same document.
+    """
+    data = [{"id": 1, "price": 2.5, "name": "Ünïcode"}]
+    assert json.loads(dumps(data)) == data
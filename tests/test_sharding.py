@@ -0,0 +1,130 @@
+import csv
+import io
+import os
+import sqlite3
+
+import pytest
+import database
+import sharding
+from export import stream_export
+from sharding import ShardedStore, reshard, shard_paths
+
+
+@pytest.fixture
+def sharded(tmp_path, monkeypatch):
+    """
+    Configure a three-shard layout holding five products.
+    """
+    path = str(tmp_path / 'products.db')
+    monkeypatch.setattr(database, 'DATABASE', path)
+    monkeypatch.setattr(database, 'SHARDS', 3)
+    store = database.get_store()
+    for i in range(5):
+        store.insert_product(
+            {"name": f"P{i}", "price": 10.0 * i, "description": "d"})
+    return store
+
+def test_shard_paths():
+    """
+    Test for shard_paths.
+    """
+    assert shard_paths('products.db', 0) == ['products.db']
+    assert shard_paths('data/products.db', 2) == [
+        'data/products-0-of-2.db', 'data/products-1-of-2.db']
+
+def test_insert_spreads_across_shards(sharded):
+    """
+    Test for ShardedStore.insert_product.
+    Verify that ids are unique and each row lives in shard id % N.
+    """
+    assert isinstance(sharded, ShardedStore)
+    for index, shard in enumerate(sharded.shards):
+        keys, rows = shard.fetch_products()
+        assert rows
+        assert all(row[0] % 3 == index for row in rows)
+    keys, rows = sharded.fetch_products()
+    ids = [row[0] for row in rows]
+    assert ids == sorted(set(ids))
+    assert [row[1] for row in rows] == [f'P{i}' for i in range(5)]
+
+def test_ids_are_never_reused(sharded):
+    """
+    Test for id allocation after deleting the newest products.
+    """
+    keys, rows = sharded.fetch_products()
+    last_id = rows[-1][0]
+    for row in rows:
+        sharded.delete_product(row[0])
+    assert sharded.insert_product(
+        {"name": "New", "price": 1.0, "description": "d"}) > last_id
+
+def test_point_operations(sharded):
+    """
+    Test for point reads, updates and deletes on a sharded store.
+    """
+    keys, rows = sharded.fetch_products()
+    product_id = rows[2][0]
+    sharded.update_product(
+        product_id, {"name": "X", "price": 1.5, "description": "y"})
+    assert sharded.fetch_product(product_id) == {
+        "id": product_id, "name": "X", "price": 1.5, "description": "y"}
+    sharded.delete_product(product_id)
+    assert sharded.fetch_product(product_id) is None
+
+def test_stats_and_export_merge_shards(sharded):
+    """
+    Test for fan-out statistics and exports.
+    """
+    product_stats = sharded.read_stats()
+    assert product_stats['count'] == 5
+    assert product_stats['sum'] == 100.0
+    assert (product_stats['min'], product_stats['max']) == (0.0, 40.0)
+    assert sum(b['count'] for b in product_stats['histogram']) == 5
+    data = b''.join(stream_export('csv', batch_size=2)).decode()
+    rows = list(csv.DictReader(io.StringIO(data)))
+    assert [row['name'] for row in rows] == [f'P{i}' for i in range(5)]
+
+def test_routes_on_sharded_store(sharded):
+    """
+    Test for the Flask routes with PRODUCTS_SHARDS set.
+    """
+    from app import app
+    from cache import response_cache
+    response_cache.invalidate()
+    client = app.test_client()
+    assert client.post('/products', json={
+        "name": "P5", "price": 50.0, "description": "d"}).status_code == 201
+    products = client.get('/products').get_json()
+    assert [p['name'] for p in products] == [f'P{i}' for i in range(6)]
+    assert client.get(f"/products/{products[-1]['id']}").get_json()[
+        'name'] == 'P5'
+    assert client.get('/products/stats').get_json()['count'] == 6
+
+def test_reshard(db_path):
+    """
+    Test for reshard from the unsharded file to two shards and back.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.execute('DELETE FROM products WHERE id = 3')
+    conn.commit()
+    conn.close()
+    assert reshard(db_path, 0, 2, chunk_size=1,
+                   progress=lambda line: None) == 2
+    store = ShardedStore(shard_paths(db_path, 2))
+    keys, rows = store.fetch_products()
+    assert [row[0] for row in rows] == [1, 2]
+    assert store.read_stats()['count'] == 2
+    assert store.insert_product(
+        {"name": "New", "price": 1.0, "description": "d"}) > 3
+
+    with pytest.raises(FileExistsError):
+        reshard(db_path, 0, 2)
+    os.rename(db_path, db_path + '.old')
+    assert reshard(db_path, 2, 0, progress=lambda line: None) == 3
+
+def test_filter_products_merges_shards(sharded):
+    """
+    Test for ShardedStore.filter_products.
+    """
+    keys, rows = sharded.filter_products({'min_price': 15, 'max_price': 35})
+    assert [row[1] for row in rows] == ['P2', 'P3']
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from singleflight import SingleFlight
+
+
+def test_do_coalesces_concurrent_calls():
+    """
+    Test for SingleFlight.do from several threads.
+    Verify that the work runs once and every caller gets its result.
+    """
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return b'body'
+
+    results = []
+    leader = threading.Thread(
+        target=lambda: results.append(flights.do('products', work)))
+    leader.start()
+    started.wait(5)
+    followers = [
+        threading.Thread(
+            target=lambda: results.append(flights.do('products', work)))
+        for _ in range(4)]
+    for thread in followers:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while flights.metrics()['coalesced'] < 4 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == [b'body'] * 5
+    assert flights.metrics() == {'leaders': 1, 'coalesced': 4, 'in_flight': 0}
+
+def test_do_propagates_errors():
+    """
+    Test for SingleFlight.do when the work fails.
+    Verify that the error is raised and the key is released.
+    """
+    flights = SingleFlight()
+    def fail():
+        raise ValueError('boom')
+    with pytest.raises(ValueError):
+        flights.do('products', fail)
+    assert flights.do('products', lambda: 1) == 1
+
+def test_do_async_coalesces_concurrent_calls():
+    """
+    Test for SingleFlight.do_async.
+    Verify that concurrent coroutines share a single execution.
+    """
+    flights = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return b'body'
+
+    async def main():
+        return await asyncio.gather(
+            *[flights.do_async('products', work) for _ in range(5)])
+
+    assert asyncio.run(main()) == [b'body'] * 5
+    assert calls == [1]
+    assert flights.metrics()['coalesced'] == 4
+def test_do_async_survives_cancelled_leader():
+    """
+    Test for SingleFlight.do_async when the leading request is cancelled.
+    Verify that the followers run the work again instead of failing.
+    """
+    flights = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return b'body'
+
+    async def main():
+        leader = asyncio.ensure_future(flights.do_async('products', work))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(flights.do_async('products', work))
+                     for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        return leader.cancelled(), results
+
+    assert asyncio.run(main()) == (True, [b'body'] * 3)
+    assert calls == [1, 1]
+    assert flights.metrics()['in_flight'] == 0
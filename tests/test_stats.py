@@ -0,0 +1,107 @@
+import sqlite3
+
+import pytest
+import database
+from stats import install_stats, read_stats
+
+
+def make_connection():
+    conn = sqlite3.connect(':memory:')
+    database.init_db(conn)
+    conn.executemany(
+        'INSERT INTO products (name, price, description) VALUES (?, ?, ?)',
+        [('A', 5.0, 'a'), ('B', 12.0, 'b'), ('C', 18.0, 'c'),
+         ('D', 31.5, 'd')])
+    conn.commit()
+    return conn
+
+def full_scan(conn, width):
+    """Compute the statistics the slow way, for comparison."""
+    prices = [row[0] for row in conn.execute('SELECT price FROM products')]
+    counts = {}
+    for price in prices:
+        bucket = int(price // width)
+        counts[bucket] = counts.get(bucket, 0) + 1
+    return {
+        'count': len(prices),
+        'sum': sum(prices),
+        'min': min(prices, default=None),
+        'max': max(prices, default=None),
+        'histogram': [
+            {'min': b * width, 'max': (b + 1) * width, 'count': c}
+            for b, c in sorted(counts.items())],
+    }
+
+def assert_matches_scan(conn):
+    product_stats = read_stats(conn)
+    expected = full_scan(conn, product_stats['bucket_width'])
+    for key, value in expected.items():
+        assert product_stats[key] == pytest.approx(value)
+
+def test_stats_after_inserts():
+    """
+    Test for the insert trigger.
+    Verify that the aggregates match a full scan.
+    """
+    conn = make_connection()
+    product_stats = read_stats(conn)
+    assert product_stats['count'] == 4
+    assert product_stats['avg'] == pytest.approx(16.625)
+    assert_matches_scan(conn)
+
+def test_stats_after_update_and_delete():
+    """
+    Test for the update and delete triggers.
+    Verify that removing the current extremes recomputes min and max.
+    """
+    conn = make_connection()
+    conn.execute('UPDATE products SET price = 2.0 WHERE name = ?', ('C',))
+    conn.execute('DELETE FROM products WHERE price = 2.0')
+    conn.execute('UPDATE products SET price = 7.5 WHERE name = ?', ('D',))
+    conn.execute('UPDATE products SET name = ? WHERE name = ?', ('E', 'B'))
+    conn.commit()
+    product_stats = read_stats(conn)
+    assert (product_stats['min'], product_stats['max']) == (5.0, 12.0)
+    assert_matches_scan(conn)
+
+def test_stats_empty_table():
+    """
+    Test for the statistics of an empty catalog.
+    """
+    conn = make_connection()
+    conn.execute('DELETE FROM products')
+    conn.commit()
+    product_stats = read_stats(conn)
+    assert product_stats['count'] == 0
+    assert product_stats['sum'] == 0.0
+    assert product_stats['avg'] is None
+    assert product_stats['histogram'] == []
+
+def test_rebuild_repairs_and_changes_width():
+    """
+    Test for install_stats used as a rebuild command.
+    Verify that corrupted aggregates are recomputed with the new width.
+    """
+    conn = make_connection()
+    conn.execute('UPDATE product_stats SET count = 99')
+    conn.execute('DELETE FROM product_price_histogram')
+    conn.commit()
+    install_stats(conn, bucket_width=5)
+    assert read_stats(conn)['bucket_width'] == 5
+    assert_matches_scan(conn)
+
+def test_read_stats_installs_on_first_use():
+    """
+    Test for read_stats on a database created without the aggregates.
+    """
+    conn = sqlite3.connect(':memory:')
+    conn.executescript(database.SCHEMA)
+    conn.execute(
+        "INSERT INTO products (name, price, description) "
+        "VALUES ('A', 3.0, 'a')")
+    conn.commit()
+    assert read_stats(conn)['count'] == 1
+    conn.execute(
+        "INSERT INTO products (name, price, description) "
+        "VALUES ('B', 4.0, 'b')")
+    assert read_stats(conn)['count'] == 2
@@ -1,3 +1,4 @@
+import pandas as pd
 import pytest
 from unittest.mock import patch, MagicMock
 from requests.exceptions import RequestException
@@ -68,6 +69,20 @@ def test_print_data_empty():
         mock_print.assert_called_once_with(
             'There are no products in database')
 
+def test_print_data_frame(capsys):
+    """
+    Test for printing a frame from get_products_frame.
+    Verify that the columns are shown in display order.
+    """
+    frame = pd.DataFrame(
+        {'name': ['Product A'], 'price': [20.0], 'description': ['Desc']},
+        index=pd.Index([1], name='id'))
+    print_data(frame)
+    header = capsys.readouterr().out.splitlines()[0].split()
+    assert header == ['name', 'description', 'price']
+    print_data(frame.iloc[0:0])
+    assert capsys.readouterr().out == 'There are no products in database\n'
+
 @patch('utilities.requests.get')
 def test_check_api_available_success(mock_get):
     """
@@ -173,23 +188,31 @@ def test_get_updated_product_info_invalid_id(mock_error, mock_input):
     mock_error.assert_called_once()
     assert result == False
     
-@patch('builtins.input', side_effect=['1',''])
+@patch('builtins.input', side_effect=['1', '', '', '12.5'])
+def test_get_updated_product_info_price_only(mock_input):
+    """
+    Test for getting updated product info when only the price is entered.
+    Verify that blank answers keep the current values.
+    """
+    result = get_updated_product_info()
+    assert result == {"product_id": 1, "price": 12.5}
+
+@patch('builtins.input', side_effect=['1', '', '', ''])
 @patch('utilities.log_error_to_file')
-def test_get_updated_product_info_invalid_name(mock_error, mock_input):
+def test_get_updated_product_info_nothing_to_update(mock_error, mock_input):
     """
-    Test for getting updated product info with valid input.
-    Mock input() to simulate user input for updating a product.
+    Test for getting updated product info with every field left blank.
+    Verify that the operation is canceled and logged.
     """
     result = get_updated_product_info()
     mock_error.assert_called_once()
     assert result == False
-    
-@patch('builtins.input', side_effect=['1','Product A', ''])
+
+@patch('builtins.input', side_effect=['1', 'Product A', '', 'cheap'])
 @patch('utilities.log_error_to_file')
-def test_get_updated_product_info_invalid_description(mock_error, mock_input):
+def test_get_updated_product_info_invalid_price(mock_error, mock_input):
     """
-    Test for getting updated product info with valid input.
-    Mock input() to simulate user input for updating a product.
+    Test for getting updated product info with a price that is not a number.
     """
     result = get_updated_product_info()
     mock_error.assert_called_once()